@@ -0,0 +1,468 @@
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import rsi_strategy as strategy
+from market_calendar import get_sessions
+from rsi import rsi_matrix, align_closes
+
+# Exit reasons, in the order rsi_strategy checks them
+TAKE_PROFIT, STOP_LOSS, OVERBOUGHT, SESSION_CLOSE, END_OF_DATA = range(5)
+EXIT_REASONS = ("take_profit", "stop_loss", "overbought", "session_close", "end_of_data")
+
+# Bars scanned per step when looking for a position's exit
+EXIT_SCAN_BLOCK = 256
+
+METRICS = ("trades", "win_rate", "avg_return_pct", "total_return_pct", "max_drawdown_pct")
+
+
+def default_params(asset_class: str = "stock") -> dict:
+    """
+    The live strategy's parameters, as accepted by ``simulate``.
+
+    Crypto has no overbought exit, and its take-profit and stop-loss come
+    from ``get_crypto_trade_window_and_params`` unless overridden.
+    """
+    if asset_class == "crypto":
+        return {
+            "rsi_length": strategy.CRYPTO_RSI_LENGTH,
+            "oversold": strategy.CRYPTO_RSI_BUY,
+            "overbought": None,
+            "take_profit_pct": None,
+            "stop_loss_pct": None,
+            "max_positions": strategy.CRYPTO_MAX_POSITIONS,
+            "trade_percentage": strategy.CRYPTO_TRADE_PERCENTAGE,
+        }
+    return {
+        "rsi_length": strategy.RSI_LENGTH,
+        "oversold": strategy.OVERSOLD,
+        "overbought": strategy.OVERBOUGHT,
+        "take_profit_pct": strategy.TAKE_PROFIT_PCT,
+        "stop_loss_pct": strategy.STOP_LOSS_PCT,
+        "max_positions": strategy.MAX_POSITIONS,
+        "trade_percentage": strategy.TRADE_PERCENTAGE,
+    }
+
+
+def _with_defaults(params: dict, asset_class: str = "stock") -> dict:
+    """
+    ``default_params(asset_class)`` overridden by params.
+
+    Raises:
+        ValueError: If params has a key ``default_params`` does not, e.g. a misspelt parameter.
+    """
+    defaults = default_params(asset_class)
+    unknown = sorted(set(params) - set(defaults))
+    if unknown:
+        raise ValueError(f"Unknown {asset_class} backtest parameters {unknown}; expected some of {sorted(defaults)}.")
+    return {**defaults, **params}
+
+
+def _last_valid_index(valid: np.ndarray) -> np.ndarray:
+    """Per cell, the column of the last True at or before it, -1 if none."""
+    last = np.where(valid, np.arange(valid.shape[1])[None, :], -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    return last
+
+
+def _take(values: np.ndarray, index: np.ndarray) -> np.ndarray:
+    out = np.take_along_axis(values, np.maximum(index, 0), axis=1)
+    out[index < 0] = np.nan
+    return out
+
+
+def rsi_now_prev(closes: np.ndarray, rsi_length: int):
+    """
+    The ``rsi_now``/``rsi_prev`` pair the live loop would see at every bar.
+
+    Between a symbol's bars the live loop keeps evaluating its last two RSI
+    values, so both are carried forward over missing bars.
+
+    Returns:
+        tuple: (rsi_now, rsi_prev) arrays shaped like closes.
+    """
+    rsi = rsi_matrix(closes, rsi_length)
+    last = _last_valid_index(~np.isnan(rsi))
+    before = np.full_like(last, -1)
+    before[:, 1:] = last[:, :-1]
+    prev = np.take_along_axis(before, np.maximum(last, 0), axis=1)
+    prev[last < 0] = -1
+    return _take(rsi, last), _take(rsi, prev)
+
+
+def _crypto_rules_table():
+    """get_crypto_rules for every minute of the week, Monday 00:00 first."""
+    monday = datetime(2024, 1, 1)
+    trading = np.zeros(7 * 24 * 60, dtype=bool)
+    stop_loss = np.full(trading.shape, np.nan)
+    take_profit = np.full(trading.shape, np.nan)
+    for minute in range(len(trading)):
+        trading[minute], stop_loss[minute], take_profit[minute] = strategy.get_crypto_rules(monday + timedelta(minutes=minute))
+    return trading, stop_loss, take_profit
+
+
+def bar_sessions(timestamps) -> list:
+    """The market calendar's sessions over the bars' Eastern dates, see ``market_calendar.get_sessions``."""
+    eastern = pd.DatetimeIndex(pd.to_datetime(np.asarray(timestamps), utc=True)).tz_convert("US/Eastern")
+    if not len(eastern):
+        return []
+    return get_sessions(eastern[0].date(), eastern[-1].date())
+
+
+def prepare(closes, timestamps, asset_class: str = "stock", sessions: list = None) -> dict:
+    """
+    Precomputes everything about the bars that does not depend on parameters.
+
+    Args:
+        closes (array-like): Close prices shaped (symbols, bars), NaN where a bar is missing.
+        timestamps (array-like): Bar timestamps (UTC), one per column.
+        asset_class (str): "stock" for the market-hours rules, "crypto" for the crypto windows.
+        sessions (list): Stock sessions covering the bars, defaults to ``bar_sessions(timestamps)``.
+    Returns:
+        dict: Arrays used by ``simulate``.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    eastern = pd.DatetimeIndex(pd.to_datetime(np.asarray(timestamps), utc=True)).tz_convert("US/Eastern")
+    minute_of_day = eastern.hour.to_numpy() * 60 + eastern.minute.to_numpy()
+    weekday = eastern.weekday.to_numpy()
+
+    data = {
+        "asset_class": asset_class,
+        "closes": closes,
+        # The live loop prices with the latest quote; between bars that is the last close
+        "price": _take(closes, _last_valid_index(~np.isnan(closes))),
+    }
+    if asset_class == "crypto":
+        # Entries only inside the windows; held positions keep their exits around the clock
+        trading, stop_loss, take_profit = _crypto_rules_table()
+        minute_of_week = weekday * 24 * 60 + minute_of_day
+        data["tradable"] = trading[minute_of_week]
+        data["exits"] = np.ones(len(minute_of_day), dtype=bool)
+        data["stop_loss_pct"] = stop_loss[minute_of_week]
+        data["take_profit_pct"] = take_profit[minute_of_week]
+        data["session_close"] = np.zeros(len(minute_of_day), dtype=bool)
+    else:
+        # is_market_open: each session's Session.start to Session.end, holidays and half days
+        # included; close_all_positions on the first bar of the day at or after Session.end
+        sessions = bar_sessions(timestamps) if sessions is None else sessions
+        ns = eastern.as_unit("ns").asi8
+        tradable = np.zeros(len(ns), dtype=bool)
+        session_close = np.zeros(len(ns), dtype=bool)
+        if sessions:
+            starts = np.array([pd.Timestamp(session.start).value for session in sessions], dtype=np.int64)
+            ends = np.array([pd.Timestamp(session.end).value for session in sessions], dtype=np.int64)
+            current = np.searchsorted(starts, ns, side="right") - 1
+            tradable = (current >= 0) & (ns < ends[np.maximum(current, 0)])
+            for session, close_bar in zip(sessions, np.searchsorted(ns, ends).tolist()):
+                if close_bar < len(ns) and eastern[close_bar].date() == session.date:
+                    session_close[close_bar] = True
+        data["tradable"] = tradable
+        data["exits"] = tradable
+        data["session_close"] = session_close
+    return data
+
+
+def _find_exit(data: dict, rsi_now: np.ndarray, params: dict, symbol: int, entry: int, entry_price: float):
+    """
+    First bar after ``entry`` where the live rules would close the position.
+
+    Returns:
+        tuple: (bar index, exit reason).
+    """
+    price = data["price"][symbol]
+    exits = data["exits"]
+    session_close = data["session_close"]
+    take_profit_pct = params["take_profit_pct"] if params["take_profit_pct"] is not None else data["take_profit_pct"]
+    stop_loss_pct = params["stop_loss_pct"] if params["stop_loss_pct"] is not None else data["stop_loss_pct"]
+    overbought = params["overbought"]
+    n_bars = len(price)
+
+    start = entry + 1
+    while start < n_bars:
+        stop = min(start + EXIT_SCAN_BLOCK, n_bars)
+        window = slice(start, stop)
+        change_pct = (price[window] - entry_price) / entry_price * 100
+        take_profit = change_pct >= (take_profit_pct[window] if np.ndim(take_profit_pct) else take_profit_pct)
+        stop_loss = change_pct <= -(stop_loss_pct[window] if np.ndim(stop_loss_pct) else stop_loss_pct)
+        over = rsi_now[symbol, window] >= overbought if overbought is not None else False
+        hit = (exits[window] & (take_profit | stop_loss | over)) | session_close[window]
+        if hit.any():
+            i = int(np.argmax(hit))
+            bar = start + i
+            if session_close[bar] and not exits[bar]:
+                return bar, SESSION_CLOSE
+            if take_profit[i]:
+                return bar, TAKE_PROFIT
+            if stop_loss[i]:
+                return bar, STOP_LOSS
+            return bar, OVERBOUGHT
+        start = stop
+    return n_bars - 1, END_OF_DATA
+
+
+def simulate(data: dict, rsi_now: np.ndarray, rsi_prev: np.ndarray, params: dict) -> dict:
+    """
+    Replays the strategy rules over prepared bars.
+
+    Entry candidates (an RSI cross up through ``oversold`` inside the trading
+    window) are found for all symbols at once; they are then walked in time
+    order to apply the position cap, and each accepted entry's exit is found
+    with a vectorized forward scan. Exits on a bar free their slot before that
+    bar's entries, and a symbol is not re-entered on the bar it exits.
+
+    Args:
+        data (dict): Output of ``prepare``.
+        rsi_now (numpy.ndarray): From ``rsi_now_prev`` with ``params["rsi_length"]``.
+        rsi_prev (numpy.ndarray): From ``rsi_now_prev`` with ``params["rsi_length"]``.
+        params (dict): Strategy parameters, see ``default_params``.
+    Returns:
+        dict: Trade arrays: symbol, entry, exit (bar indices), entry_price,
+            exit_price, return_pct and reason.
+    """
+    price = data["price"]
+    oversold = params["oversold"]
+    with np.errstate(invalid="ignore"):
+        signal = (rsi_prev < oversold) & (rsi_now >= oversold) & data["tradable"][None, :] & ~np.isnan(price)
+    bars, symbols = np.nonzero(signal.T)
+
+    max_positions = params["max_positions"]
+    holding_until = np.full(price.shape[0], -1)
+    trades = []
+    for bar, symbol in zip(bars.tolist(), symbols.tolist()):
+        if holding_until[symbol] >= bar or np.count_nonzero(holding_until > bar) >= max_positions:
+            continue
+        entry_price = price[symbol, bar]
+        exit_bar, reason = _find_exit(data, rsi_now, params, symbol, bar, entry_price)
+        holding_until[symbol] = exit_bar if reason != END_OF_DATA else len(data["tradable"])
+        trades.append((symbol, bar, exit_bar, entry_price, price[symbol, exit_bar], reason))
+
+    columns = list(zip(*trades)) if trades else [()] * 6
+    result = {
+        "symbol": np.array(columns[0], dtype=np.int64),
+        "entry": np.array(columns[1], dtype=np.int64),
+        "exit": np.array(columns[2], dtype=np.int64),
+        "entry_price": np.array(columns[3], dtype=np.float64),
+        "exit_price": np.array(columns[4], dtype=np.float64),
+        "reason": np.array(columns[5], dtype=np.int8),
+    }
+    result["return_pct"] = (result["exit_price"] - result["entry_price"]) / result["entry_price"] * 100
+    return result
+
+
+def summarize(trades: dict, trade_percentage: float) -> dict:
+    """
+    Headline metrics for a set of trades.
+
+    Each trade moves the portfolio by ``trade_percentage`` times its return,
+    booked at its exit bar.
+    """
+    returns = trades["return_pct"]
+    if len(returns) == 0:
+        return {"trades": 0, "win_rate": np.nan, "avg_return_pct": np.nan, "total_return_pct": 0.0, "max_drawdown_pct": 0.0}
+    pnl = returns[np.argsort(trades["exit"], kind="stable")] * trade_percentage
+    equity = np.cumsum(pnl)
+    drawdown = np.maximum.accumulate(np.maximum(equity, 0.0)) - equity
+    return {
+        "trades": len(returns),
+        "win_rate": float(np.mean(returns > 0)),
+        "avg_return_pct": float(returns.mean()),
+        "total_return_pct": float(equity[-1]),
+        "max_drawdown_pct": float(drawdown.max()),
+    }
+
+
+def backtest(closes, timestamps, symbols=None, asset_class: str = "stock", **params):
+    """
+    Runs one backtest of the live rules.
+
+    Args:
+        closes (array-like): Close prices shaped (symbols, bars), NaN where a bar is missing.
+        timestamps (array-like): Bar timestamps (UTC), one per column.
+        symbols (list): Symbol names for the trade list, defaults to row numbers.
+        asset_class (str): "stock" or "crypto".
+        **params: Overrides for ``default_params(asset_class)``.
+    Returns:
+        tuple: (metrics dict, trades DataFrame).
+    Raises:
+        ValueError: For a parameter ``default_params`` does not have.
+    """
+    params = _with_defaults(params, asset_class)
+    data = prepare(closes, timestamps, asset_class)
+    trades = simulate(data, *rsi_now_prev(data["closes"], params["rsi_length"]), params)
+
+    timestamps = pd.to_datetime(np.asarray(timestamps), utc=True)
+    names = np.asarray(symbols if symbols is not None else range(data["closes"].shape[0]), dtype=object)
+    frame = pd.DataFrame({
+        "symbol": names[trades["symbol"]],
+        "entry_time": timestamps[trades["entry"]],
+        "exit_time": timestamps[trades["exit"]],
+        "entry_price": trades["entry_price"],
+        "exit_price": trades["exit_price"],
+        "return_pct": trades["return_pct"],
+        "reason": np.asarray(EXIT_REASONS, dtype=object)[trades["reason"]],
+    })
+    return summarize(trades, params["trade_percentage"]), frame
+
+
+def grid(**axes) -> list:
+    """
+    Every combination of the given parameter values.
+
+    Example:
+        grid(rsi_length=[7, 14], oversold=[20, 25, 30])
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def random_search(n: int, seed: int = 0, **ranges) -> list:
+    """
+    n random parameter combinations.
+
+    Each range is either a list to choose from or a (low, high) tuple sampled
+    uniformly, as integers when both ends are integers.
+    """
+    rng = random.Random(seed)
+    combos = []
+    for _ in range(n):
+        combo = {}
+        for name, values in ranges.items():
+            if isinstance(values, tuple):
+                low, high = values
+                combo[name] = rng.randint(low, high) if isinstance(low, int) and isinstance(high, int) else rng.uniform(low, high)
+            else:
+                combo[name] = rng.choice(values)
+        combos.append(combo)
+    return combos
+
+
+# Per-worker views of the shared bar arrays, set by _init_worker
+_worker = {}
+
+
+def _init_worker(closes_name: str, closes_shape: tuple, timestamps_name: str, n_bars: int, asset_class: str,
+                 sessions: list):
+    closes_shm = shared_memory.SharedMemory(name=closes_name)
+    timestamps_shm = shared_memory.SharedMemory(name=timestamps_name)
+    closes = np.ndarray(closes_shape, dtype=np.float64, buffer=closes_shm.buf)
+    timestamps = np.ndarray((n_bars,), dtype=np.int64, buffer=timestamps_shm.buf)
+    _worker["shm"] = (closes_shm, timestamps_shm)
+    _worker["data"] = prepare(closes, timestamps, asset_class, sessions)
+    _rsi_for_length.cache_clear()
+
+
+@lru_cache(maxsize=2)
+def _rsi_for_length(rsi_length: int):
+    return rsi_now_prev(_worker["data"]["closes"], rsi_length)
+
+
+def _run_combo(params: dict) -> dict:
+    rsi_now, rsi_prev = _rsi_for_length(params["rsi_length"])
+    return summarize(simulate(_worker["data"], rsi_now, rsi_prev, params), params["trade_percentage"])
+
+
+def sweep(closes, timestamps, combos, asset_class: str = "stock", processes: int = None) -> pd.DataFrame:
+    """
+    Backtests many parameter combinations across a process pool.
+
+    The bars are copied once into shared memory that every worker maps, and
+    combinations are grouped by RSI length so each worker computes each RSI
+    matrix once per run of combinations.
+
+    Args:
+        closes (array-like): Close prices shaped (symbols, bars), NaN where a bar is missing.
+        timestamps (array-like): Bar timestamps (UTC), one per column.
+        combos (list): Parameter dicts from ``grid``/``random_search``; missing
+            keys take ``default_params(asset_class)``.
+        asset_class (str): "stock" or "crypto".
+        processes (int): Worker processes, defaults to the CPU count.
+    Returns:
+        pandas.DataFrame: One row per combination with its parameters and
+            metrics, best total return first.
+    Raises:
+        ValueError: For a parameter ``default_params`` does not have.
+    """
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    timestamps = pd.DatetimeIndex(pd.to_datetime(np.asarray(timestamps), utc=True)).as_unit("ns").asi8
+    combos = sorted((_with_defaults(combo, asset_class) for combo in combos), key=lambda combo: combo["rsi_length"])
+    # Fetched once here rather than by every worker
+    sessions = bar_sessions(timestamps) if asset_class == "stock" else None
+    processes = processes or os.cpu_count()
+
+    closes_shm = shared_memory.SharedMemory(create=True, size=max(closes.nbytes, 1))
+    timestamps_shm = shared_memory.SharedMemory(create=True, size=max(timestamps.nbytes, 1))
+    try:
+        np.ndarray(closes.shape, dtype=np.float64, buffer=closes_shm.buf)[:] = closes
+        np.ndarray(timestamps.shape, dtype=np.int64, buffer=timestamps_shm.buf)[:] = timestamps
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(closes_shm.name, closes.shape, timestamps_shm.name, len(timestamps), asset_class, sessions),
+        ) as pool:
+            chunksize = max(1, len(combos) // (processes * 4))
+            results = list(pool.map(_run_combo, combos, chunksize=chunksize))
+    finally:
+        closes_shm.close()
+        closes_shm.unlink()
+        timestamps_shm.close()
+        timestamps_shm.unlink()
+
+    frame = pd.DataFrame([{**combo, **result} for combo, result in zip(combos, results)])
+    return frame.sort_values("total_return_pct", ascending=False, ignore_index=True)
+
+
+def load_closes(symbols, start: datetime, end: datetime):
+    """Loads minute closes from the bar store, fetching what is missing."""
+    from barstore import get_bars_multi
+    return align_closes(get_bars_multi(symbols, start, end))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest and sweep the RSI strategy rules on minute bars")
+    parser.add_argument("command", choices=("run", "sweep"))
+    parser.add_argument("--crypto", action="store_true", help="Use CRYPTO_TICKERS and the crypto rules")
+    parser.add_argument("--symbols", nargs="+", help="Symbols to test (default: the strategy's tickers)")
+    parser.add_argument("--start", required=True, help="Start date, YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="End date, YYYY-MM-DD (default: now)")
+    parser.add_argument("--random", type=int, default=0, help="Random combinations to try instead of the grid")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20, help="Sweep rows to print")
+    args = parser.parse_args()
+
+    asset_class = "crypto" if args.crypto else "stock"
+    symbols = args.symbols or (strategy.CRYPTO_TICKERS if args.crypto else strategy.TICKERS)
+    start = datetime.strptime(args.start, "%Y-%m-%d")
+    end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else datetime.utcnow()
+    symbols, timestamps, closes = load_closes(symbols, start, end)
+    print(f"{len(symbols)} symbols x {len(timestamps)} bars")
+
+    if args.command == "run":
+        metrics, trades = backtest(closes, timestamps, symbols, asset_class)
+        print(trades.to_string())
+        print(metrics)
+    else:
+        axes = {
+            "rsi_length": [7, 10, 14, 21],
+            "oversold": [10, 15, 20, 25, 30],
+            "overbought": [70, 75, 80, 85] if asset_class == "stock" else [None],
+            "take_profit_pct": [0.5, 1.0, 1.5, 2.0, 3.0],
+            "stop_loss_pct": [1.0, 1.5, 2.5, 4.0],
+        }
+        if args.random:
+            ranges = {"rsi_length": (5, 30), "oversold": (5.0, 35.0), "take_profit_pct": (0.25, 5.0), "stop_loss_pct": (0.25, 5.0)}
+            if asset_class == "stock":
+                ranges["overbought"] = (60.0, 95.0)
+            combos = random_search(args.random, **ranges)
+        else:
+            combos = grid(**axes)
+        started = time.perf_counter()
+        results = sweep(closes, timestamps, combos, asset_class, args.processes)
+        print(results.head(args.top).to_string())
+        print(f"{len(combos)} combinations in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,312 @@
+import argparse
+import os
+import threading
+import numpy as np
+import pandas as pd
+from alpaca.data.timeframe import TimeFrame
+from config import get_bar_store_dir
+from marketdata import get_historical_bars
+from datetime import datetime, timedelta
+
+# One raw little-endian file per column, appended in timestamp order.
+# Timestamps are UTC nanoseconds since the epoch.
+COLUMNS = (
+    ("timestamp", np.dtype("<i8")),
+    ("open", np.dtype("<f8")),
+    ("high", np.dtype("<f8")),
+    ("low", np.dtype("<f8")),
+    ("close", np.dtype("<f8")),
+    ("volume", np.dtype("<f8")),
+    ("trade_count", np.dtype("<f8")),
+    ("vwap", np.dtype("<f8")),
+)
+
+
+def _utc(ts) -> pd.Timestamp:
+    """Converts a datetime to a UTC timestamp, treating naive values as UTC."""
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _to_ns(index) -> np.ndarray:
+    """Converts a timestamp index to UTC nanoseconds."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    return index.tz_convert("UTC").as_unit("ns").asi8
+
+
+class BarStore:
+    """
+    Persistent columnar bar store keyed by symbol, timeframe and timestamp.
+
+    Each (symbol, timeframe) pair is a directory holding one memory-mappable
+    file per column, so reads are zero-copy slices and writes only append the
+    bars newer than the last stored timestamp. A bar with the same timestamp as
+    the last stored one overwrites it in place.
+
+    Args:
+        root (str): Store directory. Defaults to ``config.get_bar_store_dir()``.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or get_bar_store_dir()
+        self._lock = threading.Lock()
+
+    def _path(self, symbol: str, timeframe: TimeFrame) -> str:
+        return os.path.join(self.root, str(timeframe), symbol.replace("/", "_"))
+
+    def _length(self, path: str) -> int:
+        """Number of complete rows, repairing columns left uneven by a crash."""
+        sizes = []
+        for name, dtype in COLUMNS:
+            file = os.path.join(path, name)
+            size = os.path.getsize(file) if os.path.exists(file) else 0
+            sizes.append((file, size, dtype.itemsize))
+        n = min(size // itemsize for _, size, itemsize in sizes)
+        for file, size, itemsize in sizes:
+            if size != n * itemsize:
+                with open(file, "ab") as f:
+                    f.truncate(n * itemsize)
+        return n
+
+    def read_arrays(self, symbol: str, timeframe: TimeFrame = TimeFrame.Minute, start=None, end=None) -> dict:
+        """
+        Reads stored bars as read-only memory-mapped column arrays.
+
+        Args:
+            symbol (str): The symbol.
+            timeframe (TimeFrame): The bar timeframe.
+            start: Optional inclusive start timestamp.
+            end: Optional inclusive end timestamp.
+        Returns:
+            dict: Column name to NumPy array; empty arrays when nothing is stored.
+        """
+        path = self._path(symbol, timeframe)
+        with self._lock:
+            n = self._length(path) if os.path.isdir(path) else 0
+        if n == 0:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS}
+
+        arrays = {
+            name: np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(n,))
+            for name, dtype in COLUMNS
+        }
+        ts = arrays["timestamp"]
+        lo = 0 if start is None else int(np.searchsorted(ts, _to_ns([start])[0], side="left"))
+        hi = n if end is None else int(np.searchsorted(ts, _to_ns([end])[0], side="right"))
+        return {name: column[lo:hi] for name, column in arrays.items()}
+
+    def read(self, symbol: str, timeframe: TimeFrame = TimeFrame.Minute, start=None, end=None):
+        """
+        Reads stored bars as a DataFrame indexed by UTC timestamp.
+
+        Returns:
+            pandas.DataFrame: The bars, shaped like one symbol of ``BarSet.df``.
+        """
+        arrays = self.read_arrays(symbol, timeframe, start, end)
+        index = pd.to_datetime(np.asarray(arrays.pop("timestamp")), unit="ns", utc=True)
+        return pd.DataFrame({name: np.asarray(col) for name, col in arrays.items()},
+                            index=pd.DatetimeIndex(index, name="timestamp"))
+
+    def last_timestamp(self, symbol: str, timeframe: TimeFrame = TimeFrame.Minute):
+        """
+        Returns:
+            pandas.Timestamp | None: The newest stored bar time, or None if empty.
+        """
+        ts = self.read_arrays(symbol, timeframe)["timestamp"]
+        return pd.Timestamp(int(ts[-1]), unit="ns", tz="UTC") if len(ts) else None
+
+    def write(self, symbol: str, bars, timeframe: TimeFrame = TimeFrame.Minute) -> int:
+        """
+        Merges bars into the store.
+
+        Bars older than the last stored timestamp are ignored, a bar at the last
+        stored timestamp replaces it and newer bars are appended.
+
+        Args:
+            symbol (str): The symbol.
+            bars (pandas.DataFrame): Bars indexed by timestamp.
+            timeframe (TimeFrame): The bar timeframe.
+        Returns:
+            int: Number of rows written.
+        """
+        if bars is None or bars.empty:
+            return 0
+        ts = _to_ns(bars.index)
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+        # Keep the last copy of any duplicated timestamp
+        keep = np.append(ts[1:] != ts[:-1], True)
+        order, ts = order[keep], ts[keep]
+
+        path = self._path(symbol, timeframe)
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            n = self._length(path)
+            last = None
+            if n:
+                with open(os.path.join(path, "timestamp"), "rb") as f:
+                    f.seek((n - 1) * 8)
+                    last = int(np.frombuffer(f.read(8), dtype="<i8")[0])
+
+            replace = last is not None and bool((ts == last).any())
+            new = ts > last if last is not None else np.ones(len(ts), dtype=bool)
+            if not replace and not new.any():
+                return 0
+
+            for name, dtype in COLUMNS:
+                if name == "timestamp":
+                    values = ts
+                elif name in bars.columns:
+                    values = bars[name].to_numpy(dtype=dtype)[order]
+                else:
+                    values = np.full(len(ts), np.nan, dtype=dtype)
+                with open(os.path.join(path, name), "r+b" if n else "ab") as f:
+                    if replace:
+                        f.seek((n - 1) * dtype.itemsize)
+                        f.write(values[ts == last].astype(dtype).tobytes())
+                    f.seek(0, os.SEEK_END)
+                    f.write(values[new].astype(dtype).tobytes())
+            return int(new.sum()) + int(replace)
+
+
+_default_store = None
+
+
+def get_store() -> BarStore:
+    """Returns the process-wide default bar store."""
+    global _default_store
+    if _default_store is None:
+        _default_store = BarStore()
+    return _default_store
+
+
+def fetch_bars_multi(symbols, start: datetime, end: datetime, timeframe: TimeFrame = TimeFrame.Minute) -> dict:
+    """
+    Fetches bars for many stocks and crypto pairs from Alpaca in as few requests as possible.
+
+    See ``marketdata.get_historical_bars``.
+
+    Returns:
+        dict: Symbol to its bars indexed by timestamp. Symbols without bars are absent.
+    """
+    return get_historical_bars(symbols, start, end, timeframe)
+
+
+def fetch_bars(symbol: str, start: datetime, end: datetime, timeframe: TimeFrame = TimeFrame.Minute):
+    """
+    Fetches bars for a single symbol from Alpaca, indexed by timestamp.
+
+    Returns:
+        pandas.DataFrame | None: The symbol's bars, or None when nothing came back.
+    """
+    return fetch_bars_multi([symbol], start, end, timeframe).get(symbol)
+
+
+def get_bars_multi(symbols, start: datetime, end: datetime = None, timeframe: TimeFrame = TimeFrame.Minute, store: BarStore = None) -> dict:
+    """
+    Returns bars for many symbols from the local store, fetching only what is missing.
+
+    Symbols with nothing stored are filled with the whole requested range in
+    one batched fetch. The others share one batched fetch starting at the
+    oldest of their last stored timestamps, re-requesting each last bar so a
+    revised in-progress bar replaces the stored copy. History before the first
+    stored bar is loaded with the ``backfill`` command.
+
+    Args:
+        symbols (list): Stock symbols and crypto pairs.
+        start (datetime): Inclusive start of the range (naive means UTC).
+        end (datetime): Inclusive end of the range, defaults to now.
+        timeframe (TimeFrame): The bar timeframe.
+        store (BarStore): The store to use, defaults to ``get_store()``.
+    Returns:
+        dict: Symbol to its bars in range, or None if there are none.
+    """
+    store = store or get_store()
+    end = end or datetime.utcnow()
+    lasts = {symbol: store.last_timestamp(symbol, timeframe) for symbol in symbols}
+
+    empty = [symbol for symbol, last in lasts.items() if last is None]
+    stored = [symbol for symbol, last in lasts.items() if last is not None]
+    fetched = fetch_bars_multi(empty, start, end, timeframe) if empty else {}
+    if stored:
+        fetch_start = max(min(lasts[symbol] for symbol in stored), _utc(start))
+        fetched.update(fetch_bars_multi(stored, fetch_start, end, timeframe))
+    for symbol, bars in fetched.items():
+        store.write(symbol, bars, timeframe)
+
+    result = {}
+    for symbol in symbols:
+        bars = store.read(symbol, timeframe, start, end)
+        result[symbol] = bars if not bars.empty else None
+    return result
+
+
+def get_bars(symbol: str, start: datetime, end: datetime = None, timeframe: TimeFrame = TimeFrame.Minute, store: BarStore = None):
+    """
+    Returns bars for a symbol from the local store, fetching only what is missing.
+
+    See ``get_bars_multi``.
+
+    Returns:
+        pandas.DataFrame | None: The bars in range, or None if there are none.
+    """
+    return get_bars_multi([symbol], start, end, timeframe, store)[symbol]
+
+
+def backfill(symbols, start: datetime, end: datetime, timeframe: TimeFrame = TimeFrame.Minute, chunk_days: int = 5, store: BarStore = None):
+    """
+    Loads a universe's history into the store, chunk by chunk.
+
+    Each chunk is written before the next is requested, and every symbol
+    resumes from its last stored timestamp, so an interrupted backfill can be
+    re-run with the same arguments to pick up where it stopped.
+
+    Args:
+        symbols (list): The symbols to load.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        timeframe (TimeFrame): The bar timeframe.
+        chunk_days (int): Days of bars per request.
+        store (BarStore): The store to use, defaults to ``get_store()``.
+    """
+    store = store or get_store()
+    for symbol in symbols:
+        last = store.last_timestamp(symbol, timeframe)
+        chunk_start = _utc(start) if last is None else max(last, _utc(start))
+        written = 0
+        while chunk_start < _utc(end):
+            chunk_end = min(chunk_start + timedelta(days=chunk_days), _utc(end))
+            try:
+                written += store.write(symbol, fetch_bars(symbol, chunk_start, chunk_end, timeframe), timeframe)
+            except Exception as e:
+                print(f"[ERROR] Backfill failed for {symbol} at {chunk_start}: {e}")
+                break
+            chunk_start = chunk_end
+        print(f"{symbol}: {written} bars written")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local bar store tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help="Load a universe's minute bars by date range")
+    backfill_parser.add_argument("symbols", nargs="+", help="Symbols to load, or @file with one symbol per line")
+    backfill_parser.add_argument("--start", required=True, help="Start date, YYYY-MM-DD")
+    backfill_parser.add_argument("--end", default=None, help="End date, YYYY-MM-DD (default: now)")
+    backfill_parser.add_argument("--chunk-days", type=int, default=5)
+    args = parser.parse_args()
+
+    symbols = []
+    for arg in args.symbols:
+        if arg.startswith("@"):
+            with open(arg[1:]) as f:
+                symbols.extend(line.strip() for line in f if line.strip())
+        else:
+            symbols.append(arg)
+    backfill(
+        symbols,
+        datetime.strptime(args.start, "%Y-%m-%d"),
+        datetime.strptime(args.end, "%Y-%m-%d") if args.end else datetime.utcnow(),
+        chunk_days=args.chunk_days,
+    )
@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pytz
+from fake_broker import FakeBroker
+
+BENCHMARKS = ("stock_pass", "crypto_pass", "get_rsi", "get_latest_price", "orders", "bracket_exit")
+RESULTS_DIR = "bench_results"
+
+
+def start_broker(latency: float, jitter: float) -> FakeBroker:
+    """
+    Starts a FakeBroker and points config, the clients and the bar store at it.
+
+    Must run before the strategy modules make their first request.
+    """
+    broker = FakeBroker(latency=latency, jitter=jitter)
+    broker.start()
+    os.environ.update(broker.env())
+    os.environ["ALPACA_BAR_STORE_DIR"] = tempfile.mkdtemp(prefix="bench-bars-")
+    os.environ.setdefault("ALPACA_API_KEY", "bench")
+    os.environ.setdefault("ALPACA_API_SECRET", "bench")
+    # The fake broker has no rate limit; keep the scheduler from throttling the loop
+    os.environ.setdefault("ALPACA_RATE_LIMIT", "1000000")
+    os.environ.setdefault("ALPACA_RATE_BURST", "1000000")
+
+    import barstore
+    from clients import reset_clients
+    from scheduler import reset_scheduler
+    reset_scheduler()
+    reset_clients()
+    barstore._default_store = None
+    return broker
+
+
+def reset_account(broker: FakeBroker):
+    """Flattens the fake account and brings the bot's ledger and account cache in line with it."""
+    from ledger import get_ledger
+    from percentage import invalidate_account
+    broker.reset_account()
+    get_ledger().reconcile()
+    invalidate_account()
+
+
+def make_benchmarks() -> dict:
+    """The benchmarked calls, each taking the iteration number."""
+    import rsi_strategy as strategy
+    from marketdata import get_latest_price
+    from rsi import get_rsi
+    from trades import percent_market_buy, market_sell, exit_order_ids
+    from ledger import Position
+
+    eastern = pytz.timezone("US/Eastern")
+    # A Saturday, inside the crypto weekend window
+    crypto_now = eastern.localize(datetime(2024, 1, 6, 12, 0))
+    stock_symbols = strategy.TICKERS
+
+    def bracket_exit(i):
+        # Bracket entry, then a sell that has to wait out the asynchronous cancel of its exits
+        symbol = stock_symbols[i % len(stock_symbols)]
+        order = percent_market_buy(symbol, 0.01, take_profit_pct=strategy.TAKE_PROFIT_PCT,
+                                   stop_loss_pct=strategy.STOP_LOSS_PCT)
+        position = Position(symbol, float(order.filled_qty or order.qty))
+        position.exit_orders = exit_order_ids(order)
+        strategy.sell_position(symbol, position)
+
+    return {
+        "stock_pass": lambda i: strategy.run_stock_pass(datetime.now(eastern)),
+        "crypto_pass": lambda i: strategy.run_crypto_pass(crypto_now),
+        "get_rsi": lambda i: get_rsi(stock_symbols[i % len(stock_symbols)]),
+        "get_latest_price": lambda i: get_latest_price(stock_symbols[i % len(stock_symbols)]),
+        "orders": lambda i: (percent_market_buy(stock_symbols[i % len(stock_symbols)], 0.01),
+                             market_sell(stock_symbols[i % len(stock_symbols)])),
+        "bracket_exit": bracket_exit,
+    }
+
+
+def run_benchmark(fn, broker: FakeBroker, iterations: int, warmup: int, alloc_iterations: int) -> dict:
+    """
+    Times one benchmark and counts its requests and allocations per iteration.
+
+    Allocations are measured in a separate, shorter pass since tracemalloc
+    slows everything down.
+    """
+    # The strategy logs every symbol; keep that off the results table
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _run_benchmark(fn, broker, iterations, warmup, alloc_iterations)
+
+
+def _run_benchmark(fn, broker: FakeBroker, iterations: int, warmup: int, alloc_iterations: int) -> dict:
+    for i in range(warmup):
+        fn(i)
+
+    times = np.empty(iterations)
+    requests = np.empty(iterations)
+    for i in range(iterations):
+        before = broker.request_count
+        start = time.perf_counter()
+        fn(i)
+        times[i] = time.perf_counter() - start
+        requests[i] = broker.request_count - before
+
+    alloc_peak = np.empty(alloc_iterations)
+    alloc_net = np.empty(alloc_iterations)
+    tracemalloc.start()
+    for i in range(alloc_iterations):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        fn(i)
+        after, peak = tracemalloc.get_traced_memory()
+        alloc_peak[i] = peak - current
+        alloc_net[i] = after - current
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p99_ms": float(np.percentile(times, 99) * 1000),
+        "max_ms": float(times.max() * 1000),
+        "mean_ms": float(times.mean() * 1000),
+        "requests_per_iteration": float(requests.mean()),
+        "alloc_peak_kb": float(alloc_peak.mean() / 1024) if alloc_iterations else None,
+        "alloc_net_kb": float(alloc_net.mean() / 1024) if alloc_iterations else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(results: dict, baseline: dict):
+    """Prints each timing and request count against a saved run."""
+    print(f"\nvs {baseline['commit']} ({baseline['created']}):")
+    for name, result in results["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if old is None:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p99_ms", "requests_per_iteration"):
+            if old[metric]:
+                changes.append(f"{metric} {result[metric] / old[metric]:.2f}x")
+        print(f"{name:>18}  " + "  ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trading loop benchmark against a local fake broker")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help=f"Any of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--alloc-iterations", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency added to every REST response")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Extra random latency of up to this much")
+    parser.add_argument("--output", default=None, help=f"Results file (default: {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    broker = start_broker(args.latency_ms / 1000, args.jitter_ms / 1000)
+    benchmarks = make_benchmarks()
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "config": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                   "iterations": args.iterations, "warmup": args.warmup},
+        "benchmarks": {},
+    }
+
+    print(f"{'benchmark':>18} {'p50':>9} {'p99':>9} {'max':>9} {'req/iter':>9} {'alloc peak':>11}")
+    for name in args.benchmarks:
+        # Each benchmark starts from a fresh account, whatever the previous one bought
+        reset_account(broker)
+        result = run_benchmark(benchmarks[name], broker, args.iterations, args.warmup, args.alloc_iterations)
+        results["benchmarks"][name] = result
+        print(f"{name:>18} {result['p50_ms']:>7.1f}ms {result['p99_ms']:>7.1f}ms {result['max_ms']:>7.1f}ms "
+              f"{result['requests_per_iteration']:>9.1f} {result['alloc_peak_kb'] or 0:>9.0f}KB")
+    broker.stop()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
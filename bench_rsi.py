@@ -0,0 +1,78 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from ta.momentum import RSIIndicator
+from rsi import rsi_matrix
+
+# 10 trading days of minute bars, the window get_rsi works on
+BARS = 3900
+UNIVERSES = (12, 500, 5000)
+
+
+def make_closes(n_symbols: int, n_bars: int, missing: float = 0.05, seed: int = 0) -> np.ndarray:
+    """
+    Builds random-walk closes shaped (symbols, bars) with a share of bars missing.
+    """
+    rng = np.random.default_rng(seed)
+    closes = 100 + np.cumsum(rng.normal(0, 0.3, (n_symbols, n_bars)), axis=1)
+    closes[rng.random((n_symbols, n_bars)) < missing] = np.nan
+    return closes
+
+
+def ta_rsi(closes: np.ndarray, period: int) -> list:
+    """Per-symbol RSIIndicator over each symbol's present bars, as get_rsi does it."""
+    return [
+        RSIIndicator(pd.Series(row[~np.isnan(row)]), window=period).rsi().to_numpy()
+        for row in closes
+    ]
+
+
+def check_parity(closes: np.ndarray, period: int, tolerance: float = 1e-9) -> float:
+    """
+    Asserts rsi_matrix matches RSIIndicator on every symbol.
+
+    Returns:
+        float: The largest absolute difference seen.
+    """
+    kernel = rsi_matrix(closes, period)
+    worst = 0.0
+    for row, expected in zip(range(len(closes)), ta_rsi(closes, period)):
+        got = kernel[row][~np.isnan(closes[row])]
+        assert np.array_equal(np.isnan(got), np.isnan(expected)), f"warm-up mismatch for row {row}"
+        if (~np.isnan(expected)).any():
+            worst = max(worst, float(np.nanmax(np.abs(got - expected))))
+    assert worst <= tolerance, f"RSI mismatch {worst} > {tolerance}"
+    return worst
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="rsi_matrix parity check and benchmark")
+    parser.add_argument("--period", type=int, default=14)
+    parser.add_argument("--bars", type=int, default=BARS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ta-max-symbols", type=int, default=500,
+                        help="Largest universe to time the per-symbol ta path on")
+    args = parser.parse_args()
+
+    worst = check_parity(make_closes(50, args.bars, seed=1), args.period)
+    print(f"Parity with RSIIndicator: max abs diff {worst:.2e}")
+
+    print(f"{'symbols':>8} {'rsi_matrix':>12} {'ta per symbol':>14} {'speedup':>8}")
+    for n_symbols in UNIVERSES:
+        closes = make_closes(n_symbols, args.bars)
+        kernel_s = timed(lambda: rsi_matrix(closes, args.period), args.repeat)
+        if n_symbols <= args.ta_max_symbols:
+            ta_s = timed(lambda: ta_rsi(closes, args.period), 1)
+            print(f"{n_symbols:>8} {kernel_s * 1000:>10.1f}ms {ta_s * 1000:>12.1f}ms {ta_s / kernel_s:>7.1f}x")
+        else:
+            print(f"{n_symbols:>8} {kernel_s * 1000:>10.1f}ms {'-':>14} {'-':>8}")
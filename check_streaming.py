@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from bench_loop import start_broker
+from fake_stream import FakeMarketDataServer
+
+# Seconds every REST response is delayed while reconnecting, so bars streamed
+# meanwhile are held until the backfill is done
+BACKFILL_LATENCY = 1.0
+
+
+async def _wait_for(condition, timeout: float, what: str):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.05)
+    try:
+        await asyncio.wait_for(poll(), timeout)
+    except asyncio.TimeoutError:
+        raise AssertionError(f"timed out waiting for {what}")
+
+
+async def _sleep_into_next_minute(margin: float = 1.0):
+    """Sleeps until just after the next minute starts, so the fake broker has a bar for it."""
+    now = datetime.now(timezone.utc)
+    await asyncio.sleep(60 - now.second - now.microsecond / 1e6 + margin)
+
+
+async def check_reconnect(broker, symbol: str) -> list:
+    """
+    Publishes a bar, takes the server down while a minute passes unseen and
+    reconnects with a slow REST backfill while two revisions of the latest
+    minute are streamed.
+
+    The missed minute must come from the backfill and the held revisions must
+    be applied after it, in order, so the RSI state ends up exactly where
+    feeding the same bars one by one would put it.
+
+    Args:
+        broker (FakeBroker): The broker from ``bench_loop.start_broker``.
+        symbol (str): A crypto symbol.
+
+    Returns:
+        list: Failure messages, empty when everything held.
+    """
+    from fake_broker import synthetic_prices
+    from rsi import WilderRSI, get_rsi_state
+    from streaming import StreamingStrategy
+    import rsi_strategy as strategy
+
+    def close_at(ts: pd.Timestamp) -> float:
+        return float(synthetic_prices(symbol, np.array([ts.value / 60e9]))[0])
+
+    server = FakeMarketDataServer()
+    await server.start()
+    runner = StreamingStrategy(stock_symbols=[], crypto_symbols=[symbol], crypto_url=server.url)
+    applied = []
+    apply_bar = runner._apply_bar
+
+    async def record(kind, bar, received_at):
+        state = get_rsi_state(bar.symbol, runner.periods[kind])
+        applied.append((bar.close, state.last_timestamp))
+        await apply_bar(kind, bar, received_at)
+
+    runner._apply_bar = record
+    task = asyncio.create_task(runner.run_async())
+    failures = []
+    period = strategy.CRYPTO_RSI_LENGTH
+    try:
+        # First connect: seeded over REST, then a live bar for the current minute
+        await server.wait_for_subscription("bars", symbol)
+        await _wait_for(lambda: runner._pending["crypto"] is None and get_rsi_state(symbol, period) is not None,
+                        30, "the initial backfill")
+        state = get_rsi_state(symbol, period)
+        live = state.last_timestamp
+        await server.publish_bar(symbol, close_at(live), live.to_pydatetime(), updated=True)
+        await _wait_for(lambda: applied, 5, "the live bar")
+        expected = WilderRSI.load(period, state.dump())
+
+        # Go down until the next minute has started, so its bar is only on REST
+        broker.latency = BACKFILL_LATENCY
+        await server.stop()
+        await _sleep_into_next_minute()
+        missed = pd.Timestamp.now(tz="UTC").floor("min")
+        await server.start()
+
+        # Reconnect: revisions streamed during the backfill are held
+        await server.wait_for_subscription("bars", symbol, timeout=60)
+        held = [close_at(missed) * 1.01, close_at(missed) * 0.99]
+        for close in held:
+            await server.publish_bar(symbol, close, missed.to_pydatetime(), updated=True)
+        await _wait_for(lambda: len(applied) >= 1 + len(held) and runner._pending["crypto"] is None,
+                        30, "the held bars")
+
+        for ts in pd.date_range(live, missed, freq="1min")[1:]:
+            expected.update(close_at(ts), ts)
+        for close in held:
+            expected.update(close, missed)
+        state = get_rsi_state(symbol, period)
+
+        if state.last_timestamp != missed:
+            failures.append(f"missed minute {missed} not backfilled, RSI state ends at {state.last_timestamp}")
+        if [close for close, _ in applied[1:]] != held:
+            failures.append(f"held bars replayed with closes {[close for close, _ in applied[1:]]}, expected {held}")
+        if any(last != missed for _, last in applied[1:]):
+            failures.append("held bars were applied before the backfill caught up")
+        if (state.last_close, state.rsi_now, state.rsi_prev) != (expected.last_close, expected.rsi_now, expected.rsi_prev):
+            failures.append(f"RSI state {state.dump()} differs from the bar-by-bar {expected.dump()}")
+    except AssertionError as e:
+        failures.append(str(e))
+    finally:
+        await runner.stop()
+        task.cancel()
+        await server.stop()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the streaming strategy's reconnect backfill against "
+                                                 "local fake market data and broker servers")
+    parser.add_argument("--symbol", default="BTC/USD", help="Crypto symbol, so REST bars exist at any hour")
+    args = parser.parse_args()
+
+    # Keep the strategy's restored state and checkpoints out of data/
+    os.environ["ALPACA_STATE_FILE"] = os.path.join(tempfile.mkdtemp(prefix="check-state-"), "state.db")
+    broker = start_broker(0.0, 0.0)
+    started = time.perf_counter()
+    failures = asyncio.run(check_reconnect(broker, args.symbol))
+    broker.stop()
+
+    for failure in failures:
+        print(f"[CHECK][FAIL] {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"[CHECK] Reconnect backfill OK ({time.perf_counter() - started:.0f}s)")
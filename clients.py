@@ -0,0 +1,73 @@
+import threading
+from alpaca.trading.client import TradingClient
+from alpaca.data.historical import StockHistoricalDataClient, CryptoHistoricalDataClient
+from requests.adapters import HTTPAdapter
+import metrics
+from scheduler import get_scheduler
+from config import get_alpaca_api_key, get_alpaca_secret_key, get_trading_api_url, get_data_api_url
+
+# Connections kept alive per host in each client's session
+POOL_MAXSIZE = 32
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _pooled(client):
+    """
+    Gives a client's requests session a connection pool sized for concurrent
+    use, routes its API calls through the request scheduler and counts them
+    in ``metrics``.
+    """
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+    client._session.mount("https://", adapter)
+    client._session.mount("http://", adapter)
+    client._session.hooks["response"].append(metrics.record_response)
+    get_scheduler().install(client._session)
+    return client
+
+
+def _get_client(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = _pooled(factory())
+    return client
+
+
+def get_trading_client() -> TradingClient:
+    """
+    Returns the process-wide TradingClient, creating it on first use.
+    """
+    return _get_client("trading", lambda: TradingClient(
+        get_alpaca_api_key(), get_alpaca_secret_key(), url_override=get_trading_api_url()))
+
+
+def get_stock_data_client() -> StockHistoricalDataClient:
+    """
+    Returns the process-wide StockHistoricalDataClient, creating it on first use.
+    """
+    return _get_client("stock_data", lambda: StockHistoricalDataClient(
+        get_alpaca_api_key(), get_alpaca_secret_key(), url_override=get_data_api_url()))
+
+
+def get_crypto_data_client() -> CryptoHistoricalDataClient:
+    """
+    Returns the process-wide CryptoHistoricalDataClient, creating it on first use.
+    """
+    return _get_client("crypto_data", lambda: CryptoHistoricalDataClient(
+        get_alpaca_api_key(), get_alpaca_secret_key(), url_override=get_data_api_url()))
+
+
+def reset_clients():
+    """
+    Drops all cached clients, e.g. after a fork or a credentials change.
+    """
+    with _lock:
+        for client in _clients.values():
+            client._session.close()
+        _clients.clear()
+    get_alpaca_api_key.cache_clear()
+    get_alpaca_secret_key.cache_clear()
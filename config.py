@@ -1,23 +1,25 @@
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
 
 # Load environment variables from .env file
 load_dotenv()
 
 
-
+@lru_cache(maxsize=None)
 def get_alpaca_api_key():
     """
-    Get the Alpaca API key from environment variables.
+    Get the Alpaca API key from environment variables. Cached after the first read.
     """
     api_key = os.getenv('ALPACA_API_KEY')
     if not api_key:
         raise ValueError("ALPACA_API_KEY environment variable is not set.")
     return api_key
 
+@lru_cache(maxsize=None)
 def get_alpaca_secret_key():
     """
-    Get the Alpaca secret key from environment variables.
+    Get the Alpaca secret key from environment variables. Cached after the first read.
     """
     secret_key = os.getenv('ALPACA_API_SECRET')
     if not secret_key:
@@ -49,4 +51,144 @@ def get_base_url():
     Returns:
         str: The base URL for the Alpaca API.
     """
-    return get_alpaca_api_endpoint() or 'https://paper-api.alpaca.markets'  # Default to paper trading URL if not set
\ No newline at end of file
+    return get_alpaca_api_endpoint() or 'https://paper-api.alpaca.markets'  # Default to paper trading URL if not set
+
+def get_bar_store_dir():
+    """
+    Get the directory of the local bar store.
+
+    Returns:
+        str: The ALPACA_BAR_STORE_DIR environment variable, or 'data/bars' if not set.
+    """
+    return os.getenv('ALPACA_BAR_STORE_DIR') or 'data/bars'
+
+def get_stock_stream_url():
+    """
+    Get an override for the stock market data websocket URL.
+
+    Returns:
+        str | None: The ALPACA_STOCK_STREAM_URL environment variable, or None to use Alpaca's.
+    """
+    return os.getenv('ALPACA_STOCK_STREAM_URL') or None
+
+def get_crypto_stream_url():
+    """
+    Get an override for the crypto market data websocket URL.
+
+    Returns:
+        str | None: The ALPACA_CRYPTO_STREAM_URL environment variable, or None to use Alpaca's.
+    """
+    return os.getenv('ALPACA_CRYPTO_STREAM_URL') or None
+
+def get_trading_api_url():
+    """
+    Get an override for the Alpaca trading REST API URL.
+
+    Returns:
+        str | None: The ALPACA_TRADING_API_URL environment variable, or None to use Alpaca's.
+    """
+    return os.getenv('ALPACA_TRADING_API_URL') or None
+
+def get_data_api_url():
+    """
+    Get an override for the Alpaca market data REST API URL.
+
+    Returns:
+        str | None: The ALPACA_DATA_API_URL environment variable, or None to use Alpaca's.
+    """
+    return os.getenv('ALPACA_DATA_API_URL') or None
+
+def get_trading_stream_url():
+    """
+    Get an override for the trade updates websocket URL.
+
+    Returns:
+        str | None: The ALPACA_TRADING_STREAM_URL environment variable, or None to use Alpaca's.
+    """
+    return os.getenv('ALPACA_TRADING_STREAM_URL') or None
+
+def get_metrics_port():
+    """
+    Get the port for the Prometheus metrics endpoint.
+
+    Returns:
+        int | None: The ALPACA_METRICS_PORT environment variable, or None to not serve metrics.
+    """
+    port = os.getenv('ALPACA_METRICS_PORT')
+    return int(port) if port else None
+
+def get_metrics_file():
+    """
+    Get the file the metrics are periodically written to.
+
+    Returns:
+        str | None: The ALPACA_METRICS_FILE environment variable, or None to not write one.
+    """
+    return os.getenv('ALPACA_METRICS_FILE') or None
+
+def get_trace_file():
+    """
+    Get the append-only file tick-to-trade traces are written to.
+
+    Returns:
+        str: The ALPACA_TRACE_FILE environment variable, or 'data/traces.jsonl' if not set.
+    """
+    return os.getenv('ALPACA_TRACE_FILE') or 'data/traces.jsonl'
+
+def get_rate_limit():
+    """
+    Get the REST request budget of the trading API.
+
+    Returns:
+        int: The ALPACA_RATE_LIMIT environment variable in requests per minute, or 200 (Alpaca's default) if not set.
+    """
+    limit = os.getenv('ALPACA_RATE_LIMIT')
+    return int(limit) if limit else 200
+
+def get_rate_burst():
+    """
+    Get how many trading API requests may go out back to back before throttling starts.
+
+    Returns:
+        int: The ALPACA_RATE_BURST environment variable, or 40 if not set.
+    """
+    burst = os.getenv('ALPACA_RATE_BURST')
+    return int(burst) if burst else 40
+
+def get_data_rate_limit():
+    """
+    Get the REST request budget of the market data API.
+
+    Returns:
+        int: The ALPACA_DATA_RATE_LIMIT environment variable in requests per minute, or ``get_rate_limit()`` if not set.
+    """
+    limit = os.getenv('ALPACA_DATA_RATE_LIMIT')
+    return int(limit) if limit else get_rate_limit()
+
+def get_data_rate_burst():
+    """
+    Get how many market data API requests may go out back to back before throttling starts.
+
+    Returns:
+        int: The ALPACA_DATA_RATE_BURST environment variable, or ``get_rate_burst()`` if not set.
+    """
+    burst = os.getenv('ALPACA_DATA_RATE_BURST')
+    return int(burst) if burst else get_rate_burst()
+
+def get_state_file():
+    """
+    Get the SQLite file the strategy checkpoints its state to for warm restarts.
+
+    Returns:
+        str: The ALPACA_STATE_FILE environment variable, or 'data/state.db' if not set.
+    """
+    return os.getenv('ALPACA_STATE_FILE') or 'data/state.db'
+
+def get_universe():
+    """
+    Get the symbol universe the stock strategy pre-screens its watchlist from.
+
+    Returns:
+        str | None: The ALPACA_UNIVERSE environment variable ('all', a file with one symbol per line, or a comma-separated list), or None to trade the fixed watchlist.
+    """
+    return os.getenv('ALPACA_UNIVERSE') or None
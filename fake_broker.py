@@ -0,0 +1,612 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+import numpy as np
+import pandas as pd
+import websockets
+
+TIMEFRAMES = {"1Min": "1min", "5Min": "5min", "15Min": "15min", "1Hour": "1h", "1Day": "1D"}
+OPEN_STATUSES = ("new", "accepted", "held", "partially_filled", "pending_cancel")
+
+
+class OrderRejected(Exception):
+    """An order the fake broker refuses, answered with a 403 like Alpaca's."""
+
+
+def _iso(ts: datetime) -> str:
+    return ts.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def synthetic_prices(symbol: str, minutes: np.ndarray) -> np.ndarray:
+    """
+    Deterministic price path for a symbol, by minutes since the epoch.
+
+    Two sine waves of different periods, so RSI keeps swinging through
+    oversold and overbought and the strategy has something to trade.
+    """
+    seed = zlib.crc32(symbol.encode())
+    base = 20.0 + seed % 480
+    phase = (seed % 1000) / 1000 * 2 * np.pi
+    return base * (1 + 0.03 * np.sin(minutes / 97.0 + phase) + 0.01 * np.sin(minutes / 13.0 + 2 * phase))
+
+
+class FakeBroker:
+    """
+    Local stand-in for Alpaca's trading and market data REST APIs and the
+    trade-updates websocket, for benchmarks and tests without network access.
+
+    Bars and quotes follow ``synthetic_prices``; stock bars only exist in
+    regular market hours. Market orders fill at once at the current quote and
+    are pushed to trade-updates listeners; limit and stop orders, including
+    bracket and OCO exit legs, fill once the quote reaches them, checked on
+    every request.
+    Every REST response is delayed by ``latency`` plus up to ``jitter``
+    seconds, and requests are counted per endpoint.
+
+    Args:
+        host (str): Interface to listen on.
+        latency (float): Seconds added to every REST response.
+        jitter (float): Extra random delay of up to this many seconds.
+        cash (float): Starting account cash.
+        assets (list): Symbols GET /v2/assets lists as active and tradable.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", latency: float = 0.0, jitter: float = 0.0, cash: float = 100000.0,
+                 assets: list = None):
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.cash = self.starting_cash = cash
+        self.assets = list(assets or [])
+        # Calendar exceptions: dates without a session, and dates to their early close ("13:00")
+        self.holidays = set()
+        self.early_closes = {}
+        # Synthetic trade prints per minute of regular hours, for the trades endpoint
+        self.trades_per_minute = 60
+        self.positions = {}
+        self.orders = []
+        self._by_id = {}
+        self._working = []
+        self._siblings = {}
+        # Seconds before a requested cancel takes effect, as Alpaca cancels asynchronously;
+        # until then the order stays pending_cancel, holds its shares and can still fill
+        self.cancel_delay = 0.05
+        self._cancel_at = {}
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._http = None
+        self._loop = None
+        self._ws_server = None
+        self._listeners = set()
+        self.urls = {}
+
+    @property
+    def request_count(self) -> int:
+        """Total REST requests served."""
+        return sum(self.requests.values())
+
+    def env(self) -> dict:
+        """Environment variables pointing ``config`` at this broker."""
+        return {
+            "ALPACA_TRADING_API_URL": self.urls["trading"],
+            "ALPACA_DATA_API_URL": self.urls["data"],
+            "ALPACA_TRADING_STREAM_URL": self.urls["trading_stream"],
+        }
+
+    def start(self) -> dict:
+        """
+        Starts the REST server and the trade-updates websocket on background threads.
+
+        Returns:
+            dict: The "trading", "data" and "trading_stream" URLs.
+        """
+        broker = self
+
+        class Handler(_Handler):
+            pass
+        Handler.broker = broker
+
+        self._http = ThreadingHTTPServer((self.host, 0), Handler)
+        self._http.daemon_threads = True
+        threading.Thread(target=self._http.serve_forever, name="fake-broker-http", daemon=True).start()
+        rest_url = f"http://{self.host}:{self._http.server_address[1]}"
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="fake-broker-ws", daemon=True).start()
+
+        async def serve():
+            return await websockets.serve(self._handle_stream, self.host, 0)
+        self._ws_server = asyncio.run_coroutine_threadsafe(serve(), self._loop).result()
+        ws_port = self._ws_server.sockets[0].getsockname()[1]
+
+        self.urls = {"trading": rest_url, "data": rest_url, "trading_stream": f"ws://{self.host}:{ws_port}"}
+        return self.urls
+
+    def stop(self):
+        """Stops both servers."""
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+        if self._ws_server is not None:
+            self._ws_server.close()
+            asyncio.run_coroutine_threadsafe(self._ws_server.wait_closed(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._ws_server = None
+
+    # --- Market data ---
+
+    def quote_price(self, symbol: str, now: datetime = None) -> float:
+        now = now or datetime.now(timezone.utc)
+        return float(synthetic_prices(symbol, np.array([now.timestamp() / 60]))[0])
+
+    def _bar_arrays(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Min"):
+        index = pd.date_range(pd.Timestamp(start).ceil("min"), pd.Timestamp(end), freq=TIMEFRAMES.get(timeframe, "1min")).as_unit("ns")
+        if "/" not in symbol and timeframe != "1Day":
+            eastern = index.tz_convert("US/Eastern")
+            minute = eastern.hour * 60 + eastern.minute
+            index = index[(eastern.weekday < 5) & (minute >= 9 * 60 + 30) & (minute < 16 * 60)]
+        return index, synthetic_prices(symbol, index.asi8 / 60e9 - 1), synthetic_prices(symbol, index.asi8 / 60e9)
+
+    def bars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Min") -> list:
+        index, opens, closes = self._bar_arrays(symbol, start, end, timeframe)
+        return [
+            {"t": _iso(ts), "o": o, "h": max(o, c), "l": min(o, c), "c": c, "v": 1000.0, "n": 10, "vw": (o + c) / 2}
+            for ts, o, c in zip(index, opens.tolist(), closes.tolist())
+        ]
+
+    def snapshot(self, symbol: str) -> dict:
+        """Latest trade, quote, minute bar and the last two sessions' daily bars, as in a snapshots response."""
+        now = datetime.now(timezone.utc)
+        index, opens, closes = self._bar_arrays(symbol, now - timedelta(days=5), now)
+        if not len(index):
+            return None
+        days = index.tz_convert("US/Eastern").normalize().asi8
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        highs, lows = np.maximum(opens, closes), np.minimum(opens, closes)
+        daily_bars = []
+        for first, stop in zip(starts[-2:], [*starts[-2:][1:], len(index)]):
+            n = int(stop - first)
+            daily_bars.append({
+                "t": _iso(index[first]), "o": float(opens[first]), "h": float(highs[first:stop].max()),
+                "l": float(lows[first:stop].min()), "c": float(closes[stop - 1]), "v": 1000.0 * n, "n": 10 * n,
+                "vw": float((opens[first:stop] + closes[first:stop]).mean() / 2),
+            })
+        last = self.bars(symbol, index[-1], index[-1])[-1]
+        return {
+            "latestTrade": {"t": last["t"], "p": last["c"], "s": 100, "x": "V", "i": 1, "c": ["@"], "z": "C"},
+            "latestQuote": self.quote(symbol),
+            "minuteBar": last,
+            "dailyBar": daily_bars[-1],
+            "prevDailyBar": daily_bars[-2] if len(daily_bars) > 1 else None,
+        }
+
+    def trades(self, symbol: str, start: datetime, end: datetime, limit: int = 1000, page_token: str = None) -> tuple:
+        """
+        Evenly spaced trade prints in regular hours between start and end, both inclusive, one page at a time.
+
+        Returns:
+            tuple: (list of trades, next page token or None).
+        """
+        step = pd.Timedelta(minutes=1) / self.trades_per_minute
+        first = pd.Timestamp(int(page_token), tz="UTC") if page_token else pd.Timestamp(start).ceil(step)
+        index = pd.date_range(first, pd.Timestamp(end), freq=step).as_unit("ns")
+        eastern = index.tz_convert("US/Eastern")
+        minute = eastern.hour * 60 + eastern.minute
+        index = index[(eastern.weekday < 5) & (minute >= 9 * 60 + 30) & (minute < 16 * 60)]
+        page, rest = index[:limit], index[limit:]
+        ids = page.asi8 // step.value
+        prices = synthetic_prices(symbol, page.asi8 / 60e9)
+        trades = [{"t": _iso(ts), "p": round(price, 4), "s": int(1 + trade_id % 7 * 50), "x": "V", "i": int(trade_id),
+                   "c": ["@"] if trade_id % 5 else ["@", "I"], "z": "A"}
+                  for ts, price, trade_id in zip(page, prices.tolist(), ids.tolist())]
+        return trades, (str(rest[0].value) if len(rest) else None)
+
+    def quote(self, symbol: str) -> dict:
+        price = self.quote_price(symbol)
+        return {"t": _iso(datetime.now(timezone.utc)), "bp": price, "bs": 100, "ap": price * 1.0005, "as": 100,
+                "bx": "V", "ax": "V", "c": ["R"], "z": "A"}
+
+    # --- Trading ---
+
+    def calendar(self, start, end) -> list:
+        """Weekday sessions 9:30-16:00 between two dates, minus holidays and with early closes."""
+        days = pd.date_range(start, end, freq="D")
+        return [{"date": day.strftime("%Y-%m-%d"), "open": "09:30", "close": self.early_closes.get(day.date(), "16:00"),
+                 "session_open": "0400", "session_close": "2000"}
+                for day in days if day.weekday() < 5 and day.date() not in self.holidays]
+
+    def clock(self) -> dict:
+        eastern = pd.Timestamp.now(tz="US/Eastern")
+        sessions = self.calendar(eastern.date(), eastern.date() + pd.Timedelta(days=10))
+        bounds = [(pd.Timestamp(f"{s['date']} {s['open']}", tz="US/Eastern"),
+                   pd.Timestamp(f"{s['date']} {s['close']}", tz="US/Eastern")) for s in sessions]
+        is_open = any(open_ <= eastern < close for open_, close in bounds)
+        next_open = next(open_ for open_, _ in bounds if open_ > eastern)
+        next_close = next(close for _, close in bounds if close > eastern)
+        return {"timestamp": eastern.isoformat(), "is_open": is_open, "next_open": next_open.isoformat(),
+                "next_close": next_close.isoformat()}
+
+    def asset(self, symbol: str) -> dict:
+        crypto = "/" in symbol
+        return {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_OID, symbol)), "class": "crypto" if crypto else "us_equity",
+            "exchange": "CRYPTO" if crypto else "NASDAQ", "symbol": symbol, "name": symbol, "status": "active",
+            "tradable": True, "marginable": not crypto, "shortable": not crypto, "easy_to_borrow": not crypto,
+            "fractionable": True, "attributes": [],
+        }
+
+    def account(self) -> dict:
+        with self._lock:
+            market_value = sum(p["qty"] * self.quote_price(p["symbol"]) for p in self.positions.values())
+            equity = self.cash + market_value
+            return {
+                "id": "00000000-0000-0000-0000-000000000000", "account_number": "FAKE", "status": "ACTIVE",
+                "currency": "USD", "cash": str(self.cash), "portfolio_value": str(equity), "equity": str(equity),
+                "last_equity": str(equity), "long_market_value": str(market_value), "buying_power": str(self.cash * 2),
+                "multiplier": "2", "pattern_day_trader": False, "trading_blocked": False, "account_blocked": False,
+                "transfers_blocked": False, "shorting_enabled": True,
+            }
+
+    def _position_json(self, position: dict) -> dict:
+        price = self.quote_price(position["symbol"])
+        qty = position["qty"]
+        return {
+            "asset_id": str(uuid.uuid5(uuid.NAMESPACE_OID, position["symbol"])),
+            "symbol": position["symbol"].replace("/", ""),
+            "exchange": "CRYPTO" if "/" in position["symbol"] else "NASDAQ",
+            "asset_class": "crypto" if "/" in position["symbol"] else "us_equity",
+            "avg_entry_price": str(position["avg_entry_price"]), "qty": str(abs(qty)), "qty_available": str(abs(qty)),
+            "side": "long" if qty > 0 else "short", "market_value": str(qty * price),
+            "cost_basis": str(qty * position["avg_entry_price"]), "current_price": str(price),
+        }
+
+    def _new_order(self, symbol: str, side: str, qty: float, type: str, time_in_force: str, order_class: str,
+                   client_order_id: str = None, limit_price=None, stop_price=None, status: str = "new") -> dict:
+        now = _iso(datetime.now(timezone.utc))
+        order = {
+            "id": str(uuid.uuid4()), "client_order_id": client_order_id or str(uuid.uuid4()),
+            "created_at": now, "updated_at": now, "submitted_at": now, "symbol": symbol,
+            "asset_class": "crypto" if "/" in symbol else "us_equity", "qty": str(qty), "filled_qty": "0",
+            "order_class": order_class, "order_type": type, "type": type, "side": side,
+            "time_in_force": time_in_force, "limit_price": None if limit_price is None else str(limit_price),
+            "stop_price": None if stop_price is None else str(stop_price), "status": status,
+            "extended_hours": False, "legs": None,
+        }
+        self._by_id[order["id"]] = order
+        if status == "new":
+            self._working.append(order["id"])
+        return order
+
+    def submit_order(self, body: dict) -> dict:
+        """
+        Accepts an order; bracket and OCO orders get their exit legs.
+
+        Raises:
+            OrderRejected: When a sell needs quantity already held by working sell orders.
+        """
+        symbol = body["symbol"]
+        side = body["side"]
+        price = self.quote_price(symbol)
+        qty = float(body.get("qty") or float(body["notional"]) / price)
+        order_class = body.get("order_class") or "simple"
+        tif = body["time_in_force"]
+        with self._lock:
+            if side == "sell":
+                self._check_available(symbol, qty)
+            if order_class == "oco":
+                order = self._new_order(symbol, side, qty, "limit", tif, "oco", body.get("client_order_id"),
+                                        limit_price=body["take_profit"]["limit_price"])
+                stop = self._new_order(symbol, side, qty, "stop", tif, "oco", stop_price=body["stop_loss"]["stop_price"])
+                order["legs"] = [stop]
+                self._siblings[order["id"]] = [stop["id"]]
+                self._siblings[stop["id"]] = [order["id"]]
+            else:
+                order = self._new_order(symbol, side, qty, body.get("type", "market"), tif, order_class,
+                                        body.get("client_order_id"), limit_price=body.get("limit_price"),
+                                        stop_price=body.get("stop_price"))
+                if order_class == "bracket":
+                    exit_side = "sell" if side == "buy" else "buy"
+                    take_profit = self._new_order(symbol, exit_side, qty, "limit", tif, "bracket", status="held",
+                                                  limit_price=body["take_profit"]["limit_price"])
+                    stop_loss = self._new_order(symbol, exit_side, qty, "stop", tif, "bracket", status="held",
+                                                stop_price=body["stop_loss"]["stop_price"])
+                    order["legs"] = [take_profit, stop_loss]
+                    self._siblings[take_profit["id"]] = [stop_loss["id"]]
+                    self._siblings[stop_loss["id"]] = [take_profit["id"]]
+            self.orders.append(order)
+        self.work_orders()
+        return order
+
+    def _check_available(self, symbol: str, qty: float):
+        position = self.positions.get(symbol)
+        held = sum(float(self._by_id[i]["qty"]) for i in self._working
+                   if self._by_id[i]["symbol"] == symbol and self._by_id[i]["side"] == "sell")
+        available = max(position["qty"], 0.0) - held if position else 0.0
+        if held and qty > available + 1e-9:
+            raise OrderRejected(f"insufficient qty available for order (requested: {qty:g}, available: {available:g})")
+
+    @staticmethod
+    def _marketable(order: dict, price: float) -> bool:
+        if order["type"] == "limit":
+            limit = float(order["limit_price"])
+            return price <= limit if order["side"] == "buy" else price >= limit
+        if order["type"] == "stop":
+            stop = float(order["stop_price"])
+            return price >= stop if order["side"] == "buy" else price <= stop
+        return True
+
+    def work_orders(self):
+        """
+        Fills every working order that is marketable at the current quote.
+
+        Filling a bracket entry activates its legs; filling one exit leg
+        cancels the other. Runs on every request.
+        """
+        events = []
+        with self._lock:
+            now_monotonic = time.monotonic()
+            for order_id, due in list(self._cancel_at.items()):
+                if due <= now_monotonic:
+                    events.extend(self._cancel(order_id))
+            for order_id in list(self._working):
+                order = self._by_id[order_id]
+                if order["status"] not in ("new", "pending_cancel"):
+                    continue
+                price = self.quote_price(order["symbol"])
+                if not self._marketable(order, price):
+                    continue
+                qty = float(order["qty"])
+                now = _iso(datetime.now(timezone.utc))
+                position_qty = self._fill(order["symbol"], order["side"], qty, price)
+                order.update(status="filled", filled_qty=str(qty), filled_avg_price=str(price), filled_at=now, updated_at=now)
+                self._working.remove(order_id)
+                self._cancel_at.pop(order_id, None)
+                events.append({"event": "fill", "execution_id": str(uuid.uuid4()), "order": order, "timestamp": now,
+                               "position_qty": str(position_qty), "price": str(price), "qty": str(qty)})
+                for leg in order["legs"] or ():
+                    if leg["status"] == "held":
+                        leg["status"] = "new"
+                        self._working.append(leg["id"])
+                for sibling_id in self._siblings.get(order_id, ()):
+                    events.extend(self._cancel(sibling_id))
+        for event in events:
+            self._publish({"stream": "trade_updates", "data": event})
+
+    def _cancel(self, order_id: str) -> list:
+        order = self._by_id[order_id]
+        if order["status"] not in OPEN_STATUSES:
+            return []
+        now = _iso(datetime.now(timezone.utc))
+        order.update(status="canceled", canceled_at=now, updated_at=now)
+        self._cancel_at.pop(order_id, None)
+        if order_id in self._working:
+            self._working.remove(order_id)
+        events = [{"event": "canceled", "order": order, "timestamp": now}]
+        for sibling_id in self._siblings.get(order_id, ()):
+            events.extend(self._cancel(sibling_id))
+        return events
+
+    def cancel_order(self, order_id: str) -> bool:
+        """
+        Requests the cancel of an open order, which takes effect with its OCO
+        sibling ``cancel_delay`` later. Returns False when it is not open.
+        """
+        with self._lock:
+            order = self._by_id.get(order_id)
+            if order is None or order["status"] not in OPEN_STATUSES:
+                return False
+            if order["status"] == "pending_cancel":
+                return True
+            if order["status"] == "held":
+                events = self._cancel(order_id)
+            else:
+                now = _iso(datetime.now(timezone.utc))
+                order.update(status="pending_cancel", updated_at=now)
+                self._cancel_at[order_id] = time.monotonic() + self.cancel_delay
+                events = [{"event": "pending_cancel", "order": order, "timestamp": now}]
+        for event in events:
+            self._publish({"stream": "trade_updates", "data": event})
+        return True
+
+    def reset_account(self):
+        """Cancels every open order and goes back to the starting cash with no positions."""
+        with self._lock:
+            events = [event for order_id in list(self._by_id) for event in self._cancel(order_id)]
+            self.positions.clear()
+            self.cash = self.starting_cash
+        for event in events:
+            self._publish({"stream": "trade_updates", "data": event})
+
+    def get_order(self, order_id: str):
+        with self._lock:
+            return self._by_id.get(order_id)
+
+    def find_order(self, client_order_id: str):
+        with self._lock:
+            for order in self._by_id.values():
+                if order["client_order_id"] == client_order_id:
+                    return order
+        return None
+
+    def list_orders(self, status: str = "open", nested: bool = False, limit: int = 50) -> list:
+        """Orders newest first, as GET /v2/orders returns them; legs are listed on their own unless nested."""
+        with self._lock:
+            orders = list(reversed(self.orders))
+            if not nested:
+                orders = [o for order in orders for o in [order, *(order["legs"] or ())]]
+        if status == "open":
+            orders = [o for o in orders if o["status"] in OPEN_STATUSES]
+        elif status == "closed":
+            orders = [o for o in orders if o["status"] not in OPEN_STATUSES]
+        return orders[:limit]
+
+    def _fill(self, symbol: str, side: str, qty: float, price: float) -> float:
+        position = self.positions.setdefault(symbol, {"symbol": symbol, "qty": 0.0, "avg_entry_price": 0.0})
+        signed = qty if side == "buy" else -qty
+        new_qty = position["qty"] + signed
+        if position["qty"] * signed >= 0 and new_qty:
+            position["avg_entry_price"] = (position["qty"] * position["avg_entry_price"] + signed * price) / new_qty
+        elif position["qty"] * new_qty < 0:
+            position["avg_entry_price"] = price
+        position["qty"] = new_qty
+        self.cash -= signed * price
+        if abs(new_qty) < 1e-12:
+            del self.positions[symbol]
+            return 0.0
+        return abs(new_qty)
+
+    def find_position(self, symbol: str):
+        with self._lock:
+            for position in self.positions.values():
+                if position["symbol"].replace("/", "") == symbol.replace("/", ""):
+                    return self._position_json(position)
+        return None
+
+    # --- Trade updates stream ---
+
+    def _publish(self, msg: dict):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._broadcast(json.dumps(msg)), self._loop)
+
+    async def _broadcast(self, frame: str):
+        for ws in list(self._listeners):
+            try:
+                await ws.send(frame)
+            except websockets.ConnectionClosed:
+                self._listeners.discard(ws)
+
+    async def _handle_stream(self, ws, path=None):
+        try:
+            auth = json.loads(await ws.recv())
+            if auth.get("action") not in ("auth", "authenticate"):
+                await ws.send(json.dumps({"stream": "authorization", "data": {"status": "unauthorized"}}))
+                return
+            await ws.send(json.dumps({"stream": "authorization", "data": {"status": "authorized", "action": "authenticate"}}))
+            async for message in ws:
+                request = json.loads(message)
+                if request.get("action") == "listen":
+                    streams = request.get("data", {}).get("streams", [])
+                    if "trade_updates" in streams:
+                        self._listeners.add(ws)
+                    await ws.send(json.dumps({"stream": "listening", "data": {"streams": streams}}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._listeners.discard(ws)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes the REST endpoints the bot uses to its FakeBroker."""
+
+    broker = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this each response
+    # can stall on delayed ACKs and the fake adds latency of its own
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body):
+        payload = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str):
+        broker = self.broker
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+
+        endpoint = path
+        if path.startswith("/v2/positions/"):
+            endpoint = "/v2/positions/{symbol}"
+        elif path.startswith("/v2/orders/"):
+            endpoint = "/v2/orders/{id}"
+        broker.requests[f"{method} {endpoint}"] += 1
+        delay = broker.latency + (random.uniform(0, broker.jitter) if broker.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        broker.work_orders()
+
+        if method == "GET" and path == "/v2/account":
+            return self._reply(200, broker.account())
+        if method == "GET" and path == "/v2/positions":
+            with broker._lock:
+                return self._reply(200, [broker._position_json(p) for p in broker.positions.values()])
+        if method == "GET" and path.startswith("/v2/positions/"):
+            position = broker.find_position(path[len("/v2/positions/"):])
+            if position is None:
+                return self._reply(404, {"code": 40410000, "message": "position does not exist"})
+            return self._reply(200, position)
+        if method == "POST" and path == "/v2/orders":
+            try:
+                return self._reply(200, broker.submit_order(body))
+            except OrderRejected as e:
+                return self._reply(403, {"code": 40310000, "message": str(e)})
+        if method == "GET" and path == "/v2/orders":
+            return self._reply(200, broker.list_orders(query.get("status", "open"), query.get("nested") == "true",
+                                                       int(query.get("limit", 50))))
+        if method == "GET" and path == "/v2/orders:by_client_order_id":
+            order = broker.find_order(query["client_order_id"])
+            if order is None:
+                return self._reply(404, {"code": 40410000, "message": "order not found"})
+            return self._reply(200, order)
+        if method == "GET" and path.startswith("/v2/orders/"):
+            order = broker.get_order(path[len("/v2/orders/"):])
+            if order is None:
+                return self._reply(404, {"code": 40410000, "message": "order not found"})
+            return self._reply(200, order)
+        if method == "DELETE" and path.startswith("/v2/orders/"):
+            if not broker.cancel_order(path[len("/v2/orders/"):]):
+                return self._reply(422, {"code": 42210000, "message": "order is not open"})
+            return self._reply(204, None)
+        if method == "GET" and path in ("/v2/stocks/bars", "/v1beta3/crypto/us/bars"):
+            start = pd.Timestamp(query["start"])
+            end = pd.Timestamp(query.get("end") or datetime.now(timezone.utc))
+            symbols = query["symbols"].split(",")
+            bars = {symbol: broker.bars(symbol, start, end, query.get("timeframe", "1Min")) for symbol in symbols}
+            return self._reply(200, {"bars": {s: b for s, b in bars.items() if b}, "next_page_token": None})
+        if method == "GET" and path == "/v2/stocks/trades":
+            symbol = query["symbols"]
+            end = pd.Timestamp(query.get("end") or datetime.now(timezone.utc))
+            trades, token = broker.trades(symbol, pd.Timestamp(query["start"]), end, int(query.get("limit", 1000)),
+                                          query.get("page_token"))
+            return self._reply(200, {"trades": {symbol: trades} if trades else {}, "next_page_token": token})
+        if method == "GET" and path == "/v2/clock":
+            return self._reply(200, broker.clock())
+        if method == "GET" and path == "/v2/calendar":
+            today = datetime.now(timezone.utc).date()
+            return self._reply(200, broker.calendar(query.get("start", today), query.get("end", today)))
+        if method == "GET" and path == "/v2/assets":
+            return self._reply(200, [broker.asset(symbol) for symbol in broker.assets])
+        if method == "GET" and path in ("/v2/stocks/snapshots", "/v1beta3/crypto/us/snapshots"):
+            snapshots = {symbol: broker.snapshot(symbol) for symbol in query["symbols"].split(",")}
+            return self._reply(200, snapshots if path.startswith("/v2") else {"snapshots": snapshots})
+        if method == "GET" and path in ("/v2/stocks/quotes/latest", "/v1beta3/crypto/us/latest/quotes"):
+            return self._reply(200, {"quotes": {symbol: broker.quote(symbol) for symbol in query["symbols"].split(",")}})
+        self._reply(404, {"code": 40400000, "message": f"not found: {method} {path}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
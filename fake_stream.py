@@ -0,0 +1,143 @@
+import asyncio
+import msgpack
+import websockets
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Stream channels a client can subscribe to, keyed by their message type
+CHANNELS = {"b": "bars", "u": "updatedBars", "q": "quotes", "t": "trades"}
+
+
+def _timestamp(ts: datetime = None) -> msgpack.Timestamp:
+    ts = ts or datetime.now(timezone.utc)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return msgpack.Timestamp.from_datetime(ts)
+
+
+class FakeMarketDataServer:
+    """
+    Local stand-in for Alpaca's market data websocket.
+
+    Speaks the same msgpack protocol as the real stock and crypto streams
+    (connect, auth, subscribe), so ``StockDataStream``/``CryptoDataStream`` can
+    point at it with ``url_override``. Tests publish bars and quotes, and can
+    drop every connection to exercise reconnects.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on, 0 picks a free one.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self._server = None
+        self._clients = {}
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        """
+        Starts listening.
+
+        Returns:
+            str: The websocket URL to pass as ``url_override``.
+        """
+        self._server = await websockets.serve(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        """Closes every connection and stops listening."""
+        await self.drop_connections()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def drop_connections(self):
+        """Closes every client connection, as a network drop would."""
+        for ws in list(self._clients):
+            await ws.close()
+        self._clients.clear()
+
+    async def wait_for_subscription(self, channel: str, symbol: str, timeout: float = 5.0):
+        """Waits until some client is subscribed to a symbol on a channel."""
+        async def subscribed():
+            while not any(symbol in subs[channel] or "*" in subs[channel] for subs in self._clients.values()):
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(subscribed(), timeout)
+
+    async def publish_bar(self, symbol: str, close: float, timestamp: datetime = None, open: float = None,
+                          high: float = None, low: float = None, volume: float = 0.0, updated: bool = False):
+        """Sends a minute bar (or an updated bar) to subscribed clients."""
+        open = close if open is None else open
+        await self._publish({
+            "T": "u" if updated else "b",
+            "S": symbol,
+            "o": open,
+            "h": max(open, close) if high is None else high,
+            "l": min(open, close) if low is None else low,
+            "c": close,
+            "v": volume,
+            "n": 0,
+            "vw": close,
+            "t": _timestamp(timestamp),
+        })
+
+    async def publish_quote(self, symbol: str, bid_price: float, ask_price: float = None, timestamp: datetime = None):
+        """Sends a quote to subscribed clients."""
+        await self._publish({
+            "T": "q",
+            "S": symbol,
+            "bx": "V",
+            "bp": bid_price,
+            "bs": 1,
+            "ax": "V",
+            "ap": bid_price if ask_price is None else ask_price,
+            "as": 1,
+            "c": ["R"],
+            "z": "A",
+            "t": _timestamp(timestamp),
+        })
+
+    async def _publish(self, msg: dict):
+        channel = CHANNELS[msg["T"]]
+        frame = msgpack.packb([msg])
+        for ws, subs in list(self._clients.items()):
+            if msg["S"] in subs[channel] or "*" in subs[channel]:
+                try:
+                    await ws.send(frame)
+                except websockets.ConnectionClosed:
+                    self._clients.pop(ws, None)
+
+    async def _handle(self, ws, path=None):
+        self.connections += 1
+        await ws.send(msgpack.packb([{"T": "success", "msg": "connected"}]))
+        try:
+            auth = msgpack.unpackb(await ws.recv())
+            if auth.get("action") != "auth":
+                await ws.send(msgpack.packb([{"T": "error", "code": 401, "msg": "not authenticated"}]))
+                return
+            await ws.send(msgpack.packb([{"T": "success", "msg": "authenticated"}]))
+
+            subs = self._clients[ws] = defaultdict(set)
+            async for message in ws:
+                request = msgpack.unpackb(message)
+                action = request.pop("action", None)
+                for channel, symbols in request.items():
+                    if action == "subscribe":
+                        subs[channel].update(symbols)
+                    elif action == "unsubscribe":
+                        subs[channel].difference_update(symbols)
+                reply = {"T": "subscription"}
+                reply.update({channel: sorted(symbols) for channel, symbols in subs.items()})
+                await ws.send(msgpack.packb([reply]))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._clients.pop(ws, None)
@@ -0,0 +1,577 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+import pytz
+from datetime import datetime, timedelta
+from functools import lru_cache
+from barstore import get_bars_multi, get_store
+from metrics import timed
+from rsi import WilderRSI
+
+# Bar columns every ring buffer holds
+BAR_COLUMNS = ("open", "high", "low", "close", "volume")
+
+# Bars kept per symbol by default: one regular stock session of minute bars
+DEFAULT_CAPACITY = 390
+
+# Minute bar history a new symbol's buffer is seeded from
+SEED_DAYS = 5
+
+NS_PER_HOUR = 3_600_000_000_000
+NS_PER_DAY = 86_400_000_000_000
+
+EASTERN = pytz.timezone("US/Eastern")
+# Regular US stock session, as Eastern wall-clock time since midnight
+SESSION_OPEN = (9 * 60 + 30) * 60_000_000_000
+SESSION_CLOSE = 16 * NS_PER_HOUR
+
+
+@lru_cache(maxsize=4096)
+def _eastern_offset(utc_hour: int) -> int:
+    """Eastern's UTC offset in nanoseconds during a UTC hour; DST switches on the hour."""
+    return int(datetime.fromtimestamp(utc_hour * 3600, EASTERN).utcoffset().total_seconds()) * 1_000_000_000
+
+
+def session_days(timestamps, session: bool = True):
+    """
+    The day a timestamp's VWAP belongs to, and whether its volume counts.
+
+    Stocks (session=True) use the Eastern trading date and count only the
+    regular 9:30-16:00 session, leaving pre- and post-market prints out;
+    half days are not known here, so their prints after 13:00 still count.
+    Crypto trades around the clock and uses the UTC day.
+
+    Args:
+        timestamps (int | numpy.ndarray): UTC nanoseconds.
+        session (bool): Whether to use the regular stock session.
+    Returns:
+        tuple: (day number, counts), scalars or arrays like timestamps.
+    """
+    if isinstance(timestamps, np.ndarray):
+        timestamps = timestamps.astype(np.int64, copy=False)
+        if not session:
+            return timestamps // NS_PER_DAY, np.ones(len(timestamps), dtype=bool)
+        hours, inverse = np.unique(timestamps // NS_PER_HOUR, return_inverse=True)
+        local = timestamps + np.array([_eastern_offset(int(hour)) for hour in hours], dtype=np.int64)[inverse]
+    else:
+        if not session:
+            return timestamps // NS_PER_DAY, True
+        local = timestamps + _eastern_offset(timestamps // NS_PER_HOUR)
+    clock = local % NS_PER_DAY
+    return local // NS_PER_DAY, (clock >= SESSION_OPEN) & (clock < SESSION_CLOSE)
+
+
+class BarRing:
+    """
+    Fixed-size window of one symbol's most recent bars in preallocated arrays.
+
+    Every bar is written twice, at its slot and at the slot plus capacity, so
+    the last ``n`` bars of a column are always one contiguous slice: ``window``
+    returns a view, never a copy, and the buffer never grows.
+
+    A bar with the same timestamp as the last one replaces it, as with
+    ``WilderRSI``; older bars are ignored.
+
+    Args:
+        capacity (int): Number of bars kept.
+    """
+
+    __slots__ = ("capacity", "count", "_data", "_timestamps", "_end", "_columns", "_last")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self._data = np.zeros((len(BAR_COLUMNS), 2 * capacity))
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._end = 0
+        self._columns = {column: row for row, column in enumerate(BAR_COLUMNS)}
+        self._last = None
+
+    @property
+    def last_timestamp(self):
+        """UTC nanoseconds of the newest bar, or None while empty."""
+        return int(self._timestamps[self._end - 1 + self.capacity]) if self.count else None
+
+    def append(self, timestamp: int, open_: float, high: float, low: float, close: float, volume: float):
+        """
+        Adds one bar.
+
+        Args:
+            timestamp (int): Bar start in UTC nanoseconds.
+        Returns:
+            bool | None: False for a new bar, True for a revision of the last one, None if it was ignored.
+        """
+        last = self.last_timestamp
+        revision = last is not None and timestamp == last
+        if last is not None and timestamp < last:
+            return None
+        if revision:
+            slot = (self._end - 1) % self.capacity
+        else:
+            slot = self._end
+            self._end = (slot + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        # Nodes mostly read the newest bar; keep it as plain floats too
+        self._last = (open_, high, low, close, volume)
+        for index in (slot, slot + self.capacity):
+            self._data[:, index] = self._last
+            self._timestamps[index] = timestamp
+        return revision
+
+    def window(self, column: str, n: int = None) -> np.ndarray:
+        """
+        The last n values of a column, oldest first, as a read-only view.
+
+        Args:
+            column (str): One of ``BAR_COLUMNS``, or "timestamp".
+            n (int): Number of bars, defaults to all held.
+        """
+        n = self.count if n is None else min(n, self.count)
+        stop = self._end + self.capacity
+        row = self._timestamps if column == "timestamp" else self._data[self._columns[column]]
+        view = row[stop - n:stop]
+        view.flags.writeable = False
+        return view
+
+    def get(self, column: str, ago: int = 0) -> float:
+        """The value of a column ``ago`` bars before the newest, or None if not held."""
+        if ago >= self.count:
+            return None
+        if ago == 0:
+            return self._last[self._columns[column]]
+        return float(self._data[self._columns[column], self._end - 1 - ago + self.capacity])
+
+
+class Indicator:
+    """
+    Incremental indicator node updated once per bar from a ``BarRing``.
+
+    Subclasses implement ``_state``/``_restore`` and ``_step``; revisions of
+    the last bar are handled here by rolling back to the state before it.
+
+    Attributes:
+        value (float | None): Latest value, None while warming up.
+        lookback (int): Bars the node needs to still be in the buffer.
+    """
+
+    __slots__ = ("value", "lookback", "_undo")
+
+    def __init__(self, lookback: int = 1):
+        self.value = None
+        self.lookback = lookback
+        self._undo = None
+
+    def bind(self, symbol: str):
+        """Called once with the symbol a pipeline created the node for."""
+
+    def update(self, ring: BarRing, revision: bool):
+        if revision and self._undo is not None:
+            self._restore(self._undo)
+        else:
+            self._undo = self._state()
+        self._step(ring)
+
+    def _state(self) -> tuple:
+        raise NotImplementedError
+
+    def _restore(self, state: tuple):
+        raise NotImplementedError
+
+    def _step(self, ring: BarRing):
+        raise NotImplementedError
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average, matching ``ta.trend.EMAIndicator``
+    (``ewm(span=period, adjust=False)``, None for the first period - 1 bars).
+    """
+
+    __slots__ = ("period", "column", "alpha", "count", "_ema")
+
+    def __init__(self, period: int = 20, column: str = "close"):
+        super().__init__()
+        self.period = period
+        self.column = column
+        self.alpha = 2.0 / (period + 1)
+        self.count = 0
+        self._ema = None
+
+    def _state(self):
+        return self.value, self.count, self._ema
+
+    def _restore(self, state):
+        self.value, self.count, self._ema = state
+
+    def _step(self, ring):
+        x = ring.get(self.column)
+        self._ema = x if self._ema is None else self._ema + self.alpha * (x - self._ema)
+        self.count += 1
+        self.value = self._ema if self.count >= self.period else None
+
+
+class ATR(Indicator):
+    """
+    Average true range with Wilder smoothing, matching
+    ``ta.volatility.AverageTrueRange``: the mean of the first period true
+    ranges, then ``(atr * (period - 1) + tr) / period``.
+    """
+
+    __slots__ = ("period", "count", "_sum")
+
+    def __init__(self, period: int = 14):
+        super().__init__(lookback=2)
+        self.period = period
+        self.count = 0
+        self._sum = 0.0
+
+    def _state(self):
+        return self.value, self.count, self._sum
+
+    def _restore(self, state):
+        self.value, self.count, self._sum = state
+
+    def _step(self, ring):
+        high, low = ring.get("high"), ring.get("low")
+        prev_close = ring.get("close", 1)
+        true_range = high - low
+        if prev_close is not None and self.count:
+            true_range = max(true_range, abs(high - prev_close), abs(low - prev_close))
+        self.count += 1
+        if self.count < self.period:
+            self._sum += true_range
+        elif self.count == self.period:
+            self.value = (self._sum + true_range) / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + true_range) / self.period
+
+
+class VWAP(Indicator):
+    """
+    Volume-weighted average of the typical price (high + low + close) / 3
+    over the day so far, None until the day's first counted bar. Days and
+    the bars that count follow ``session_days``.
+
+    Args:
+        session (bool): Whether to use the regular stock session. None
+            decides from the bound symbol: crypto pairs ("BTC/USD") use the
+            UTC day, everything else the session.
+    """
+
+    __slots__ = ("session", "_day", "_pv", "_volume")
+
+    def __init__(self, session: bool = None):
+        super().__init__()
+        self.session = session
+        self._day = None
+        self._pv = 0.0
+        self._volume = 0.0
+
+    def _state(self):
+        return self.value, self._day, self._pv, self._volume
+
+    def _restore(self, state):
+        self.value, self._day, self._pv, self._volume = state
+
+    def bind(self, symbol):
+        if self.session is None:
+            self.session = "/" not in symbol
+
+    def _step(self, ring):
+        day, counts = session_days(ring.last_timestamp, self.session is not False)
+        if day != self._day:
+            self.value, self._day, self._pv, self._volume = None, day, 0.0, 0.0
+        if not counts:
+            return
+        volume = ring.get("volume")
+        self._pv += (ring.get("high") + ring.get("low") + ring.get("close")) / 3.0 * volume
+        self._volume += volume
+        if self._volume > 0:
+            self.value = self._pv / self._volume
+
+
+class Bollinger(Indicator):
+    """
+    Bollinger bands over a rolling window, matching
+    ``ta.volatility.BollingerBands`` (population standard deviation).
+
+    Keeps running sums of the window's values and squares, shifted by a
+    reference price for precision, so a bar costs a handful of operations
+    instead of a pass over the window. The sums are rebuilt from the buffer
+    every ``RESYNC`` bars so rounding cannot accumulate.
+
+    Attributes:
+        value (float | None): The middle band (moving average).
+        upper (float | None): Middle band plus ``deviations`` standard deviations.
+        lower (float | None): Middle band minus ``deviations`` standard deviations.
+    """
+
+    RESYNC = 1000
+
+    __slots__ = ("period", "deviations", "column", "upper", "lower", "count", "_shift", "_sum", "_sumsq")
+
+    def __init__(self, period: int = 20, deviations: float = 2.0, column: str = "close"):
+        super().__init__(lookback=period + 1)
+        self.period = period
+        self.deviations = deviations
+        self.column = column
+        self.upper = None
+        self.lower = None
+        self.count = 0
+        self._shift = None
+        self._sum = 0.0
+        self._sumsq = 0.0
+
+    def _state(self):
+        return self.value, self.upper, self.lower, self.count, self._shift, self._sum, self._sumsq
+
+    def _restore(self, state):
+        self.value, self.upper, self.lower, self.count, self._shift, self._sum, self._sumsq = state
+
+    def _step(self, ring):
+        self.count += 1
+        if self._shift is None or self.count % self.RESYNC == 0:
+            window = ring.window(self.column, min(self.count, self.period))
+            self._shift = float(window[-1])
+            shifted = window - self._shift
+            self._sum, self._sumsq = float(shifted.sum()), float(shifted @ shifted)
+        else:
+            x = ring.get(self.column) - self._shift
+            self._sum += x
+            self._sumsq += x * x
+            if self.count > self.period:
+                old = ring.get(self.column, self.period) - self._shift
+                self._sum -= old
+                self._sumsq -= old * old
+        if self.count < self.period:
+            return
+        mean = self._sum / self.period
+        std = math.sqrt(max(self._sumsq / self.period - mean * mean, 0.0))
+        self.value = mean + self._shift
+        self.upper = self.value + self.deviations * std
+        self.lower = self.value - self.deviations * std
+
+
+class RSI(Indicator):
+    """Wilder RSI as a pipeline node; ``WilderRSI`` already handles revisions itself."""
+
+    __slots__ = ("rsi",)
+
+    def __init__(self, period: int = 14):
+        super().__init__()
+        self.rsi = WilderRSI(period)
+
+    def update(self, ring, revision):
+        self.value = self.rsi.update(ring.get("close"), ring.last_timestamp)
+
+
+class SymbolFeatures:
+    """
+    One symbol's bar buffer and indicator nodes.
+
+    ``features["ema_20"]`` reads a node's latest value and ``node("bb_20")``
+    the node itself, e.g. for its bands; neither copies anything.
+    """
+
+    __slots__ = ("symbol", "ring", "nodes")
+
+    def __init__(self, symbol: str, capacity: int):
+        self.symbol = symbol
+        self.ring = BarRing(capacity)
+        self.nodes = {}
+
+    def __getitem__(self, name: str):
+        return self.nodes[name].value
+
+    def values(self) -> dict:
+        """Every node's latest value by name, as plain floats (or None) that can be pickled."""
+        return {name: node.value for name, node in self.nodes.items()}
+
+    def node(self, name: str) -> Indicator:
+        return self.nodes[name]
+
+    @property
+    def ready(self) -> bool:
+        """True once every node has a value."""
+        return all(node.value is not None for node in self.nodes.values())
+
+    def update(self, timestamp: int, open_: float, high: float, low: float, close: float, volume: float):
+        revision = self.ring.append(timestamp, open_, high, low, close, volume)
+        if revision is None:
+            return
+        for node in self.nodes.values():
+            node.update(self.ring, revision)
+
+
+def default_indicators() -> dict:
+    """The indicators ``get_pipeline()`` registers: name to node factory."""
+    return {
+        "ema_20": lambda: EMA(20),
+        "atr_14": lambda: ATR(14),
+        "vwap": VWAP,
+        "bb_20": lambda: Bollinger(20, 2.0),
+    }
+
+
+class FeaturePipeline:
+    """
+    Incremental indicators over per-symbol ring buffers.
+
+    Each symbol gets a ``BarRing`` of ``capacity`` bars and one node per
+    registered indicator. Each new bar is written to the ring once and then
+    every node updates from it in O(1), so memory stays at the window size
+    and each extra indicator only adds its own few operations per bar.
+
+    Args:
+        capacity (int): Bars kept per symbol; must exceed every node's lookback.
+        indicators (dict): Name to a callable returning a new ``Indicator``.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, indicators: dict = None):
+        self.capacity = capacity
+        self.indicators = {}
+        self._symbols = {}
+        self._lock = threading.Lock()
+        for name, factory in (indicators or {}).items():
+            self.register(name, factory)
+
+    def register(self, name: str, factory):
+        """
+        Adds an indicator to every symbol. Symbols that already have bars
+        replay their buffer through the new node.
+
+        Args:
+            name (str): Key the value is read back by.
+            factory (callable): Returns a new ``Indicator``.
+        """
+        lookback = factory().lookback
+        if lookback > self.capacity:
+            raise ValueError(f"Indicator {name} needs {lookback} bars but the pipeline keeps {self.capacity}.")
+        with self._lock:
+            self.indicators[name] = factory
+            for features in self._symbols.values():
+                node = features.nodes[name] = factory()
+                node.bind(features.symbol)
+                ring = features.ring
+                replay = BarRing(self.capacity)
+                columns = [ring.window(column) for column in ("timestamp",) + BAR_COLUMNS]
+                for ts, *bar in zip(*columns):
+                    replay.append(int(ts), *bar)
+                    node.update(replay, False)
+
+    def get(self, symbol: str) -> SymbolFeatures:
+        """Returns a symbol's features, or None if it has no bars yet."""
+        return self._symbols.get(symbol)
+
+    def symbols(self) -> list:
+        return list(self._symbols)
+
+    def _features(self, symbol: str) -> SymbolFeatures:
+        features = self._symbols.get(symbol)
+        if features is None:
+            with self._lock:
+                features = self._symbols.get(symbol)
+                if features is None:
+                    features = SymbolFeatures(symbol, self.capacity)
+                    features.nodes = {name: factory() for name, factory in self.indicators.items()}
+                    for node in features.nodes.values():
+                        node.bind(symbol)
+                    self._symbols[symbol] = features
+        return features
+
+    def update(self, symbol: str, timestamp, open_: float, high: float, low: float, close: float,
+               volume: float) -> SymbolFeatures:
+        """
+        Applies one bar to a symbol.
+
+        Args:
+            symbol (str): The symbol.
+            timestamp: Bar start, as a timestamp or UTC nanoseconds.
+        Returns:
+            SymbolFeatures: The symbol's updated features.
+        """
+        if not isinstance(timestamp, (int, np.integer)):
+            timestamp = pd.Timestamp(timestamp).value
+        features = self._features(symbol)
+        features.update(int(timestamp), float(open_), float(high), float(low), float(close), float(volume))
+        return features
+
+    def update_bars(self, symbol: str, bars: pd.DataFrame) -> SymbolFeatures:
+        """
+        Applies a bars DataFrame (indexed by timestamp, oldest first) to a symbol.
+
+        Bars before the symbol's last one are skipped; the last one itself is
+        re-applied, picking up a revised in-progress minute.
+        """
+        features = self._features(symbol)
+        timestamps = pd.DatetimeIndex(bars.index).as_unit("ns").asi8
+        last = features.ring.last_timestamp
+        start = 0 if last is None else int(np.searchsorted(timestamps, last))
+        columns = [bars[column].to_numpy(dtype=np.float64)[start:] for column in BAR_COLUMNS]
+        for ts, *bar in zip(timestamps[start:].tolist(), *(column.tolist() for column in columns)):
+            features.update(ts, *bar)
+        return features
+
+
+def _read_bars(symbols, start, end, fetch: bool) -> dict:
+    if fetch:
+        with timed("bar_fetch"):
+            return get_bars_multi(symbols, start, end)
+    store = get_store()
+    return {symbol: store.read(symbol, start=start, end=end) for symbol in symbols}
+
+
+def update_features_multi(symbols, pipeline: "FeaturePipeline" = None, fetch: bool = True) -> dict:
+    """
+    Brings many symbols' features up to date from the local bar store in one batch.
+
+    New symbols are seeded from up to SEED_DAYS of minute bars, of which only
+    the last ``capacity`` are applied; the others read bars from their last
+    one onwards.
+
+    Args:
+        symbols (list): The symbols.
+        pipeline (FeaturePipeline): Defaults to ``get_pipeline()``.
+        fetch (bool): Whether to fetch what the store is missing. False only
+            reads the store, e.g. right after ``update_rsi_multi`` brought it
+            up to date, saving the round trip.
+    Returns:
+        dict: Symbol to its SymbolFeatures, or None if no data is available.
+    """
+    pipeline = pipeline or get_pipeline()
+    end = datetime.utcnow()
+    new = [symbol for symbol in symbols if pipeline.get(symbol) is None]
+    known = [symbol for symbol in symbols if symbol not in new]
+
+    try:
+        if new:
+            seed_bars = _read_bars(new, end - timedelta(days=SEED_DAYS), end, fetch)
+            with timed("feature_compute"):
+                for symbol, bars in seed_bars.items():
+                    if bars is not None and not bars.empty:
+                        pipeline.update_bars(symbol, bars.iloc[-pipeline.capacity:])
+        if known:
+            start = pd.Timestamp(min(pipeline.get(symbol).ring.last_timestamp for symbol in known), tz="UTC")
+            new_bars = _read_bars(known, start, end, fetch)
+            with timed("feature_compute"):
+                for symbol, bars in new_bars.items():
+                    if bars is not None and not bars.empty:
+                        pipeline.update_bars(symbol, bars)
+    except Exception as e:
+        print(f"[ERROR] Failed to update features for {symbols}: {e}")
+    return {symbol: pipeline.get(symbol) for symbol in symbols}
+
+
+_default_pipeline = None
+_default_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> FeaturePipeline:
+    """Returns the process-wide feature pipeline with ``default_indicators()``."""
+    global _default_pipeline
+    if _default_pipeline is None:
+        with _default_pipeline_lock:
+            if _default_pipeline is None:
+                _default_pipeline = FeaturePipeline(DEFAULT_CAPACITY, default_indicators())
+    return _default_pipeline
@@ -0,0 +1,369 @@
+import threading
+import time
+from alpaca.trading.enums import OrderClass, OrderSide, OrderStatus, QueryOrderStatus, TradeEvent
+from alpaca.trading.requests import GetOrdersRequest
+from alpaca.trading.stream import TradingStream
+from clients import get_trading_client
+from config import get_alpaca_api_key, get_alpaca_secret_key, get_trading_stream_url
+from order_manager import get_order_manager
+from percentage import invalidate_account
+from tracing import record_fill
+from datetime import datetime, timezone
+
+# How often the ledger is rebuilt from get_all_positions, to cover trade
+# updates missed while the stream was reconnecting
+RECONCILE_INTERVAL = 60.0  # seconds
+# How long an order may go without a trade update before a reconcile stops waiting for it
+PENDING_GRACE = 30.0  # seconds
+
+FILL_EVENTS = (TradeEvent.FILL, TradeEvent.PARTIAL_FILL)
+DEAD_EVENTS = (TradeEvent.CANCELED, TradeEvent.EXPIRED, TradeEvent.REJECTED)
+# Open sell orders of these classes are a position's take-profit/stop-loss exits
+EXIT_ORDER_CLASSES = (OrderClass.BRACKET, OrderClass.OCO)
+
+
+def _key(symbol: str) -> str:
+    """Positions report crypto as 'ETHUSD' while orders use 'ETH/USD'."""
+    return symbol.replace("/", "")
+
+
+class Position:
+    """
+    One held (or about to be held) position.
+
+    Attributes:
+        symbol (str): The symbol.
+        qty (float): Quantity held, 0 until an entry order fills.
+        avg_entry_price (float): Average fill price of the quantity held.
+        entry_time (datetime): When the position was opened.
+        pending (OrderSide): Side of an order submitted but not yet filled, else None.
+        pending_order (str): Id of that order, when known.
+        pending_since (float): ``time.monotonic()`` when that order was submitted.
+        exit_orders (tuple): Ids of take-profit/stop-loss orders working at the
+            broker, empty when there are none, None when attaching them failed.
+        version (int): Ledger version of the last change made to the position.
+    """
+
+    __slots__ = ("symbol", "qty", "avg_entry_price", "entry_time", "pending", "pending_order", "pending_since",
+                 "exit_orders", "version")
+
+    def __init__(self, symbol: str, qty: float = 0.0, avg_entry_price: float = None, entry_time: datetime = None,
+                 pending: OrderSide = None):
+        self.symbol = symbol
+        self.qty = qty
+        self.avg_entry_price = avg_entry_price
+        self.entry_time = entry_time
+        self.pending = pending
+        self.pending_order = None
+        self.pending_since = time.monotonic() if pending else 0.0
+        self.exit_orders = ()
+        self.version = 0
+
+    def __repr__(self):
+        return (f"Position({self.symbol!r}, qty={self.qty}, avg_entry_price={self.avg_entry_price}, "
+                f"pending={self.pending}, exit_orders={self.exit_orders})")
+
+    def is_pending(self, order) -> bool:
+        """Whether an order is the one this position is waiting on."""
+        if self.pending != order.side:
+            return False
+        return self.pending_order is None or self.pending_order == str(order.id)
+
+
+class PositionLedger:
+    """
+    In-memory view of the account's positions, kept current by trade updates.
+
+    The ledger is seeded with one ``get_all_positions`` call and then applies
+    fills from the ``TradingStream`` trade-updates feed as they happen, so the
+    strategy reads positions without any REST round trip. A full reconcile
+    runs every ``RECONCILE_INTERVAL`` to catch anything the stream missed.
+
+    Entry and exit orders are recorded as pending until their fills arrive:
+    a pending entry already counts against position caps, and a pending exit
+    is not sold a second time. Take-profit/stop-loss orders working at the
+    broker are tracked per position until they fill or die.
+
+    Every change bumps the ledger's version, so a reconcile can tell which
+    positions the stream touched while its REST snapshot was in flight.
+    """
+
+    def __init__(self):
+        self._positions = {}
+        self._lock = threading.RLock()
+        self._reconciled_at = None
+        self._stream = None
+        self._version = 0
+        # Key -> version at which the position was closed, since the last reconcile
+        self._removed = {}
+
+    def _touch(self, position: Position) -> Position:
+        """Marks a position as changed. Call with the lock held."""
+        self._version += 1
+        position.version = self._version
+        return position
+
+    def _remove(self, key: str):
+        """Drops a closed position. Call with the lock held."""
+        self._version += 1
+        del self._positions[key]
+        self._removed[key] = self._version
+
+    def get(self, symbol: str) -> Position:
+        """Returns the position in a symbol, or None when flat."""
+        return self._positions.get(_key(symbol))
+
+    def count(self, symbols) -> int:
+        """Number of the given symbols with an open or pending position."""
+        positions = self._positions
+        return sum(1 for symbol in symbols if _key(symbol) in positions)
+
+    def positions(self) -> list:
+        """Copies of every open or pending position, for persisting."""
+        with self._lock:
+            positions = []
+            for position in self._positions.values():
+                copy = Position(position.symbol, position.qty, position.avg_entry_price, position.entry_time,
+                                position.pending)
+                copy.pending_order = position.pending_order
+                copy.exit_orders = position.exit_orders
+                positions.append(copy)
+            return positions
+
+    def restore(self, positions):
+        """
+        Seeds the ledger with positions persisted by an earlier process.
+
+        The next reconcile corrects quantities and prices and drops anything
+        no longer held; restored entry times and exit orders are kept. A
+        restored pending order gets another ``PENDING_GRACE`` to resolve.
+
+        Args:
+            positions (list): Position objects.
+        """
+        with self._lock:
+            for position in positions:
+                position.pending_since = time.monotonic() if position.pending else 0.0
+                self._positions.setdefault(_key(position.symbol), position)
+
+    def open_pending(self, symbol: str, price: float, entry_time: datetime, order_id: str = None,
+                     exit_orders: tuple = ()):
+        """
+        Records a submitted entry order. Its fill sets the real quantity and price.
+
+        Args:
+            symbol (str): The symbol bought.
+            price (float): Expected fill price, used only until the fill arrives.
+            entry_time (datetime): When the order was sent.
+            order_id (str): The entry order's id.
+            exit_orders (tuple): Ids of the entry's bracket legs.
+        """
+        with self._lock:
+            position = self._positions.get(_key(symbol))
+            # The fill may already have arrived and opened the position
+            if position is None:
+                position = self._positions[_key(symbol)] = Position(symbol, 0.0, price, entry_time, pending=OrderSide.BUY)
+                position.pending_order = order_id and str(order_id)
+            if exit_orders:
+                position.exit_orders = tuple(exit_orders)
+            self._touch(position)
+
+    def close_pending(self, symbol: str, order_id: str = None):
+        """Records a submitted exit order, so the position is not sold twice."""
+        with self._lock:
+            position = self._positions.get(_key(symbol))
+            if position is not None:
+                position.pending = OrderSide.SELL
+                position.pending_order = order_id and str(order_id)
+                position.pending_since = time.monotonic()
+                position.exit_orders = ()
+                self._touch(position)
+
+    def set_exit_orders(self, symbol: str, exit_orders):
+        """
+        Records the take-profit/stop-loss orders working for a position.
+
+        Args:
+            symbol (str): The symbol.
+            exit_orders (tuple): Their ids, or None when they could not be placed.
+        """
+        with self._lock:
+            position = self._positions.get(_key(symbol))
+            if position is not None:
+                position.exit_orders = None if exit_orders is None else tuple(exit_orders)
+                self._touch(position)
+
+    def apply_trade_update(self, update):
+        """
+        Applies one event from the trade-updates stream.
+
+        Args:
+            update (TradeUpdate): The trade update.
+        """
+        order = update.order
+        key = _key(order.symbol)
+        with self._lock:
+            position = self._positions.get(key)
+            if update.event in FILL_EVENTS:
+                fill_qty = float(update.qty or 0)
+                fill_price = float(update.price or 0)
+                if order.side == OrderSide.BUY:
+                    if position is None:
+                        position = self._positions[key] = Position(order.symbol, entry_time=update.timestamp)
+                    qty = position.qty + fill_qty
+                    position.avg_entry_price = (
+                        (position.qty * position.avg_entry_price + fill_qty * fill_price) / qty
+                        if position.qty and qty else fill_price
+                    )
+                    position.qty = qty
+                elif position is not None:
+                    position.qty -= fill_qty
+                if position is None:
+                    return
+                self._touch(position)
+                if update.position_qty is not None:
+                    position.qty = abs(float(update.position_qty))
+                if update.event == TradeEvent.FILL and position.is_pending(order):
+                    position.pending = None
+                if position.qty <= 0 and position.pending is None:
+                    self._remove(key)
+            elif update.event in DEAD_EVENTS and position is not None:
+                self._touch(position)
+                if position.exit_orders and str(order.id) in position.exit_orders:
+                    # The other half of the pair dies with it
+                    position.exit_orders = ()
+                elif position.is_pending(order):
+                    position.pending = None
+                    if position.qty <= 0:
+                        self._remove(key)
+
+    def apply_order(self, order):
+        """
+        Applies the final state of an order the position is still waiting on.
+
+        This covers fills and cancels whose trade updates were missed; once
+        the stream has applied an order the position no longer waits on it
+        and this only drops the cached account, in case the fill was missed.
+
+        Args:
+            order (Order): The resolved order, from the order manager.
+        """
+        key = _key(order.symbol)
+        if float(order.filled_qty or 0):
+            invalidate_account()
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None or position.pending_order is None or not position.is_pending(order):
+                return
+            filled_qty = float(order.filled_qty or 0)
+            if order.side == OrderSide.BUY and filled_qty:
+                position.qty = filled_qty
+                position.avg_entry_price = float(order.filled_avg_price)
+            elif order.side == OrderSide.SELL and order.status == OrderStatus.FILLED:
+                position.qty = 0.0
+            position.pending = None
+            self._touch(position)
+            if position.qty <= 0:
+                self._remove(key)
+
+    def reconcile(self):
+        """
+        Rebuilds the ledger from ``get_all_positions`` and the open orders.
+
+        Positions the stream changed or closed after the snapshot was taken
+        are left alone, as they are newer than it. A position is only dropped
+        when the snapshot postdates its last change and no order of its is
+        still working; a pending order missing from the open orders gets
+        ``PENDING_GRACE`` for its trade update before it is given up on.
+        """
+        trading_client = get_trading_client()
+        with self._lock:
+            snapshot = self._version
+        # Open orders first: an order filling in between then shows up as both working and held
+        open_orders = trading_client.get_orders(GetOrdersRequest(status=QueryOrderStatus.OPEN, nested=False, limit=500))
+        held = {_key(p.symbol): p for p in trading_client.get_all_positions()}
+        working = {str(order.id) for order in open_orders}
+        exits = {}
+        for order in open_orders:
+            if order.side == OrderSide.SELL and order.order_class in EXIT_ORDER_CLASSES:
+                exits.setdefault(_key(order.symbol), []).append(str(order.id))
+        now = time.monotonic()
+        with self._lock:
+            for key, p in held.items():
+                if self._removed.get(key, 0) > snapshot:
+                    continue
+                position = self._positions.get(key)
+                if position is None:
+                    position = self._positions[key] = Position(p.symbol, entry_time=datetime.now(timezone.utc))
+                elif position.version > snapshot:
+                    continue
+                position.qty = abs(float(p.qty))
+                position.avg_entry_price = float(p.avg_entry_price)
+                if position.pending == OrderSide.BUY and position.pending_order not in working:
+                    position.pending = None
+                if position.exit_orders is not None or key in exits:
+                    position.exit_orders = tuple(exits.get(key, ()))
+            for key, position in list(self._positions.items()):
+                if position.version > snapshot:
+                    continue
+                if position.pending is not None:
+                    if position.pending_order in working:
+                        position.pending_since = now
+                    elif now - position.pending_since >= PENDING_GRACE:
+                        position.pending = None
+                if key not in held and position.pending is None and not working.intersection(position.exit_orders or ()):
+                    self._remove(key)
+            self._removed.clear()
+            self._reconciled_at = now
+
+    def start_stream(self, url: str = None):
+        """
+        Starts applying trade updates from ``TradingStream`` on a background thread.
+
+        Args:
+            url (str): Stream URL override, defaults to ``config.get_trading_stream_url()``.
+        """
+        with self._lock:
+            if self._stream is not None:
+                return
+            self._stream = TradingStream(get_alpaca_api_key(), get_alpaca_secret_key(), url_override=url or get_trading_stream_url())
+
+        async def on_trade_update(update):
+            try:
+                if update.event in FILL_EVENTS:
+                    # Broker-side fills, e.g. bracket exits, move cash without going through submit
+                    invalidate_account()
+                self.apply_trade_update(update)
+                record_fill(update)
+                get_order_manager().apply_trade_update(update)
+            except Exception as e:
+                print(f"[LEDGER][ERROR] Failed to apply trade update: {e}")
+
+        self._stream.subscribe_trade_updates(on_trade_update)
+        threading.Thread(target=self._stream.run, name="trade-updates", daemon=True).start()
+
+    def sync(self, max_age: float = RECONCILE_INTERVAL):
+        """
+        Starts the trade-updates stream if needed and reconciles once the last
+        reconcile is older than max_age.
+
+        Args:
+            max_age (float): Maximum time since the last reconcile in seconds. 0 forces one.
+        """
+        self.start_stream()
+        if self._reconciled_at is None or time.monotonic() - self._reconciled_at >= max_age:
+            self.reconcile()
+
+
+_default_ledger = None
+_default_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> PositionLedger:
+    """Returns the process-wide position ledger."""
+    global _default_ledger
+    if _default_ledger is None:
+        with _default_ledger_lock:
+            if _default_ledger is None:
+                _default_ledger = PositionLedger()
+    return _default_ledger
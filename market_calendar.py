@@ -0,0 +1,243 @@
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+import pytz
+from alpaca.trading.requests import GetCalendarRequest
+from clients import get_trading_client
+
+EASTERN = pytz.timezone("US/Eastern")
+
+# The strategy trades from this long after the open until this long before the close,
+# when positions are flattened
+OPEN_DELAY = timedelta(minutes=30)
+CLOSE_BUFFER = timedelta(minutes=15)
+# Days of sessions fetched per refresh; the cache is refreshed once a day
+LOOKAHEAD_DAYS = 10
+# Retry delay after the calendar could not be fetched
+RETRY_INTERVAL = 300.0  # seconds
+# Longest single sleep, so a suspended host or a clock correction is noticed within the hour
+MAX_SLEEP = 3600.0  # seconds
+# Delay between end-of-day flatten attempts until the close
+FLATTEN_RETRY = 10.0  # seconds
+
+
+class Session:
+    """
+    One trading day from Alpaca's calendar.
+
+    Attributes:
+        date (date): The trading day.
+        open (datetime): Market open, Eastern time.
+        close (datetime): Market close, Eastern time; 13:00 on half days.
+    """
+
+    __slots__ = ("date", "open", "close")
+
+    def __init__(self, day: date, open_: datetime, close: datetime):
+        self.date = day
+        self.open = open_
+        self.close = close
+
+    @property
+    def start(self) -> datetime:
+        """When the strategy starts trading."""
+        return self.open + OPEN_DELAY
+
+    @property
+    def end(self) -> datetime:
+        """When the strategy stops trading and flattens."""
+        return self.close - CLOSE_BUFFER
+
+    def __repr__(self):
+        return f"Session({self.date}, {self.open:%H:%M}-{self.close:%H:%M})"
+
+
+def _weekday_sessions(start: date, days: int) -> list:
+    """Regular 9:30-16:00 sessions on weekdays, for when the calendar cannot be fetched."""
+    sessions = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        if day.weekday() < 5:
+            sessions.append(Session(day, EASTERN.localize(datetime(day.year, day.month, day.day, 9, 30)),
+                                    EASTERN.localize(datetime(day.year, day.month, day.day, 16))))
+    return sessions
+
+
+def _fetch_sessions(client, start: date, end: date) -> list:
+    calendar = client.get_calendar(GetCalendarRequest(start=start, end=end))
+    return [Session(day.date, EASTERN.localize(day.open), EASTERN.localize(day.close)) for day in calendar]
+
+
+def get_sessions(start: date, end: date) -> list:
+    """
+    Sessions from start to end, both included, e.g. to replay the trading window in a backtest.
+
+    Like ``MarketCalendar``, assumes regular weekday sessions when the calendar cannot be fetched.
+
+    Returns:
+        list: Session objects, oldest first.
+    """
+    try:
+        return _fetch_sessions(get_trading_client(), start, end)
+    except Exception as e:
+        print(f"[CALENDAR][WARN] Could not fetch the market calendar, assuming regular weekday sessions: {e}")
+        return _weekday_sessions(start, (end - start).days + 1)
+
+
+class MarketCalendar:
+    """
+    Trading sessions from Alpaca's calendar endpoint, fetched once a day.
+
+    Holidays have no session and half days close early, so the trading
+    window (``OPEN_DELAY`` after the open to ``CLOSE_BUFFER`` before the
+    close) follows the exchange's actual schedule. The clock endpoint is read
+    on each refresh to correct for local clock skew. If the calendar cannot
+    be fetched, regular weekday sessions are assumed and the fetch is retried
+    every ``RETRY_INTERVAL``.
+    """
+
+    def __init__(self):
+        self._sessions = []
+        self._refreshed_on = None
+        self._retry_at = float("inf")
+        self._skew = timedelta(0)
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        """The current Eastern time, corrected by the broker clock's offset."""
+        return datetime.now(EASTERN) + self._skew
+
+    def refresh(self, today: date = None):
+        """Fetches the sessions from yesterday to ``LOOKAHEAD_DAYS`` ahead, and the clock offset."""
+        today = today or self.now().date()
+        client = get_trading_client()
+        try:
+            sessions = _fetch_sessions(client, today - timedelta(days=1), today + timedelta(days=LOOKAHEAD_DAYS))
+            clock = client.get_clock()
+            skew = clock.timestamp - datetime.now(timezone.utc)
+            retry_at = float("inf")
+        except Exception as e:
+            print(f"[CALENDAR][WARN] Could not fetch the market calendar, assuming regular weekday sessions: {e}")
+            sessions, skew = _weekday_sessions(today - timedelta(days=1), LOOKAHEAD_DAYS + 2), self._skew
+            retry_at = time.monotonic() + RETRY_INTERVAL
+        with self._lock:
+            self._sessions = sessions
+            # Sub-second offsets are latency, not skew
+            self._skew = skew if abs(skew) >= timedelta(seconds=1) else timedelta(0)
+            self._refreshed_on = today
+            self._retry_at = retry_at
+
+    def sessions(self, now: datetime = None) -> list:
+        """The cached sessions, refreshed first when the day changed."""
+        now = now or self.now()
+        if self._refreshed_on != now.date() or time.monotonic() >= self._retry_at:
+            self.refresh(now.date())
+        return self._sessions
+
+    def session(self, now: datetime = None) -> Session:
+        """Today's session, or None on a day the market is closed."""
+        now = now or self.now()
+        return next((s for s in self.sessions(now) if s.date == now.date()), None)
+
+    def in_window(self, now: datetime = None) -> bool:
+        """Whether now is inside a session's trading window."""
+        now = now or self.now()
+        session = self.session(now)
+        return session is not None and session.start <= now < session.end
+
+    def next_window(self, now: datetime = None) -> Session:
+        """The session whose trading window is current or comes next."""
+        now = now or self.now()
+        upcoming = [s for s in self.sessions(now) if s.end > now]
+        if not upcoming:
+            # Past the cached range; force a fetch from today on
+            self.refresh(now.date())
+            upcoming = [s for s in self._sessions if s.end > now] or _weekday_sessions(now.date() + timedelta(days=1), 7)
+        return upcoming[0]
+
+    def sleep_until(self, when: datetime, max_sleep: float = MAX_SLEEP) -> bool:
+        """
+        Sleeps until when, at most max_sleep seconds at a time.
+
+        Returns:
+            bool: True once when is reached, False when max_sleep ran out first.
+        """
+        remaining = (when - self.now()).total_seconds()
+        time.sleep(min(max(remaining, 0.0), max_sleep))
+        return remaining <= max_sleep
+
+
+class EndOfDayTimer:
+    """
+    Flattens once per session at its window end (``CLOSE_BUFFER`` before
+    the close), on a background thread that sleeps until then.
+
+    It runs independently of the trading loop, so a slow pass cannot make it
+    miss the minute. The callback is retried every ``FLATTEN_RETRY`` until
+    it reports success or the session closes. A process started between the
+    window end and the close fires at once.
+
+    Args:
+        calendar (MarketCalendar): The calendar to follow.
+        callback (callable): Called with no arguments, e.g. ``close_all_positions``;
+            returns True once everything is flat.
+    """
+
+    def __init__(self, calendar: MarketCalendar, callback):
+        self.calendar = calendar
+        self.callback = callback
+        self.fired_on = None
+        self._attempted_on = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="end-of-day", daemon=True)
+            self._thread.start()
+        return self
+
+    def _flatten(self, session: Session):
+        if self._attempted_on != session.date:
+            self._attempted_on = session.date
+            print(f"[CALENDAR] {session.end:%H:%M} ET, {CLOSE_BUFFER.seconds // 60} min before the close: "
+                  f"flattening.")
+        try:
+            flat = self.callback()
+        except Exception as e:
+            print(f"[CALENDAR][ERROR] End-of-day flatten failed: {e}")
+            flat = False
+        if flat:
+            self.fired_on = session.date
+            print("[CALENDAR] Flat for the close.")
+            return
+        now = self.calendar.now()
+        if now + timedelta(seconds=FLATTEN_RETRY) >= session.close:
+            print(f"[CALENDAR][ERROR] Positions still open at {now:%H:%M:%S} ET; last attempt before the close.")
+        time.sleep(FLATTEN_RETRY)
+
+    def _run(self):
+        while True:
+            try:
+                now = self.calendar.now()
+                session = self.calendar.session(now)
+                if session is not None and session.end <= now < session.close and self.fired_on != session.date:
+                    self._flatten(session)
+                    continue
+                self.calendar.sleep_until(self.calendar.next_window(now).end)
+            except Exception as e:
+                print(f"[CALENDAR][ERROR] End-of-day timer failed: {e}")
+                time.sleep(60)
+
+
+_default_calendar = None
+_default_calendar_lock = threading.Lock()
+
+
+def get_market_calendar() -> MarketCalendar:
+    """Returns the process-wide market calendar."""
+    global _default_calendar
+    if _default_calendar is None:
+        with _default_calendar_lock:
+            if _default_calendar is None:
+                _default_calendar = MarketCalendar()
+    return _default_calendar
@@ -1,20 +1,149 @@
-from alpaca.data.historical import StockHistoricalDataClient
-from alpaca.data.requests import StockLatestQuoteRequest
-from config import get_alpaca_api_key, get_alpaca_secret_key
+from alpaca.data.requests import (
+    StockLatestQuoteRequest, CryptoLatestQuoteRequest, StockBarsRequest, CryptoBarsRequest, StockSnapshotRequest,
+    CryptoSnapshotRequest,
+)
+from alpaca.data.timeframe import TimeFrame
+from clients import get_stock_data_client, get_crypto_data_client
+from metrics import timed
+from datetime import datetime
+
+# Upper bound on symbols sent in one multi-symbol data request
+MAX_SYMBOLS_PER_REQUEST = 200
+
+
+def chunked(symbols, size: int = MAX_SYMBOLS_PER_REQUEST):
+    """
+    Splits a symbol list into request-sized chunks.
+
+    Args:
+        symbols (list): The symbols to split.
+        size (int): Maximum symbols per chunk.
+    Returns:
+        list: A list of symbol lists.
+    """
+    symbols = list(symbols)
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+
+def is_crypto(symbol: str) -> bool:
+    """Crypto pairs are written with a slash, e.g. 'ETH/USD'."""
+    return "/" in symbol
+
+
+def split_asset_classes(symbols):
+    """
+    Splits symbols into stocks and crypto pairs, keeping their order.
+
+    Returns:
+        tuple: (stock symbols, crypto symbols).
+    """
+    stocks, crypto = [], []
+    for symbol in symbols:
+        (crypto if is_crypto(symbol) else stocks).append(symbol)
+    return stocks, crypto
+
+
+def get_latest_quotes(symbols) -> dict:
+    """
+    Fetches the latest quote for stocks and crypto pairs in batched requests.
+
+    Each asset class goes to its own client in chunks of
+    ``MAX_SYMBOLS_PER_REQUEST``. Both return the SDK's ``Quote`` model.
+
+    Args:
+        symbols (list): Stock symbols and crypto pairs, in any mix.
+    Returns:
+        dict: Symbol to its latest Quote. Symbols without a quote are absent.
+    """
+    stocks, crypto = split_asset_classes(symbols)
+    quotes = {}
+    with timed("quote_fetch"):
+        for chunk in chunked(stocks):
+            quotes.update(get_stock_data_client().get_stock_latest_quote(StockLatestQuoteRequest(symbol_or_symbols=chunk)))
+        for chunk in chunked(crypto):
+            quotes.update(get_crypto_data_client().get_crypto_latest_quote(CryptoLatestQuoteRequest(symbol_or_symbols=chunk)))
+    return quotes
+
+
+def get_snapshots(symbols) -> dict:
+    """
+    Fetches snapshots (latest trade, quote, minute bar, daily bar and
+    previous daily bar) for stocks and crypto pairs in batched requests.
+
+    Each asset class goes to its own client in chunks of
+    ``MAX_SYMBOLS_PER_REQUEST``, so a whole universe costs one request per
+    chunk rather than one per symbol.
+
+    Args:
+        symbols (list): Stock symbols and crypto pairs, in any mix.
+    Returns:
+        dict: Symbol to its ``Snapshot``. Symbols without one are absent.
+    """
+    stocks, crypto = split_asset_classes(symbols)
+    snapshots = {}
+    with timed("snapshot_fetch"):
+        for chunk in chunked(stocks):
+            snapshots.update(get_stock_data_client().get_stock_snapshot(StockSnapshotRequest(symbol_or_symbols=chunk)))
+        for chunk in chunked(crypto):
+            snapshots.update(get_crypto_data_client().get_crypto_snapshot(CryptoSnapshotRequest(symbol_or_symbols=chunk)))
+    return {symbol: snapshot for symbol, snapshot in snapshots.items() if snapshot is not None}
+
+
+def get_historical_bars(symbols, start: datetime, end: datetime, timeframe: TimeFrame = TimeFrame.Minute) -> dict:
+    """
+    Fetches bars for stocks and crypto pairs in batched requests.
+
+    Each asset class goes to its own client in chunks of
+    ``MAX_SYMBOLS_PER_REQUEST``.
+
+    Args:
+        symbols (list): Stock symbols and crypto pairs, in any mix.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        timeframe (TimeFrame): The bar timeframe.
+    Returns:
+        dict: Symbol to a DataFrame of its bars indexed by timestamp, with the
+            columns open, high, low, close, volume, trade_count and vwap.
+            Symbols without bars are absent.
+    """
+    stocks, crypto = split_asset_classes(symbols)
+    requests = [
+        (get_stock_data_client().get_stock_bars,
+         [StockBarsRequest(symbol_or_symbols=chunk, start=start, end=end, timeframe=timeframe) for chunk in chunked(stocks)]),
+        (get_crypto_data_client().get_crypto_bars,
+         [CryptoBarsRequest(symbol_or_symbols=chunk, start=start, end=end, timeframe=timeframe) for chunk in chunked(crypto)]),
+    ]
+    result = {}
+    for get_bars, chunk_requests in requests:
+        for request in chunk_requests:
+            with timed("bar_request"):
+                bars = get_bars(request).df
+            if bars.empty:
+                continue
+            for symbol, symbol_bars in bars.groupby(level=0):
+                result[symbol] = symbol_bars.droplevel(0)
+    return result
+
 # keys required for stock historical data client
 def get_latest_price(symbol: str) -> float:
-    """    Fetches the latest price for a given stock symbol.  
+    """    Fetches the latest price for a given stock symbol or crypto pair.  
     Args:
         symbol (str): The stock symbol to fetch the latest price for.
     Returns:
         float: The latest price of the stock.
     """ 
-    client = StockHistoricalDataClient(get_alpaca_api_key(), get_alpaca_secret_key())
+    latest_bid_price = get_latest_quotes([symbol])[symbol].bid_price
+
+    return latest_bid_price
 
-        # multi symbol request - single symbol is similar
-    multisymbol_request_params = StockLatestQuoteRequest(symbol_or_symbols=symbol)
 
-    latest_multisymbol_quotes = client.get_stock_latest_quote(multisymbol_request_params)
-    latest_bid_price = latest_multisymbol_quotes[symbol].bid_price
+def get_latest_prices(symbols) -> dict:
+    """
+    Fetches the latest bid price for many symbols in batched requests.
 
-    return latest_bid_price
\ No newline at end of file
+    Args:
+        symbols (list): Stock symbols and crypto pairs, in any mix.
+    Returns:
+        dict: Symbol to its latest bid price. Symbols without a quote are absent.
+    """
+    return {symbol: quote.bid_price for symbol, quote in get_latest_quotes(symbols).items()}
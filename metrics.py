@@ -0,0 +1,219 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from config import get_metrics_port, get_metrics_file
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# How often start_from_config rewrites the metrics file
+DUMP_INTERVAL = 15.0  # seconds
+
+# Path segments that are ids or symbols, folded so endpoints stay low-cardinality
+_PATH_IDS = re.compile(r"^(/v2/(?:positions|orders|assets))/.+$")
+
+
+class Counter:
+    """A monotonically increasing count."""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Counts of observed values per ``BUCKETS`` bucket, plus their sum."""
+
+    __slots__ = ("counts", "sum", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(BUCKETS, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+# (name, sorted label items) -> metric
+_metrics = {}
+_types = {}
+_metrics_lock = threading.Lock()
+
+
+def _get(kind, name: str, labels: dict):
+    key = (name, tuple(sorted(labels.items())))
+    metric = _metrics.get(key)
+    if metric is None:
+        with _metrics_lock:
+            metric = _metrics.get(key)
+            if metric is None:
+                metric = _metrics[key] = kind()
+                _types[name] = kind
+    return metric
+
+
+def counter(name: str, **labels) -> Counter:
+    """Returns the counter for a name and label set, creating it on first use."""
+    return _get(Counter, name, labels)
+
+
+def histogram(name: str, **labels) -> Histogram:
+    """Returns the histogram for a name and label set, creating it on first use."""
+    return _get(Histogram, name, labels)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Times a block (or, as a decorator, a function) as one pipeline stage.
+
+    Feeds ``bot_stage_seconds{stage}`` and, when the block raises,
+    ``bot_stage_errors_total{stage}``. Costs a few microseconds.
+
+    Example:
+        with timed("quote_fetch"):
+            quotes = client.get_stock_latest_quote(request)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        counter("bot_stage_errors_total", stage=stage).inc()
+        raise
+    finally:
+        histogram("bot_stage_seconds", stage=stage).observe(time.perf_counter() - start)
+
+
+def record_response(response, *args, **kwargs):
+    """
+    ``requests`` response hook counting API calls by endpoint and status.
+
+    Feeds ``bot_api_requests_total{method, endpoint, status}`` and
+    ``bot_api_request_seconds{endpoint}``.
+    """
+    path = urlsplit(response.url).path
+    endpoint = _PATH_IDS.sub(r"\1/{id}", path)
+    counter("bot_api_requests_total", method=response.request.method, endpoint=endpoint,
+            status=str(response.status_code)).inc()
+    histogram("bot_api_request_seconds", endpoint=endpoint).observe(response.elapsed.total_seconds())
+    return response
+
+
+def _labels(items, extra: str = None) -> str:
+    parts = [f'{key}="{value}"' for key, value in items]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    """
+    Renders every metric in the Prometheus text exposition format.
+    """
+    with _metrics_lock:
+        metrics = sorted(_metrics.items())
+    lines = []
+    typed = set()
+    for (name, items), metric in metrics:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {'histogram' if _types[name] is Histogram else 'counter'}")
+        if isinstance(metric, Histogram):
+            with metric._lock:
+                counts, total, count = list(metric.counts), metric.sum, metric.count
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(items, f'le=\"{le}\"')} {cumulative}")
+            lines.append(f"{name}_sum{_labels(items)} {total}")
+            lines.append(f"{name}_count{_labels(items)} {count}")
+        else:
+            lines.append(f"{name}{_labels(items)} {metric.value}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(path: str):
+    """Writes ``render()`` to a file, replacing it atomically."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves ``/metrics`` on a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one.
+        host (str): Interface to listen on.
+    Returns:
+        ThreadingHTTPServer: The server; ``server_address`` holds the bound port.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_dump(path: str, interval: float = DUMP_INTERVAL) -> threading.Thread:
+    """Rewrites the metrics file every ``interval`` seconds on a background thread."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                dump(path)
+            except Exception as e:
+                print(f"[METRICS][ERROR] Dump to {path} failed: {e}")
+    thread = threading.Thread(target=loop, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_from_config():
+    """
+    Starts the metrics endpoint and/or file dump configured through
+    ``ALPACA_METRICS_PORT`` and ``ALPACA_METRICS_FILE``.
+    """
+    port = get_metrics_port()
+    if port is not None:
+        server = serve(port)
+        print(f"[METRICS] Serving on http://127.0.0.1:{server.server_address[1]}/metrics")
+    path = get_metrics_file()
+    if path:
+        start_file_dump(path)
+        print(f"[METRICS] Dumping to {path} every {DUMP_INTERVAL:.0f}s")
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from alpaca.trading.enums import OrderStatus, OrderType, TradeEvent
+from clients import get_trading_client
+import metrics
+
+# Backoff between polls of a market order the stream has not resolved
+POLL_INITIAL = 1.0  # seconds
+POLL_MAX = 30.0  # seconds
+# Trade updates for orders not tracked yet, kept for when the submit response comes back after them
+MAX_EARLY_UPDATES = 1000
+# Resolved orders kept so their futures can still be looked up
+MAX_RESOLVED = 1000
+
+TERMINAL_STATUSES = (OrderStatus.FILLED, OrderStatus.CANCELED, OrderStatus.EXPIRED, OrderStatus.REJECTED,
+                     OrderStatus.REPLACED)
+TERMINAL_EVENTS = (TradeEvent.FILL, TradeEvent.CANCELED, TradeEvent.EXPIRED, TradeEvent.REJECTED,
+                   TradeEvent.REPLACED)
+
+
+class TrackedOrder:
+    """
+    One submitted order until it is filled, cancelled, expired or rejected.
+
+    Attributes:
+        order (Order): Latest known state of the order.
+        filled_qty (float): Quantity filled so far, partial fills included.
+        filled_avg_price (float): Average price of that quantity.
+        future (Future): Resolves with the final ``Order``.
+        next_poll (float): ``time.monotonic()`` of the next fallback poll, None to not poll.
+        poll_delay (float): Current backoff between polls.
+    """
+
+    __slots__ = ("order", "filled_qty", "filled_avg_price", "future", "next_poll", "poll_delay")
+
+    def __init__(self, order, poll: bool):
+        self.order = order
+        self.filled_qty = float(order.filled_qty or 0)
+        self.filled_avg_price = float(order.filled_avg_price) if order.filled_avg_price else None
+        self.future = Future()
+        self.poll_delay = POLL_INITIAL
+        self.next_poll = time.monotonic() + POLL_INITIAL if poll else None
+
+
+class OrderManager:
+    """
+    Tracks submitted orders by client order id and resolves each one to a
+    ``Future`` holding its final state.
+
+    Fills, partial fills, cancels and rejects come from the trade-updates
+    stream the ledger listens to. Market orders the stream has not resolved
+    are also polled with ``get_order_by_client_id``, backing off from
+    ``POLL_INITIAL`` to ``POLL_MAX``, so a missed event costs seconds rather
+    than a reconcile cycle. Limit, stop and OCO orders can work for days and
+    are left to the stream and the ledger's reconcile.
+    """
+
+    def __init__(self):
+        self._orders = {}
+        self._resolved = OrderedDict()
+        self._early = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._poller = None
+
+    def track(self, order) -> Future:
+        """
+        Starts tracking a submitted order.
+
+        Args:
+            order (Order): The order as returned by ``submit_order``.
+        Returns:
+            Future: Resolves with the final ``Order``; already done when the order is.
+        """
+        client_order_id = str(order.client_order_id)
+        poll = order.type == OrderType.MARKET or order.order_type == OrderType.MARKET
+        with self._lock:
+            tracked = self._orders.get(client_order_id) or self._resolved.get(client_order_id)
+            if tracked is not None:
+                return tracked.future
+            tracked = self._orders[client_order_id] = TrackedOrder(order, poll)
+            early = self._early.pop(client_order_id, [])
+        for update in early:
+            self.apply_trade_update(update)
+        if order.status in TERMINAL_STATUSES:
+            self._resolve(client_order_id, order, "response")
+        elif poll:
+            self._start_poller()
+        return tracked.future
+
+    def future(self, order) -> Future:
+        """Returns the future of a tracked order (or client order id), or None."""
+        client_order_id = str(getattr(order, "client_order_id", order))
+        tracked = self._orders.get(client_order_id) or self._resolved.get(client_order_id)
+        return tracked.future if tracked is not None else None
+
+    def get(self, client_order_id: str) -> TrackedOrder:
+        """Returns a tracked order that has not resolved yet, or None."""
+        return self._orders.get(str(client_order_id))
+
+    def apply_trade_update(self, update):
+        """
+        Applies one event from the trade-updates stream.
+
+        Args:
+            update (TradeUpdate): The trade update.
+        """
+        order = update.order
+        client_order_id = str(order.client_order_id)
+        with self._lock:
+            tracked = self._orders.get(client_order_id)
+            if tracked is None:
+                # The stream can beat the submit response; keep the update for track()
+                self._early.setdefault(client_order_id, []).append(update)
+                while len(self._early) > MAX_EARLY_UPDATES:
+                    self._early.popitem(last=False)
+                return
+            tracked.order = order
+            if update.event in (TradeEvent.FILL, TradeEvent.PARTIAL_FILL):
+                tracked.filled_qty = float(order.filled_qty or tracked.filled_qty)
+                if order.filled_avg_price:
+                    tracked.filled_avg_price = float(order.filled_avg_price)
+        if update.event in TERMINAL_EVENTS:
+            self._resolve(client_order_id, order, "stream")
+
+    def _resolve(self, client_order_id: str, order, source: str):
+        with self._lock:
+            tracked = self._orders.pop(client_order_id, None)
+            if tracked is None:
+                return
+            tracked.order = order
+            tracked.next_poll = None
+            self._resolved[client_order_id] = tracked
+            while len(self._resolved) > MAX_RESOLVED:
+                self._resolved.popitem(last=False)
+        metrics.counter("bot_orders_resolved_total", source=source, status=str(order.status.value)).inc()
+        tracked.future.set_result(order)
+
+    def _start_poller(self):
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_forever, name="order-poller", daemon=True)
+                self._poller.start()
+            self._wakeup.notify()
+
+    def _poll_forever(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = [(cid, t) for cid, t in self._orders.items() if t.next_poll is not None and t.next_poll <= now]
+                if not due:
+                    upcoming = [t.next_poll for t in self._orders.values() if t.next_poll is not None]
+                    self._wakeup.wait(min(upcoming) - now if upcoming else None)
+                    continue
+                for _, tracked in due:
+                    tracked.poll_delay = min(tracked.poll_delay * 2, POLL_MAX)
+                    tracked.next_poll = now + tracked.poll_delay
+            for client_order_id, tracked in due:
+                self._poll(client_order_id, tracked)
+
+    def _poll(self, client_order_id: str, tracked: TrackedOrder):
+        try:
+            order = get_trading_client().get_order_by_client_id(client_order_id)
+        except Exception as e:
+            print(f"[ORDERS][WARN] Poll of order {client_order_id} failed: {e}")
+            return
+        with self._lock:
+            tracked.order = order
+            tracked.filled_qty = float(order.filled_qty or 0)
+            if order.filled_avg_price:
+                tracked.filled_avg_price = float(order.filled_avg_price)
+        if order.status in TERMINAL_STATUSES:
+            self._resolve(client_order_id, order, "poll")
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_order_manager() -> OrderManager:
+    """Returns the process-wide order manager."""
+    global _default_manager
+    if _default_manager is None:
+        with _default_manager_lock:
+            if _default_manager is None:
+                _default_manager = OrderManager()
+    return _default_manager
@@ -1,9 +1,6 @@
-from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetOrdersRequest
 from alpaca.trading.enums import OrderSide, QueryOrderStatus
-from config import get_alpaca_api_key, get_alpaca_secret_key
-
-trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
+from clients import get_trading_client
 
 def get_orders(limit:int =100):
     """
@@ -17,7 +14,7 @@ def get_orders(limit:int =100):
         limit=limit,  # Adjust the limit as needed
     )
     
-    orders = trading_client.get_orders(request_params)
+    orders = get_trading_client().get_orders(request_params)
     
     for order in orders:
         return (f"Order ID: {order.id}, Symbol: {order.symbol}, Side: {order.side}, Status: {order.status}, Filled Qty: {order.filled_qty}")
@@ -32,7 +29,7 @@ def cancel_orders(order_ids:list):
     Returns:
         str: Confirmation message of the cancellation.
     """
-    trading_client.cancel_orders()
+    get_trading_client().cancel_orders()
     return f"Order {order_ids} has been cancelled."
 
 def getPositions():
@@ -42,7 +39,7 @@ def getPositions():
     Returns:
         list: A list of current positions.
     """
-    positions = trading_client.get_all_positions()
+    positions = get_trading_client().get_all_positions()
     
     for position in positions:
         return (f"Symbol: {position.symbol}, Qty: {position.qty}, Avg Entry Price: {position.avg_entry_price}, Current Price: {position.current_price}")
@@ -58,7 +55,7 @@ def close_position(symbol):
     Returns:
         str: Confirmation message of the closure.
     """
-    trading_client.close_position(symbol)
+    get_trading_client().close_position(symbol)
     return f"Position for {symbol} has been closed."
 
 def close_all_positions():
@@ -68,5 +65,5 @@ def close_all_positions():
     Returns:
         str: Confirmation message of the closure.
     """
-    trading_client.close_all_positions()
+    get_trading_client().close_all_positions()
     return "All positions have been closed."
\ No newline at end of file
@@ -1,40 +1,80 @@
-from alpaca.trading.client import TradingClient
-from config import get_alpaca_api_key, get_alpaca_secret_key
+import threading
+import time
+from clients import get_trading_client
+from metrics import timed
 
-def getPortfolio_value():
+# How long an account snapshot is reused before get_account is called again
+ACCOUNT_TTL = 2.0  # seconds
+
+_account = None
+_account_time = 0.0
+_account_lock = threading.Lock()
+
+def get_account(max_age: float = ACCOUNT_TTL):
+    """
+    Returns a cached account snapshot, refreshing it once it is older than max_age.
+
+    Args:
+        max_age (float): Maximum snapshot age in seconds. 0 forces a refresh.
+
+    Returns:
+        TradeAccount: The account snapshot.
+    """
+    global _account, _account_time
+    with _account_lock:
+        if _account is None or time.monotonic() - _account_time >= max_age:
+            with timed("account_lookup"):
+                _account = get_trading_client().get_account()
+            _account_time = time.monotonic()
+        return _account
+
+def invalidate_account():
+    """
+    Drops the cached account snapshot. Call after anything that moves cash, such as a fill.
+    """
+    global _account
+    with _account_lock:
+        _account = None
+
+def getPortfolio_value(account=None):
     """
     Fetches the current portfolio value from Alpaca.
-    
+
+    Args:
+        account (TradeAccount): Optional account snapshot to read instead of the cache.
+
     Returns:
         float: The current portfolio value.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    account = trading_client.get_account()
-    
+    account = account or get_account()
+
     return float(account.portfolio_value) if account else 0.0
 
-def getEstimate_value(percentage: float):
+def getEstimate_value(percentage: float, account=None):
     """
     Estimates the portfolio value based on a given percentage.
-    
+
     Args:
         percentage (float): The percentage of the portfolio to estimate.
-        
+        account (TradeAccount): Optional account snapshot to read instead of the cache.
+
     Returns:
         float: The estimated portfolio value.
     """
-    current_value = getPortfolio_value()
+    current_value = getPortfolio_value(account)
     return current_value * (percentage) if current_value else 0.0
 
-def getCash_value():
+def getCash_value(account=None):
     """
     Fetches the current cash value from Alpaca.
-    
+
+    Args:
+        account (TradeAccount): Optional account snapshot to read instead of the cache.
+
     Returns:
         float: The current cash value.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    account = trading_client.get_account()
-    
+    account = account or get_account()
+
     return float(account.cash) if account else 0.0
-    
\ No newline at end of file
+
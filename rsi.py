@@ -1,40 +1,335 @@
+import threading
+import numpy as np
 import pandas as pd
-from alpaca.data.historical import StockHistoricalDataClient
-from alpaca.data.requests import StockBarsRequest
-from alpaca.data.timeframe import TimeFrame
-from config import get_alpaca_api_key, get_alpaca_secret_key
+from barstore import get_bars, get_bars_multi
+from metrics import timed
 from ta.momentum import RSIIndicator
 from datetime import datetime, timedelta
 
+
+class WilderRSI:
+    """
+    Incremental Wilder RSI for a single symbol.
+
+    Keeps the smoothed average gain and loss so every new bar is an O(1) update
+    instead of a full recomputation. Smoothing and warm-up follow
+    ``ta.momentum.RSIIndicator`` exactly (``ewm(alpha=1/period, adjust=False)``
+    with ``min_periods=period``), so the values match it to float precision.
+
+    Args:
+        period (int): RSI window length.
+    """
+
+    __slots__ = (
+        "period", "alpha", "avg_gain", "avg_loss", "count", "last_close",
+        "last_timestamp", "rsi_now", "rsi_prev", "_undo",
+    )
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.alpha = 1.0 / period
+        self.reset()
+
+    def reset(self):
+        """Forget all history."""
+        self.avg_gain = None
+        self.avg_loss = None
+        self.count = 0
+        self.last_close = None
+        self.last_timestamp = None
+        self.rsi_now = None
+        self.rsi_prev = None
+        self._undo = None
+
+    def dump(self) -> dict:
+        """
+        The state as plain values, for persisting. Timestamps become UTC nanoseconds.
+        """
+        return {
+            "avg_gain": self.avg_gain, "avg_loss": self.avg_loss, "count": self.count,
+            "last_close": self.last_close,
+            "last_timestamp": None if self.last_timestamp is None else pd.Timestamp(self.last_timestamp).value,
+            "rsi_now": self.rsi_now, "rsi_prev": self.rsi_prev,
+            "undo": None if self._undo is None else list(self._undo),
+        }
+
+    @classmethod
+    def load(cls, period: int, state: dict):
+        """
+        Rebuilds an RSI from ``dump()`` output.
+
+        Args:
+            period (int): RSI window length.
+            state (dict): The dumped state.
+        Returns:
+            WilderRSI: The restored RSI.
+        """
+        rsi = cls(period)
+        rsi.avg_gain = state["avg_gain"]
+        rsi.avg_loss = state["avg_loss"]
+        rsi.count = state["count"]
+        rsi.last_close = state["last_close"]
+        if state["last_timestamp"] is not None:
+            rsi.last_timestamp = pd.Timestamp(state["last_timestamp"], tz="UTC")
+        rsi.rsi_now = state["rsi_now"]
+        rsi.rsi_prev = state["rsi_prev"]
+        rsi._undo = None if state["undo"] is None else tuple(state["undo"])
+        return rsi
+
+    @property
+    def ready(self) -> bool:
+        """True once both ``rsi_now`` and ``rsi_prev`` are available."""
+        return self.rsi_now is not None and self.rsi_prev is not None
+
+    def seed(self, closes, timestamps=None):
+        """
+        Rebuild the state from a full close-price history.
+
+        Args:
+            closes: Iterable of close prices, oldest first.
+            timestamps: Optional matching iterable of bar timestamps.
+        Returns:
+            WilderRSI: self, for chaining.
+        """
+        self.reset()
+        if timestamps is None:
+            for close in closes:
+                self.update(close)
+        else:
+            for close, ts in zip(closes, timestamps):
+                self.update(close, ts)
+        return self
+
+    def update(self, close: float, timestamp=None):
+        """
+        Feed one bar close.
+
+        A bar with the same timestamp as the previous one is treated as a
+        revision of that bar (e.g. the in-progress minute) and replaces it.
+
+        Args:
+            close (float): The bar close price.
+            timestamp: Optional bar timestamp.
+        Returns:
+            float | None: The latest RSI, or None while warming up.
+        """
+        if timestamp is not None and self.last_timestamp is not None:
+            if timestamp == self.last_timestamp and self._undo is not None:
+                (self.avg_gain, self.avg_loss, self.count, self.last_close,
+                 self.rsi_now, self.rsi_prev) = self._undo
+            elif timestamp < self.last_timestamp:
+                return self.rsi_now
+
+        self._undo = (self.avg_gain, self.avg_loss, self.count, self.last_close,
+                      self.rsi_now, self.rsi_prev)
+        close = float(close)
+        self.last_timestamp = timestamp
+
+        # RSIIndicator fills the undefined first diff with 0, so the first bar
+        # counts as a flat observation
+        diff = 0.0 if self.last_close is None else close - self.last_close
+        self.last_close = close
+        gain = diff if diff > 0 else 0.0
+        loss = -diff if diff < 0 else 0.0
+
+        if self.count == 0:
+            self.avg_gain = gain
+            self.avg_loss = loss
+        else:
+            self.avg_gain += self.alpha * (gain - self.avg_gain)
+            self.avg_loss += self.alpha * (loss - self.avg_loss)
+        self.count += 1
+
+        self.rsi_prev = self.rsi_now
+        if self.count < self.period:
+            self.rsi_now = None
+        elif self.avg_loss == 0:
+            self.rsi_now = 100.0
+        else:
+            self.rsi_now = 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+        return self.rsi_now
+
+
+def _smooth(values: np.ndarray, alpha: float, block: int = 64) -> np.ndarray:
+    """
+    Row-wise ``y[t] = y[t-1] + alpha * (x[t] - y[t-1])`` with ``y[-1] = 0``.
+
+    The time axis is scanned in blocks: inside a block every output is a fixed
+    weighted sum of the block's inputs plus the decayed carry-in, so each block
+    is one matrix product over all symbols instead of ``block`` Python steps.
+    """
+    n_symbols, n_bars = values.shape
+    decay = 1.0 - alpha
+    lags = np.arange(block)
+    # weights[j, k] = alpha * decay**(k - j) for j <= k, else 0
+    weights = np.triu(alpha * decay ** (lags[None, :] - lags[:, None]).clip(min=0))
+    carry_decay = decay ** (lags + 1)
+
+    out = np.empty_like(values)
+    carry = np.zeros(n_symbols)
+    for start in range(0, n_bars, block):
+        stop = min(start + block, n_bars)
+        width = stop - start
+        out[:, start:stop] = values[:, start:stop] @ weights[:width, :width] + carry[:, None] * carry_decay[:width]
+        carry = out[:, stop - 1]
+    return out
+
+
+def rsi_matrix(closes, period: int = 14, mask=None) -> np.ndarray:
+    """
+    Computes Wilder RSI for every symbol of an aligned close-price matrix in one pass.
+
+    All symbols are processed together with whole-array operations, so no
+    per-symbol DataFrame or ``ta`` call is needed. Missing bars (NaN closes, or
+    False in ``mask``) are skipped: each row gives the same values
+    ``RSIIndicator`` would over that symbol's present bars only.
+
+    Args:
+        closes (array-like): Close prices shaped (symbols, bars), oldest first.
+        period (int): RSI window length.
+        mask (array-like): Optional bool array of the same shape, True where a bar exists.
+    Returns:
+        numpy.ndarray: RSI shaped (symbols, bars), NaN while warming up and at missing bars.
+    """
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    present = ~np.isnan(closes)
+    if mask is not None:
+        present &= np.asarray(mask, dtype=bool)
+    n_symbols, n_bars = closes.shape
+
+    # Pack each symbol's present bars to the left so the recurrence runs on a
+    # dense matrix; the trailing padding is never read back
+    order = np.argsort(~present, axis=1, kind="stable")
+    n_present = present.sum(axis=1)
+    columns = np.arange(n_bars)[None, :]
+    packed_present = columns < n_present[:, None]
+    packed = np.take_along_axis(closes, order, axis=1)
+
+    # The first bar is a flat observation, as in RSIIndicator
+    diff = np.zeros_like(packed)
+    np.subtract(packed[:, 1:], packed[:, :-1], out=diff[:, 1:])
+    np.copyto(diff, 0.0, where=~packed_present)
+    gain = np.maximum(diff, 0.0)
+    avg_gain = _smooth(gain, 1.0 / period)
+    avg_loss = _smooth(np.subtract(gain, diff, out=diff), 1.0 / period)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.divide(avg_gain, avg_gain + avg_loss, out=gain)
+        rsi *= 100.0
+    np.copyto(rsi, 100.0, where=avg_loss == 0)
+    np.copyto(rsi, np.nan, where=~packed_present | (columns < period - 1))
+
+    out = np.empty_like(rsi)
+    np.put_along_axis(out, order, rsi, axis=1)
+    return out
+
+
+def latest_rsi_pair(rsi: np.ndarray):
+    """
+    Picks each symbol's last two valid values from an ``rsi_matrix`` result.
+
+    Args:
+        rsi (numpy.ndarray): RSI shaped (symbols, bars).
+    Returns:
+        tuple: (rsi_now, rsi_prev) arrays, NaN where a symbol has fewer valid values.
+    """
+    valid = ~np.isnan(rsi)
+    rows = np.arange(rsi.shape[0])
+    columns = np.arange(rsi.shape[1])
+    now_col = np.where(valid, columns, -1).max(axis=1, initial=-1)
+    has_now = now_col >= 0
+    valid[rows[has_now], now_col[has_now]] = False
+    prev_col = np.where(valid, columns, -1).max(axis=1, initial=-1)
+
+    rsi_now = np.where(has_now, rsi[rows, now_col], np.nan)
+    rsi_prev = np.where(prev_col >= 0, rsi[rows, prev_col], np.nan)
+    return rsi_now, rsi_prev
+
+
+def align_closes(bars_by_symbol: dict):
+    """
+    Aligns per-symbol bars (e.g. from ``get_bars_multi``) into a close matrix.
+
+    Args:
+        bars_by_symbol (dict): Symbol to bars DataFrame indexed by timestamp, or None.
+    Returns:
+        tuple: (symbols, timestamps, closes) where closes is shaped
+        (symbols, timestamps) with NaN for bars a symbol does not have.
+    """
+    symbols = [symbol for symbol, bars in bars_by_symbol.items() if bars is not None and not bars.empty]
+    stamps = [pd.DatetimeIndex(bars_by_symbol[symbol].index).as_unit("ns").asi8 for symbol in symbols]
+    timestamps = np.unique(np.concatenate(stamps)) if stamps else np.empty(0, dtype=np.int64)
+
+    closes = np.full((len(symbols), len(timestamps)), np.nan)
+    for row, (symbol, ts) in enumerate(zip(symbols, stamps)):
+        closes[row, np.searchsorted(timestamps, ts)] = bars_by_symbol[symbol]['close'].to_numpy()
+    return symbols, pd.to_datetime(timestamps, unit="ns", utc=True), closes
+
+
+# Minute bar history a new RSI state is seeded from
+SEED_DAYS = 10
+# Widest gap between the last bars of symbols caught up in one batch
+CATCH_UP_SPREAD = pd.Timedelta(minutes=30)
+
+# Per-(symbol, period) incremental RSI state shared by update_rsi callers.
+_rsi_states = {}
+# Held while update_rsi_multi seeds or advances states, so dump_rsi_states never sees one half-updated
+_rsi_lock = threading.Lock()
+
+
+def get_rsi_state(symbol: str, period: int = 14):
+    """
+    Returns the cached incremental RSI state for a symbol without fetching anything.
+
+    Returns:
+        WilderRSI | None: The state, or None if the symbol has not been seeded yet.
+    """
+    return _rsi_states.get((symbol, period))
+
+
+def get_rsi_states() -> dict:
+    """Returns a copy of every cached incremental RSI state, keyed by (symbol, period)."""
+    return dict(_rsi_states)
+
+
+def dump_rsi_states() -> dict:
+    """
+    Dumps every cached incremental RSI state, consistent with concurrent ``update_rsi_multi`` calls.
+
+    Returns:
+        dict: (symbol, period) to ``WilderRSI.dump()`` output.
+    """
+    with _rsi_lock:
+        return {key: state.dump() for key, state in _rsi_states.items()}
+
+
+def set_rsi_state(symbol: str, period: int, state: WilderRSI):
+    """Installs an incremental RSI state, e.g. one restored from a snapshot."""
+    _rsi_states[(symbol, period)] = state
+
+
 def get_rsi(symbol: str, period: int = 14, latest_only: bool = False):
     """
     Fetches RSI data for a given stock symbol using Alpaca's historical bars.
+
+    Bars are read from the local bar store, which only fetches bars newer than
+    the last stored one.
     """
     try:
-        client = StockHistoricalDataClient(get_alpaca_api_key(), get_alpaca_secret_key())
         end = datetime.utcnow()
         start = end - timedelta(days=10)
 
-        request = StockBarsRequest(
-            symbol_or_symbols=symbol,
-            start=start.isoformat() + "Z",
-            end=end.isoformat() + "Z",
-            timeframe=TimeFrame.Minute
-        )
-        bars = client.get_stock_bars(request).df
-
-        if bars.empty:
-            return None
-
-        # Filter for just this symbol if multi-symbol returned
-        if symbol not in bars.index.get_level_values(0):
+        with timed("bar_fetch"):
+            bars = get_bars(symbol, start, end)
+        if bars is None:
             return None
 
-        bars = bars.loc[symbol].reset_index()
+        bars = bars.reset_index()
         if 'close' not in bars.columns or len(bars) < period + 1:
             return None
 
-        bars['rsi'] = RSIIndicator(bars['close'], window=period).rsi()
+        with timed("rsi_compute"):
+            bars['rsi'] = RSIIndicator(bars['close'], window=period).rsi()
 
         if latest_only:
             latest_rsi = bars['rsi'].iloc[-1]
@@ -45,3 +340,90 @@ def get_rsi(symbol: str, period: int = 14, latest_only: bool = False):
     except Exception as e:
         print(f"[ERROR] Failed to fetch RSI for {symbol}: {e}")
         return None
+
+
+def _catch_up_groups(states: dict, symbols: list) -> list:
+    """
+    Splits symbols into batches whose last bars lie within ``CATCH_UP_SPREAD``
+    of each other, so one symbol far behind does not widen the fetch of all.
+    """
+    symbols = sorted(symbols, key=lambda symbol: states[symbol].last_timestamp, reverse=True)
+    groups = []
+    for symbol in symbols:
+        if not groups or states[groups[-1][0]].last_timestamp - states[symbol].last_timestamp > CATCH_UP_SPREAD:
+            groups.append([])
+        groups[-1].append(symbol)
+    return groups
+
+
+def update_rsi_multi(symbols, period: int = 14) -> dict:
+    """
+    Brings the incremental RSI state of many symbols up to date in batches.
+
+    Symbols seen for the first time are seeded from SEED_DAYS of minute bars;
+    the others only read bars from their last seen timestamp onwards and apply
+    them in O(1) each, batched by ``_catch_up_groups``. Bars come from the
+    local bar store in batched requests, which fetch only what the store is
+    missing.
+
+    A batch whose fetch fails is reported and its symbols map to None, so
+    callers skip them rather than trade on a stale RSI; their states catch
+    up on the next call.
+
+    Args:
+        symbols (list): The stock symbols.
+        period (int): RSI window length.
+    Returns:
+        dict: Symbol to its up-to-date WilderRSI, or None if no data is available.
+    """
+    states = {symbol: _rsi_states.get((symbol, period)) for symbol in symbols}
+    end = datetime.utcnow()
+    new = [symbol for symbol, state in states.items() if state is None or state.last_timestamp is None]
+    known = [symbol for symbol in symbols if symbol not in new]
+
+    if new:
+        try:
+            with timed("bar_fetch"):
+                seed_bars = get_bars_multi(new, end - timedelta(days=SEED_DAYS), end)
+            with timed("rsi_compute"), _rsi_lock:
+                for symbol, bars in seed_bars.items():
+                    if bars is None or 'close' not in bars.columns:
+                        continue
+                    states[symbol] = WilderRSI(period).seed(bars['close'].to_numpy(), bars.index)
+                    _rsi_states[(symbol, period)] = states[symbol]
+        except Exception as e:
+            print(f"[ERROR] Failed to seed RSI for {new}: {e}")
+            states.update(dict.fromkeys(new))
+    for group in _catch_up_groups(states, known):
+        try:
+            # Re-read each last bar too so a revised in-progress minute is picked up
+            start = min(states[symbol].last_timestamp for symbol in group)
+            with timed("bar_fetch"):
+                new_bars = get_bars_multi(group, start, end)
+            with timed("rsi_compute"), _rsi_lock:
+                for symbol, bars in new_bars.items():
+                    if bars is None:
+                        continue
+                    state = states[symbol]
+                    bars = bars[bars.index >= state.last_timestamp]
+                    for ts, close in zip(bars.index, bars['close'].to_numpy()):
+                        state.update(close, ts)
+        except Exception as e:
+            print(f"[ERROR] Failed to update RSI for {group}: {e}")
+            states.update(dict.fromkeys(group))
+    return states
+
+
+def update_rsi(symbol: str, period: int = 14):
+    """
+    Returns the incremental RSI state for a symbol, bringing it up to date.
+
+    See ``update_rsi_multi``.
+
+    Args:
+        symbol (str): The stock symbol.
+        period (int): RSI window length.
+    Returns:
+        WilderRSI | None: The up-to-date state, or None if no data is available.
+    """
+    return update_rsi_multi([symbol], period)[symbol]
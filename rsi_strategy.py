@@ -1,16 +1,28 @@
-from marketdata import get_latest_price
+from marketdata import get_latest_prices
+from config import get_universe
+from screener import UniverseScreener, resolve_universe
 from trades import (
     percent_market_buy,
     market_sell,
-    get_position_qty,
     percent_market_buy_crypto,
     market_sell_crypto,
-    get_crypto_position_qty,
+    oco_sell,
+    cancel_exit_orders,
+    exit_order_ids,
 )
-from rsi import get_rsi
+from ledger import get_ledger
+from order_manager import get_order_manager
+from snapshot import get_snapshot
+from market_calendar import get_market_calendar, EndOfDayTimer
+from runners import StrategyRunner
+from tracing import start_trace
+import metrics
+from metrics import timed
+from rsi import update_rsi_multi
+from features import update_features_multi
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
-from datetime import datetime, timedelta
-import pytz
 
 # === Strategy Parameters ===
 TICKERS = [
@@ -22,57 +34,128 @@ OVERSOLD = 20
 OVERBOUGHT = 80
 STOP_LOSS_PCT = 2.5
 TAKE_PROFIT_PCT = 1.0
+BRACKET_EXITS = True  # Take profit/stop loss as broker-side bracket/OCO orders instead of polling
 TRADE_PERCENTAGE = 1.5  # 150% per position
 MAX_POSITIONS = 2  # Matches 50% per position
 CHECK_INTERVAL = 1.0  # seconds
-
-# === Position Tracking per Ticker ===
-positions = {symbol: {"open": False, "entry_price": None, "entry_time": None, "qty": 0} for symbol in TICKERS}
+MAX_WORKERS = 8  # symbols evaluated concurrently
+SHORTLIST_SIZE = 12  # symbols of a screened universe (config.get_universe) evaluated each pass
+
+# === Position Tracking ===
+# Stocks and crypto share one ledger fed by Alpaca trade updates
+ledger = get_ledger()
+
+# Serializes position-cap checks and position updates across worker threads
+positions_lock = threading.RLock()
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="rsi-strategy")
+
+# Pre-screens a large universe down to SHORTLIST_SIZE symbols; None trades TICKERS as is
+screener = None
+
+def start_screener():
+    """Starts screening the configured universe, if any, in the background."""
+    global screener
+    universe = get_universe()
+    if universe and screener is None:
+        screener = UniverseScreener(resolve_universe(universe), SHORTLIST_SIZE)
+        print(f"[SCREENER] Screening {len(screener.universe)} symbols every {screener.interval:.0f}s")
+        screener.start()
+    return screener
+
+def held_stocks():
+    """Stocks of the traded universe with an open or pending position."""
+    if screener is None:
+        return [symbol for symbol in TICKERS if ledger.get(symbol) is not None]
+    return [position.symbol for position in ledger.positions() if position.symbol in screener.members]
+
+def stock_symbols():
+    """Stocks to evaluate: the screener's shortlist plus held positions, or TICKERS without a screener."""
+    if screener is None:
+        return TICKERS
+    return list(dict.fromkeys(screener.shortlist() + held_stocks()))
 
 def count_open_positions():
-    return sum(1 for symbol in positions if positions[symbol]["open"])
+    return len(held_stocks())
 
 def is_market_open():
-    """Check if US market is currently open, excluding first 30 min and last 15 min."""
-    eastern = pytz.timezone("US/Eastern")
-    now_eastern = datetime.now(eastern)
-    
-    # Check if weekend
-    if now_eastern.weekday() >= 5:  # Saturday = 5, Sunday = 6
-        return False
-    
-    # Market hours (9:30 AM - 4:00 PM ET)
-    market_open = now_eastern.replace(hour=9, minute=30, second=0, microsecond=0)
-    market_close = now_eastern.replace(hour=16, minute=0, second=0, microsecond=0)
-    # Restrict first 30 min and last 15 min
-    restricted_start = now_eastern.replace(hour=10, minute=0, second=0, microsecond=0)
-    restricted_end = now_eastern.replace(hour=15, minute=45, second=0, microsecond=0)
-    return restricted_start <= now_eastern < restricted_end
+    """Check if inside today's trading window per Alpaca's calendar: 30 min after the open to 15 min before the close."""
+    return get_market_calendar().in_window()
 
 def close_all_positions():
-    """Close all open positions at end of day"""
-    for symbol in TICKERS:
-        if positions[symbol]["open"]:
-            print(f"End of day: Closing position in {symbol}")
-            result = market_sell(symbol)
-            if result:
-                positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
+    """
+    Close all open positions at end of day.
+
+    A failed close is reported and the other symbols are still closed.
+
+    Returns:
+        bool: Whether the ledger shows no stock positions left. Sells still
+            working count as not flat yet, so the caller retries.
+    """
+    with positions_lock:
+        for symbol in held_stocks():
+            position = ledger.get(symbol)
+            if position is None or position.pending is not None:
+                continue
+            try:
+                print(f"End of day: Closing position in {symbol}")
+                sell_position(symbol, position)
+            except Exception as e:
+                print(f"[ERROR] End of day close failed for {symbol}: {e}")
+    return not held_stocks()
+
+def sell_position(symbol, position, trace=None):
+    """
+    Sells a held stock position at market, first cancelling its exits at the broker.
+
+    The sell waits until the broker confirms the exits are cancelled, since
+    until then they hold the shares. If an exit filled meanwhile, only what
+    the broker still holds is sold, so a filled exit never turns into a short.
+
+    Returns:
+        Order | None: The sell order, or None when nothing was sold.
+    """
+    qty = int(position.qty) or None
+    if position.exit_orders:
+        filled = cancel_exit_orders(position.exit_orders)
+        if filled is None:
+            print(f"[WARN] {symbol}: Exit orders not cancelled yet, not selling this pass")
+            return None
+        if filled:
+            print(f"{symbol}: Exit orders filled {filled:g} shares before the cancel, selling the rest")
+            qty = None
+    result = market_sell(symbol, qty, trace=trace)
+    if result:
+        ledger.close_pending(symbol, result.id)
+        watch_order(result)
+    return result
+
+def watch_order(order):
+    """Applies an order's final state to the ledger once it resolves, in case its trade updates were missed."""
+    def on_done(done):
+        resolved = done.result()
+        print(f"[ORDERS] {resolved.symbol} {resolved.side.value} {resolved.status.value}: "
+              f"{resolved.filled_qty} @ {resolved.filled_avg_price}")
+        ledger.apply_order(resolved)
+    future = get_order_manager().future(order)
+    if future is not None:
+        future.add_done_callback(on_done)
+
+def attach_exit_orders(symbol, position):
+    """Put a stock position's take profit and stop loss at the broker as an OCO pair."""
+    try:
+        order = oco_sell(symbol, int(position.qty), position.avg_entry_price, TAKE_PROFIT_PCT, STOP_LOSS_PCT)
+        ledger.set_exit_orders(symbol, exit_order_ids(order))
+        print(f"{symbol}: Take profit/stop loss exits placed at the broker")
+    except Exception as e:
+        # Stays on client-side TP/SL checks
+        print(f"[WARN] Could not place exits for {symbol}, checking TP/SL locally: {e}")
+        ledger.set_exit_orders(symbol, None)
 
 def sync_positions():
     """Sync our position tracking with actual Alpaca positions"""
-    for symbol in TICKERS:
-        actual_qty = get_position_qty(symbol)
-        if actual_qty > 0 and not positions[symbol]["open"]:
-            # We have shares but our tracker says we don't
-            print(f"Found untracked position in {symbol}: {actual_qty} shares")
-            positions[symbol]["open"] = True
-            positions[symbol]["qty"] = actual_qty
-            # We don't know the entry price, so we'll use current price
-            positions[symbol]["entry_price"] = get_latest_price(symbol)
-        elif actual_qty == 0 and positions[symbol]["open"]:
-            # Our tracker says we have shares but we don't
-            print(f"Position in {symbol} was closed externally")
-            positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
+    # Trade updates keep the ledger current; this only reconciles it periodically
+    with timed("position_sync"):
+        ledger.sync()
 
 # === Crypto Strategy Parameters ===
 CRYPTO_TICKERS = ['LINK/USD', 'ETH/USD', 'BCH/USD', 'AAVE/USD']
@@ -80,12 +163,19 @@ CRYPTO_RSI_LENGTH = 14
 CRYPTO_RSI_BUY = 14
 CRYPTO_TRADE_PERCENTAGE = 1.0  # 100% per position
 CRYPTO_MAX_POSITIONS = 1
+CRYPTO_STOP_LOSS_PCT = 1.0  # exits of positions held past a trading window
+CRYPTO_TAKE_PROFIT_PCT = 2.0
+CRYPTO_CHECK_INTERVAL = 1.0  # seconds, around the clock
 
-# === Position Tracking per Crypto Ticker ===
-crypto_positions = {symbol: {"open": False, "entry_price": None, "entry_time": None, "qty": 0} for symbol in CRYPTO_TICKERS}
+# Crypto passes get their own workers so a long stock pass never delays them
+crypto_executor = ThreadPoolExecutor(max_workers=len(CRYPTO_TICKERS), thread_name_prefix="rsi-crypto")
 
 def count_open_crypto_positions():
-    return sum(1 for symbol in crypto_positions if crypto_positions[symbol]["open"])
+    return ledger.count(CRYPTO_TICKERS)
+
+def held_crypto():
+    """Crypto pairs with an open or pending position."""
+    return [symbol for symbol in CRYPTO_TICKERS if ledger.get(symbol) is not None]
 
 def get_crypto_trade_window_and_params(now_eastern):
     weekday = now_eastern.weekday()  # Monday=0, Sunday=6
@@ -112,208 +202,346 @@ def get_crypto_trade_window_and_params(now_eastern):
     else:
         return False, None, None  # Not in trading window
 
+def get_crypto_rules(now_eastern):
+    """
+    The crypto rules in force at now_eastern.
+
+    Entries are only taken inside ``get_crypto_trade_window_and_params``'
+    windows; positions still open outside them keep their take profit and
+    stop loss managed at ``CRYPTO_TAKE_PROFIT_PCT``/``CRYPTO_STOP_LOSS_PCT``.
+
+    Returns:
+        tuple: (entries allowed, stop loss %, take profit %).
+    """
+    trading, stop_loss_pct, take_profit_pct = get_crypto_trade_window_and_params(now_eastern)
+    if trading:
+        return True, stop_loss_pct, take_profit_pct
+    return False, CRYPTO_STOP_LOSS_PCT, CRYPTO_TAKE_PROFIT_PCT
+
+# === Per-Symbol Rules ===
+def feature_values(features):
+    """A symbol's feature values (see ``features.SymbolFeatures.values``), or None without bars."""
+    return None if features is None else features.values()
+
+def _features_str(features):
+    """The status line's EMA, VWAP and ATR, leaving out those still warming up."""
+    if not features:
+        return ""
+    parts = []
+    for name, label, fmt in (("ema_20", "EMA20", "${:.2f}"), ("vwap", "VWAP", "${:.2f}"), ("atr_14", "ATR", "{:.2f}")):
+        if features.get(name) is not None:
+            parts.append(f", {label}={fmt.format(features[name])}")
+    return "".join(parts)
+
+def evaluate_stock(symbol, rsi_now, rsi_prev, latest_price, now_eastern, bar_time=None, received_at=None,
+                   features=None):
+    """
+    Apply the exit and entry rules to one stock given its latest RSI values and price.
+
+    bar_time (start of the bar behind rsi_now) and received_at (epoch ns the
+    data arrived) start the tick-to-trade trace of any order sent. features
+    (name to value, see ``feature_values``) are reported in the status line;
+    the rules only use RSI and price.
+    """
+    current_time_str = now_eastern.strftime("%Y-%m-%d %H:%M")
+    if latest_price is None:
+        print(f"[WARN] No price for {symbol}, skipping.")
+        return
+
+    position = ledger.get(symbol)
+
+    # === Exit Signal (TP/SL/Overbought) ===
+    # Positions with an order still working are left alone until it fills
+    if position is not None and position.pending is None:
+        entry = position.avg_entry_price
+        if entry is None or entry == 0:
+            print(f"[WARN] Invalid entry price for {symbol}, skipping exit check.")
+            return
+
+        change_pct = (latest_price - entry) / entry * 100
+
+        # Take profit and stop loss are working at the broker; only the RSI exit is ours
+        if position.exit_orders:
+            if rsi_now >= OVERBOUGHT:
+                print(f"{symbol}: RSI overbought ({rsi_now:.2f}). Cancelling exits and selling...")
+                sell_position(symbol, position, trace=start_trace(symbol, "sell", bar_time, received_at))
+                return
+
+        # Take Profit
+        elif change_pct >= TAKE_PROFIT_PCT:
+            print(f"{symbol}: Take Profit hit (+{change_pct:.2f}%). Selling...")
+            result = market_sell(symbol, int(position.qty) or None,
+                                 trace=start_trace(symbol, "sell", bar_time, received_at))
+            if result:
+                ledger.close_pending(symbol, result.id)
+                watch_order(result)
+            return
+
+        # Stop Loss
+        elif change_pct <= -STOP_LOSS_PCT:
+            print(f"{symbol}: Stop Loss hit ({change_pct:.2f}%). Selling...")
+            result = market_sell(symbol, int(position.qty) or None,
+                                 trace=start_trace(symbol, "sell", bar_time, received_at))
+            if result:
+                ledger.close_pending(symbol, result.id)
+                watch_order(result)
+            return
+
+        # Overbought Exit
+        elif rsi_now >= OVERBOUGHT:
+            print(f"{symbol}: RSI overbought ({rsi_now:.2f}). Selling...")
+            result = market_sell(symbol, int(position.qty) or None,
+                                 trace=start_trace(symbol, "sell", bar_time, received_at))
+            if result:
+                ledger.close_pending(symbol, result.id)
+                watch_order(result)
+            return
+
+        # Held without broker-side exits, e.g. opened before a restart
+        elif BRACKET_EXITS and position.exit_orders is not None and int(position.qty) > 0:
+            attach_exit_orders(symbol, position)
+
+    print(f"{symbol}: rsi_prev={rsi_prev}, rsi_now={rsi_now}, open={position is not None}, open_positions={count_open_positions()}")
+
+    # === Entry Signal ===
+    # Cap check, order and tracker update are atomic across worker threads. The
+    # window is checked again under the lock: the end-of-day flatten holds it, and a
+    # pass that started before the window ended must not open a position after it
+    with positions_lock:
+        if (ledger.get(symbol) is None and 
+            rsi_prev < OVERSOLD and 
+            rsi_now >= OVERSOLD and
+            count_open_positions() < MAX_POSITIONS and
+            is_market_open()):
+
+            print(f"{symbol}: RSI crossed above {OVERSOLD} ({rsi_now:.2f}). Buying...")
+            exit_pcts = dict(take_profit_pct=TAKE_PROFIT_PCT, stop_loss_pct=STOP_LOSS_PCT) if BRACKET_EXITS else {}
+            order = percent_market_buy(symbol, TRADE_PERCENTAGE, price=latest_price,
+                                       trace=start_trace(symbol, "buy", bar_time, received_at), **exit_pcts)
+
+            if order:
+                # Quantity and average price come from the fill's trade update
+                print(f"Order executed: {order}")
+                ledger.open_pending(symbol, latest_price, now_eastern, order.id, exit_order_ids(order))
+                watch_order(order)
+            return
+
+    # Status update
+    if position is not None:
+        entry = position.avg_entry_price
+        entry_str = f"${entry:.2f}" if entry else "N/A"
+        change_pct = (latest_price - entry) / entry * 100 if entry else 0
+        print(f"{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}{_features_str(features)}, Entry={entry_str}, P&L={change_pct:+.2f}%, Qty={position.qty}, Time={current_time_str}")
+    else:
+        print(f"{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}{_features_str(features)}, No Position, Time={current_time_str}")
+
+def update_stock_rsi(symbols):
+    """
+    Brings the stock RSI states of symbols up to date.
+
+    Symbols entering the shortlist may be hours behind; ``update_rsi_multi``
+    batches them apart from the others.
+
+    Returns:
+        dict: Symbol to its WilderRSI, or None if no data is available.
+    """
+    return update_rsi_multi(symbols, RSI_LENGTH)
+
+def update_features(symbols):
+    """
+    Brings the feature pipeline of symbols up to date from the bars their RSI
+    update just stored, without another fetch.
+
+    Returns:
+        dict: Symbol to its SymbolFeatures, or None if no data is available.
+    """
+    return update_features_multi(symbols, fetch=False)
+
+@timed("stock_pass")
+def run_stock_pass(now_eastern):
+    """Evaluate every stock in ``stock_symbols()`` once."""
+    # Sync positions every iteration
+    sync_positions()
+
+    # Batched bar and quote round trips for all evaluated symbols
+    symbols = stock_symbols()
+    rsi_states = update_stock_rsi(symbols)
+    features = update_features(symbols)
+    latest_prices = get_latest_prices(symbols)
+    received_at = time.time_ns()
+
+    def evaluate(symbol):
+        try:
+            rsi_state = rsi_states.get(symbol)
+            if rsi_state is None or not rsi_state.ready:
+                return
+            evaluate_stock(symbol, rsi_state.rsi_now, rsi_state.rsi_prev, latest_prices.get(symbol), now_eastern,
+                           rsi_state.last_timestamp, received_at, feature_values(features.get(symbol)))
+
+        except Exception as stock_error:
+            print(f"[ERROR] Failed for {symbol}: {stock_error}")
+
+    # Order round trips overlap across symbols; wait for all before the summary
+    for future in [executor.submit(evaluate, symbol) for symbol in symbols]:
+        future.result()
+
+    print(f"Open positions: {count_open_positions()}/{MAX_POSITIONS}")
+    print("-" * 50)
+
+def evaluate_crypto(symbol, rsi_now, rsi_prev, latest_price, now_eastern, stop_loss_pct, take_profit_pct,
+                    bar_time=None, received_at=None, entries=True, features=None):
+    """
+    Apply the crypto exit and entry rules to one symbol given its latest RSI values and price.
+
+    bar_time, received_at and features are used as in evaluate_stock. With
+    entries False only the exit rules apply (see ``get_crypto_rules``).
+    """
+    current_time_str = now_eastern.strftime("%Y-%m-%d %H:%M")
+    if latest_price is None:
+        print(f"[CRYPTO][WARN] No price for {symbol}, skipping.")
+        return
+
+    position = ledger.get(symbol)
+
+    # === Exit Signal (TP/SL) ===
+    # Alpaca takes no bracket/OCO orders for crypto, so these stay client-side
+    if position is not None and position.pending is None:
+        entry = position.avg_entry_price
+        if entry is None or entry == 0:
+            print(f"[CRYPTO][WARN] Invalid entry price for {symbol}, skipping exit check.")
+            return
+
+        change_pct = (latest_price - entry) / entry * 100
+
+        # Take Profit
+        if change_pct >= take_profit_pct:
+            print(f"[CRYPTO]{symbol}: Take Profit hit (+{change_pct:.2f}%). Selling...")
+            result = market_sell_crypto(symbol, position.qty or None,
+                                        trace=start_trace(symbol, "sell", bar_time, received_at))
+            if result:
+                ledger.close_pending(symbol, result.id)
+                watch_order(result)
+            return
+
+        # Stop Loss
+        elif change_pct <= -stop_loss_pct:
+            print(f"[CRYPTO]{symbol}: Stop Loss hit ({change_pct:.2f}%). Selling...")
+            result = market_sell_crypto(symbol, position.qty or None,
+                                        trace=start_trace(symbol, "sell", bar_time, received_at))
+            if result:
+                ledger.close_pending(symbol, result.id)
+                watch_order(result)
+            return
+
+    # === Entry Signal ===
+    # Cap check, order and tracker update are atomic across worker threads
+    with positions_lock:
+        if (
+            entries
+            and ledger.get(symbol) is None
+            and rsi_prev < CRYPTO_RSI_BUY
+            and rsi_now >= CRYPTO_RSI_BUY
+            and count_open_crypto_positions() < CRYPTO_MAX_POSITIONS
+        ):
+            print(f"[CRYPTO]{symbol}: RSI crossed above {CRYPTO_RSI_BUY} ({rsi_now:.2f}). Buying...")
+            order = percent_market_buy_crypto(symbol, CRYPTO_TRADE_PERCENTAGE, price=latest_price,
+                                              trace=start_trace(symbol, "buy", bar_time, received_at))
+            if order:
+                print(f"[CRYPTO] Order executed: {order}")
+                ledger.open_pending(symbol, latest_price, now_eastern, order.id)
+                watch_order(order)
+            return
+
+    # Status update
+    if position is not None:
+        entry = position.avg_entry_price
+        entry_str = f"${entry:.2f}" if entry else "N/A"
+        change_pct = (latest_price - entry) / entry * 100 if entry else 0
+        print(f"[CRYPTO]{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}{_features_str(features)}, Entry={entry_str}, P&L={change_pct:+.2f}%, Qty={position.qty}, Time={current_time_str}")
+    else:
+        print(f"[CRYPTO]{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}{_features_str(features)}, No Position, Time={current_time_str}")
+
+@timed("crypto_pass")
+def run_crypto_pass(now_eastern):
+    """Evaluate every symbol in CRYPTO_TICKERS once, or only held ones outside a crypto trading window."""
+    entries, stop_loss_pct, take_profit_pct = get_crypto_rules(now_eastern)
+    symbols = CRYPTO_TICKERS if entries else held_crypto()
+    if not symbols:
+        return
+
+    crypto_rsi_states = update_rsi_multi(symbols, CRYPTO_RSI_LENGTH)
+    crypto_features = update_features(symbols)
+    crypto_prices = get_latest_prices(symbols)
+    received_at = time.time_ns()
+
+    def evaluate(symbol):
+        try:
+            rsi_state = crypto_rsi_states.get(symbol)
+            if rsi_state is None or not rsi_state.ready:
+                return
+            evaluate_crypto(symbol, rsi_state.rsi_now, rsi_state.rsi_prev, crypto_prices.get(symbol), now_eastern, stop_loss_pct, take_profit_pct,
+                            rsi_state.last_timestamp, received_at, entries, feature_values(crypto_features.get(symbol)))
+
+        except Exception as crypto_error:
+            print(f"[CRYPTO][ERROR] Failed for {symbol}: {crypto_error}")
+
+    for future in [crypto_executor.submit(evaluate, symbol) for symbol in symbols]:
+        future.result()
+
+    print(f"[CRYPTO] Open positions: {count_open_crypto_positions()}/{CRYPTO_MAX_POSITIONS}")
+    print("-" * 50)
+
 # === Main Bot Loop ===
-print("Starting RSI Trading Bot...")
+def restore_state(rsi=True):
+    """Loads positions and, unless rsi is False, RSI state checkpointed by an earlier run."""
+    state = get_snapshot()
+    positions, rsi_states = state.restore(ledger, rsi=rsi)
+    print(f"[STATE] Restored {positions} positions and {rsi_states} RSI states from {state.path}")
+    return state
+
+def main(stock_pass=None, crypto_pass=None, state=None):
+    """
+    Runs the stock and crypto strategies as independent runners.
+
+    Stocks are evaluated every CHECK_INTERVAL inside the calendar's trading
+    window and sleep until the next one outside it. Crypto is evaluated
+    every CRYPTO_CHECK_INTERVAL around the clock. This thread checkpoints.
+
+    Args:
+        stock_pass (callable): Replaces ``run_stock_pass``, e.g. with a sharded runner's.
+        crypto_pass (callable): Replaces ``run_crypto_pass``.
+        state (StateSnapshot): Already restored state, defaults to ``restore_state()``.
+    """
+    print("Starting RSI Trading Bot...")
+    metrics.start_from_config()
+    state = state or restore_state()
+    start_screener()
+
+    # Positions are flattened 15 min before each close, half days included
+    calendar = get_market_calendar()
+    EndOfDayTimer(calendar, close_all_positions).start()
+
+    def stock_resume_at(now_eastern):
+        return None if calendar.in_window(now_eastern) else calendar.next_window(now_eastern).start
+
+    runners = [
+        StrategyRunner("stock", stock_pass or run_stock_pass, CHECK_INTERVAL, calendar.now, stock_resume_at).start(),
+        StrategyRunner("crypto", crypto_pass or run_crypto_pass, CRYPTO_CHECK_INTERVAL, calendar.now,
+                       prefix="[CRYPTO]").start(),
+    ]
 
-while True:
     try:
-        eastern = pytz.timezone("US/Eastern")
-        now_eastern = datetime.now(eastern)
-        current_time_str = now_eastern.strftime("%Y-%m-%d %H:%M")
-        
-        # Check if market is open (excluding first 30 min and last 15 min)
-        if not is_market_open():
-            # At 15:45 (3:45 PM ET), close all positions
-            if now_eastern.hour == 15 and now_eastern.minute == 45:
-                print("Market close approaching: Closing all positions.")
-                close_all_positions()
-            print(f"Market closed or restricted at {current_time_str}. Waiting...")
-            time.sleep(CHECK_INTERVAL)
-            continue
-        
-        # Sync positions every iteration
-        sync_positions()
-        
-        for symbol in TICKERS:
+        while True:
             try:
-                df = get_rsi(symbol, RSI_LENGTH)
-                if (
-                    df is None
-                    or 'rsi' not in df.columns
-                    or df['rsi'].isna().iloc[-1]
-                    or len(df) < 2
-                ):
-                    continue
-
-                rsi_now = df['rsi'].iloc[-1]
-                rsi_prev = df['rsi'].iloc[-2]
-                latest_price = get_latest_price(symbol)
-                
-                if latest_price is None:
-                    print(f"[WARN] No price for {symbol}, skipping.")
-                    continue
-
-                # === Exit Signal (TP/SL/Overbought) ===
-                if positions[symbol]["open"]:
-                    entry = positions[symbol]["entry_price"]
-                    if entry is None or entry == 0:
-                        print(f"[WARN] Invalid entry price for {symbol}, skipping exit check.")
-                        continue
-                    
-                    change_pct = (latest_price - entry) / entry * 100
-
-                    # Take Profit
-                    if change_pct >= TAKE_PROFIT_PCT:
-                        print(f"{symbol}: Take Profit hit (+{change_pct:.2f}%). Selling...")
-                        result = market_sell(symbol)
-                        if result:
-                            positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
-                        continue
-
-                    # Stop Loss
-                    elif change_pct <= -STOP_LOSS_PCT:
-                        print(f"{symbol}: Stop Loss hit ({change_pct:.2f}%). Selling...")
-                        result = market_sell(symbol)
-                        if result:
-                            positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
-                        continue
-                    
-                    # Overbought Exit
-                    elif rsi_now >= OVERBOUGHT:
-                        print(f"{symbol}: RSI overbought ({rsi_now:.2f}). Selling...")
-                        result = market_sell(symbol)
-                        if result:
-                            positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
-                        continue
-
-                print(f"{symbol}: rsi_prev={rsi_prev}, rsi_now={rsi_now}, open={positions[symbol]['open']}, open_positions={count_open_positions()}")
-
-                # === Entry Signal ===
-                if (not positions[symbol]["open"] and 
-                    rsi_prev < OVERSOLD and 
-                    rsi_now >= OVERSOLD and
-                    count_open_positions() < MAX_POSITIONS):
-                    
-                    print(f"{symbol}: RSI crossed above {OVERSOLD} ({rsi_now:.2f}). Buying...")
-                    order = percent_market_buy(symbol, TRADE_PERCENTAGE)
-                    
-                    if order:
-                        # Try to get fill price from order
-                        try:
-                            actual_entry_price = float(order.filled_avg_price) if hasattr(order, 'filled_avg_price') and order.filled_avg_price else latest_price
-                            actual_qty = int(float(order.filled_qty)) if hasattr(order, 'filled_qty') and order.filled_qty else 0
-                        except:
-                            actual_entry_price = latest_price
-                            actual_qty = 0
-                        
-                        print(f"Order executed: {order}")
-                        positions[symbol]["open"] = True
-                        positions[symbol]["entry_price"] = actual_entry_price
-                        positions[symbol]["entry_time"] = now_eastern
-                        positions[symbol]["qty"] = actual_qty
-                    continue
-
-                # Status update
-                if positions[symbol]["open"]:
-                    entry = positions[symbol]["entry_price"]
-                    entry_str = f"${entry:.2f}" if entry else "N/A"
-                    change_pct = (latest_price - entry) / entry * 100 if entry else 0
-                    print(f"{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}, Entry={entry_str}, P&L={change_pct:+.2f}%, Qty={positions[symbol]['qty']}, Time={current_time_str}")
-                else:
-                    print(f"{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}, No Position, Time={current_time_str}")
-
-            except Exception as stock_error:
-                print(f"[ERROR] Failed for {symbol}: {stock_error}")
-
-        print(f"Open positions: {count_open_positions()}/{MAX_POSITIONS}")
-        print("-" * 50)
-
-        # --- Crypto Trading Logic ---
-        crypto_trading, stop_loss_pct, take_profit_pct = get_crypto_trade_window_and_params(now_eastern)
-        if crypto_trading:
-            for symbol in CRYPTO_TICKERS:
-                try:
-                    df = get_rsi(symbol, CRYPTO_RSI_LENGTH)
-                    if (
-                        df is None
-                        or 'rsi' not in df.columns
-                        or df['rsi'].isna().iloc[-1]
-                        or len(df) < 2
-                    ):
-                        continue
-
-                    rsi_now = df['rsi'].iloc[-1]
-                    rsi_prev = df['rsi'].iloc[-2]
-                    latest_price = get_latest_price(symbol)
-
-                    if latest_price is None:
-                        print(f"[CRYPTO][WARN] No price for {symbol}, skipping.")
-                        continue
-
-                    # === Exit Signal (TP/SL) ===
-                    if crypto_positions[symbol]["open"]:
-                        entry = crypto_positions[symbol]["entry_price"]
-                        if entry is None or entry == 0:
-                            print(f"[CRYPTO][WARN] Invalid entry price for {symbol}, skipping exit check.")
-                            continue
-
-                        change_pct = (latest_price - entry) / entry * 100
-
-                        # Take Profit
-                        if change_pct >= take_profit_pct:
-                            print(f"[CRYPTO]{symbol}: Take Profit hit (+{change_pct:.2f}%). Selling...")
-                            result = market_sell_crypto(symbol)
-                            if result:
-                                crypto_positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
-                            continue
-
-                        # Stop Loss
-                        elif change_pct <= -stop_loss_pct:
-                            print(f"[CRYPTO]{symbol}: Stop Loss hit ({change_pct:.2f}%). Selling...")
-                            result = market_sell_crypto(symbol)
-                            if result:
-                                crypto_positions[symbol] = {"open": False, "entry_price": None, "entry_time": None, "qty": 0}
-                            continue
-
-                    # === Entry Signal ===
-                    if (
-                        not crypto_positions[symbol]["open"]
-                        and rsi_prev < CRYPTO_RSI_BUY
-                        and rsi_now >= CRYPTO_RSI_BUY
-                        and count_open_crypto_positions() < CRYPTO_MAX_POSITIONS
-                    ):
-                        print(f"[CRYPTO]{symbol}: RSI crossed above {CRYPTO_RSI_BUY} ({rsi_now:.2f}). Buying...")
-                        order = percent_market_buy_crypto(symbol, CRYPTO_TRADE_PERCENTAGE)
-                        if order:
-                            try:
-                                actual_entry_price = float(order.filled_avg_price) if hasattr(order, 'filled_avg_price') and order.filled_avg_price else latest_price
-                                actual_qty = float(order.filled_qty) if hasattr(order, 'filled_qty') and order.filled_qty else 0
-                            except Exception:
-                                actual_entry_price = latest_price
-                                actual_qty = 0
-                            print(f"[CRYPTO] Order executed: {order}")
-                            crypto_positions[symbol]["open"] = True
-                            crypto_positions[symbol]["entry_price"] = actual_entry_price
-                            crypto_positions[symbol]["entry_time"] = now_eastern
-                            crypto_positions[symbol]["qty"] = actual_qty
-                        continue
-
-                    # Status update
-                    if crypto_positions[symbol]["open"]:
-                        entry = crypto_positions[symbol]["entry_price"]
-                        entry_str = f"${entry:.2f}" if entry else "N/A"
-                        change_pct = (latest_price - entry) / entry * 100 if entry else 0
-                        print(f"[CRYPTO]{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}, Entry={entry_str}, P&L={change_pct:+.2f}%, Qty={crypto_positions[symbol]['qty']}, Time={current_time_str}")
-                    else:
-                        print(f"[CRYPTO]{symbol}: RSI={rsi_now:.2f}, Price=${latest_price:.2f}, No Position, Time={current_time_str}")
-
-                except Exception as crypto_error:
-                    print(f"[CRYPTO][ERROR] Failed for {symbol}: {crypto_error}")
-
-            print(f"[CRYPTO] Open positions: {count_open_crypto_positions()}/{CRYPTO_MAX_POSITIONS}")
-            print("-" * 50)
-
-    except Exception as e:
-        print(f"[CRITICAL ERROR] {e}")
+                # Persist both runners' progress, at most every CHECKPOINT_INTERVAL
+                state.checkpoint(ledger)
+            except Exception as e:
+                print(f"[CRITICAL ERROR] {e}")
+            time.sleep(CHECK_INTERVAL)
+    finally:
+        for runner in runners:
+            runner.stop()
+        state.checkpoint(ledger, 0)
 
-    time.sleep(CHECK_INTERVAL)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
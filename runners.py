@@ -0,0 +1,75 @@
+import threading
+import time
+from datetime import datetime
+
+# Longest single sleep while a runner is idle, so stop() and clock corrections are noticed
+MAX_IDLE_SLEEP = 3600.0  # seconds
+
+
+class StrategyRunner:
+    """
+    Runs one strategy's passes on its own thread, on its own schedule.
+
+    Passes start every ``interval`` seconds, measured from the start of the
+    previous pass, so a slow pass is not followed by a full extra wait. Each
+    runner only waits on its own passes. Several runners in one process share
+    its clients, ledger and rate limiter but never block each other's loop.
+
+    Args:
+        name (str): Shown in log lines, e.g. "stock".
+        run_pass (callable): Called with the current Eastern time for every pass.
+        interval (float): Seconds between pass starts.
+        clock (callable): Returns the current Eastern time.
+        resume_at (callable): Given the current Eastern time, returns None when
+            a pass is due, or the datetime the runner should sleep until.
+            Defaults to always due.
+        prefix (str): Log prefix, e.g. "[CRYPTO]".
+    """
+
+    def __init__(self, name: str, run_pass, interval: float, clock, resume_at=None, prefix: str = ""):
+        self.name = name
+        self.run_pass = run_pass
+        self.interval = interval
+        self.clock = clock
+        self.resume_at = resume_at or (lambda now: None)
+        self.prefix = prefix
+        self.passes = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-runner", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _sleep_until(self, when: datetime):
+        remaining = (when - self.clock()).total_seconds()
+        self._stop.wait(min(max(remaining, 0.0), MAX_IDLE_SLEEP))
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                now_eastern = self.clock()
+                resume_at = self.resume_at(now_eastern)
+                if resume_at is not None:
+                    print(f"{self.prefix}{self.name.capitalize()} trading closed at {now_eastern:%Y-%m-%d %H:%M}. "
+                          f"Sleeping until {resume_at:%Y-%m-%d %H:%M}...")
+                    self._sleep_until(resume_at)
+                    continue
+                self.run_pass(now_eastern)
+                self.passes += 1
+            except Exception as e:
+                print(f"{self.prefix}[CRITICAL ERROR] {self.name} runner: {e}")
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0.0))
@@ -0,0 +1,240 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+import metrics
+from config import get_rate_limit, get_rate_burst, get_data_rate_limit, get_data_rate_burst
+
+# Priority classes, most urgent first
+ORDER = 0  # order submits, replaces and cancels, position closes
+ACCOUNT = 1  # account, positions and order lookups
+QUOTE = 2  # latest quotes, trades and snapshots
+HISTORY = 3  # bars and other history
+
+PRIORITY_NAMES = {ORDER: "order", ACCOUNT: "account", QUOTE: "quote", HISTORY: "history"}
+
+# Market data API paths; everything else is the trading API
+DATA_PATHS = ("/v2/stocks", "/v1beta")
+
+# Tokens a class must leave in the bucket, so quotes and history back off
+# before they can starve an order of its token
+RESERVED = {ORDER: 0, ACCOUNT: 1, QUOTE: 2, HISTORY: 4}
+
+
+def classify(method: str, url: str) -> int:
+    """
+    Priority class of a REST request.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Full request URL.
+    Returns:
+        int: One of ORDER, ACCOUNT, QUOTE, HISTORY.
+    """
+    path = urlsplit(url).path
+    if "/latest" in path or "/snapshots" in path:
+        return QUOTE
+    if path.startswith(DATA_PATHS):
+        return HISTORY
+    if method.upper() != "GET" and path.startswith(("/v2/orders", "/v2/positions")):
+        return ORDER
+    return ACCOUNT
+
+
+class TokenBucket:
+    """
+    Token bucket handing tokens to waiters in priority order.
+
+    Holds up to ``burst`` tokens and refills at ``rate`` per second. A waiter
+    only gets a token once it is the most urgent one waiting and taking the
+    token leaves its class's ``RESERVED`` tokens behind.
+
+    Args:
+        rate (float): Tokens added per second.
+        burst (int): Bucket size.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int) -> float:
+        """
+        Blocks until a token is available to this priority class and takes it.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        needed = 1 + min(RESERVED.get(priority, 0), self.burst - 1)
+        entry = (priority, next(self._sequence))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == entry:
+                        if self.tokens >= needed:
+                            self.tokens -= 1
+                            heapq.heappop(self._waiters)
+                            self._cond.notify_all()
+                            return now - start
+                        self._cond.wait((needed - self.tokens) / self.rate)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    def drain(self):
+        """Empties the bucket, e.g. after the server answered 429."""
+        with self._cond:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class RequestScheduler:
+    """
+    Central gate for REST calls: rate limiting per API host with priority
+    classes, and coalescing of identical in-flight GETs.
+
+    Each host gets its own ``TokenBucket``, with the trading API's budget or
+    the market data API's. Its refill rate is set so that no 60 second
+    window can exceed the limit, even after a full burst. A GET identical to
+    one already in flight (same URL and query) waits for that request and
+    shares its response instead of spending a token.
+
+    Args:
+        limit (int): Trading API requests per minute.
+        burst (int): Trading API requests that may go out back to back.
+        data_limit (int): Market data API requests per minute.
+        data_burst (int): Market data API requests that may go out back to back.
+    """
+
+    def __init__(self, limit: int = None, burst: int = None, data_limit: int = None, data_burst: int = None):
+        self.limit = limit or get_rate_limit()
+        self.burst = max(1, min(burst or get_rate_burst(), self.limit))
+        self.data_limit = data_limit or get_data_rate_limit()
+        self.data_burst = max(1, min(data_burst or get_data_rate_burst(), self.data_limit))
+        self._buckets = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str, data: bool = False) -> TokenBucket:
+        """
+        Returns the token bucket for an API host.
+
+        Args:
+            host (str): The host, e.g. "data.alpaca.markets".
+            data (bool): Whether it serves the market data API.
+        """
+        key = (host, data)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    limit, burst = (self.data_limit, self.data_burst) if data else (self.limit, self.burst)
+                    bucket = self._buckets[key] = TokenBucket(max(limit - burst, 1) / 60.0, burst)
+        return bucket
+
+    def request(self, send, method: str, url: str, **kwargs):
+        """
+        Sends a request through the scheduler.
+
+        Args:
+            send (callable): The underlying ``requests.Session.request``.
+            method (str): HTTP method.
+            url (str): Full request URL.
+            **kwargs: Passed on to ``send``.
+        Returns:
+            requests.Response: The response, possibly shared with coalesced callers.
+        """
+        priority = classify(method, url)
+        key = None
+        if method.upper() == "GET":
+            key = (url, _freeze(kwargs.get("params")))
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+            if not leader:
+                metrics.counter("bot_requests_coalesced_total", priority=PRIORITY_NAMES[priority]).inc()
+                return future.result()
+        try:
+            parts = urlsplit(url)
+            bucket = self.bucket(parts.netloc, parts.path.startswith(DATA_PATHS))
+            waited = bucket.acquire(priority)
+            metrics.histogram("bot_scheduler_wait_seconds", priority=PRIORITY_NAMES[priority]).observe(waited)
+            response = send(method, url, **kwargs)
+            if response.status_code == 429:
+                bucket.drain()
+        except BaseException as e:
+            if key is not None:
+                self._finish(key, exception=e)
+            raise
+        if key is not None:
+            self._finish(key, response=response)
+        return response
+
+    def _finish(self, key, response=None, exception=None):
+        with self._lock:
+            future = self._inflight.pop(key)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(response)
+
+    def install(self, session):
+        """Routes every request a ``requests.Session`` makes through this scheduler."""
+        send = session.request
+
+        def request(method, url, **kwargs):
+            return self.request(send, method, url, **kwargs)
+        session.request = request
+        return session
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Returns the process-wide request scheduler."""
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler()
+    return _default_scheduler
+
+
+def reset_scheduler():
+    """Drops the process-wide scheduler so the next one picks up the current config."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        _default_scheduler = None
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from alpaca.trading.enums import AssetClass, AssetStatus
+from alpaca.trading.requests import GetAssetsRequest
+from clients import get_trading_client
+from marketdata import get_snapshots
+from metrics import timed
+
+# Default shortlist refresh schedule
+REFRESH_INTERVAL = 300.0  # seconds
+# Liquidity floor: previous session's dollar volume
+MIN_DOLLAR_VOLUME = 20_000_000
+# Volatility floor: the larger of today's and the previous session's high-low range, in percent of price
+MIN_RANGE_PCT = 2.0
+
+
+def tradable_universe() -> list:
+    """Every active, tradable US equity on Alpaca."""
+    assets = get_trading_client().get_all_assets(GetAssetsRequest(status=AssetStatus.ACTIVE,
+                                                                  asset_class=AssetClass.US_EQUITY))
+    return sorted(asset.symbol for asset in assets if asset.tradable)
+
+
+def resolve_universe(spec: str) -> list:
+    """
+    Turns a universe spec (see ``config.get_universe``) into symbols.
+
+    Args:
+        spec (str): 'all', a file with one symbol per line, or a comma-separated list.
+    Returns:
+        list: The symbols.
+    """
+    if spec.strip().lower() == "all":
+        return tradable_universe()
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            return [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+    return [symbol.strip() for symbol in spec.split(",") if symbol.strip()]
+
+
+class Candidate:
+    """
+    One symbol's screening metrics from its snapshot.
+
+    Attributes:
+        symbol (str): The symbol.
+        price (float): Latest trade price.
+        dollar_volume (float): Previous session's close times volume.
+        range_pct (float): The larger of today's and the previous session's high-low range, in percent.
+        stretch (float): How far below today's VWAP the price is, in units of that range. Negative when above.
+    """
+
+    __slots__ = ("symbol", "price", "dollar_volume", "range_pct", "stretch")
+
+    def __init__(self, symbol: str, price: float, dollar_volume: float, range_pct: float, stretch: float):
+        self.symbol = symbol
+        self.price = price
+        self.dollar_volume = dollar_volume
+        self.range_pct = range_pct
+        self.stretch = stretch
+
+    def __repr__(self):
+        return (f"Candidate({self.symbol}, price={self.price:.2f}, dollar_volume={self.dollar_volume:,.0f}, "
+                f"range={self.range_pct:.2f}%, stretch={self.stretch:+.2f})")
+
+
+def candidate(symbol: str, snapshot) -> Candidate:
+    """
+    Screening metrics for one snapshot.
+
+    Returns:
+        Candidate | None: None when the snapshot lacks a price or daily bars.
+    """
+    daily, previous = snapshot.daily_bar, snapshot.previous_daily_bar
+    if snapshot.latest_trade is not None:
+        price = snapshot.latest_trade.price
+    elif snapshot.minute_bar is not None:
+        price = snapshot.minute_bar.close
+    else:
+        return None
+    # Early in the session today's volume says little, so liquidity comes from the previous one
+    reference = previous or daily
+    if not price or reference is None or not reference.close:
+        return None
+    ranges = [(bar.high - bar.low) / bar.close * 100 for bar in (daily, previous) if bar is not None and bar.close]
+    range_pct = max(ranges)
+    stretch = 0.0
+    if daily is not None and daily.vwap and range_pct:
+        stretch = (daily.vwap - price) / daily.vwap * 100 / range_pct
+    return Candidate(symbol, price, reference.close * reference.volume, range_pct, stretch)
+
+
+class UniverseScreener:
+    """
+    Stage one of a two-stage scan: ranks a large universe from snapshots so
+    the full RSI evaluation only runs on a shortlist.
+
+    A refresh costs one snapshot request per ``MAX_SYMBOLS_PER_REQUEST``
+    symbols (three for the S&P 500). Symbols below the liquidity and
+    volatility floors are dropped. The rest are ranked by how far they are
+    stretched below today's VWAP relative to their range, a rough stand-in
+    for the oversold minute RSI the entry rule waits for.
+
+    Args:
+        universe (list): Symbols to screen.
+        size (int): Shortlist length.
+        interval (float): Seconds between refreshes when running in the background.
+        min_dollar_volume (float): Liquidity floor.
+        min_range_pct (float): Volatility floor.
+    """
+
+    def __init__(self, universe, size: int, interval: float = REFRESH_INTERVAL,
+                 min_dollar_volume: float = MIN_DOLLAR_VOLUME, min_range_pct: float = MIN_RANGE_PCT):
+        self.universe = list(dict.fromkeys(universe))
+        self.members = set(self.universe)
+        self.size = size
+        self.interval = interval
+        self.min_dollar_volume = min_dollar_volume
+        self.min_range_pct = min_range_pct
+        self.candidates = []
+        self.refreshed_at = None
+        self._shortlist = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def shortlist(self) -> list:
+        """The current shortlist, best candidate first. Empty until the first refresh."""
+        return self._shortlist
+
+    def refresh(self) -> list:
+        """
+        Re-ranks the universe from fresh snapshots.
+
+        Returns:
+            list: The new shortlist.
+        """
+        with timed("screen_refresh"):
+            snapshots = get_snapshots(self.universe)
+            candidates = [c for c in (candidate(symbol, snapshot) for symbol, snapshot in snapshots.items())
+                          if c is not None]
+        eligible = [c for c in candidates
+                    if c.dollar_volume >= self.min_dollar_volume and c.range_pct >= self.min_range_pct]
+        eligible.sort(key=lambda c: c.stretch, reverse=True)
+        self.candidates = eligible
+        self._shortlist = [c.symbol for c in eligible[:self.size]]
+        self.refreshed_at = time.time()
+        print(f"[SCREENER] {len(eligible)} of {len(self.universe)} symbols eligible, "
+              f"shortlist: {', '.join(self._shortlist) or 'none'}")
+        return self._shortlist
+
+    def start(self):
+        """Refreshes once now, then every ``interval`` seconds on a background thread."""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[SCREENER][ERROR] Refresh failed: {e}")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_forever, name="screener", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_forever(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep trading the previous shortlist
+                print(f"[SCREENER][ERROR] Refresh failed: {e}")
@@ -0,0 +1,253 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from config import get_data_rate_limit, get_data_rate_burst
+from marketdata import get_latest_prices
+from metrics import timed
+from rsi import update_rsi_multi
+import rsi_strategy as strategy
+
+# Worker processes by default: one per core, leaving one to the coordinator
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# How long a pass waits for the workers before going on without the late ones
+PASS_TIMEOUT = 30.0  # seconds
+
+
+def shard_of(symbol: str, n_workers: int) -> int:
+    """The worker a symbol belongs to; stable across passes and restarts, so its RSI state stays put."""
+    return zlib.crc32(symbol.encode()) % n_workers
+
+
+class Signal:
+    """One symbol's inputs to the strategy rules, as a worker computed them."""
+
+    __slots__ = ("symbol", "rsi_now", "rsi_prev", "price", "bar_time", "received_at", "features")
+
+    def __init__(self, symbol: str, rsi_now: float, rsi_prev: float, price: float, bar_time, received_at: int,
+                 features: dict = None):
+        self.symbol = symbol
+        self.rsi_now = rsi_now
+        self.rsi_prev = rsi_prev
+        self.price = price
+        self.bar_time = bar_time
+        self.received_at = received_at
+        self.features = features
+
+
+def _compute_signals(kind: str, symbols: list) -> list:
+    if kind == "stock":
+        rsi_states = strategy.update_stock_rsi(symbols)
+    else:
+        rsi_states = update_rsi_multi(symbols, strategy.CRYPTO_RSI_LENGTH)
+    features = strategy.update_features(symbols)
+    prices = get_latest_prices(symbols)
+    received_at = time.time_ns()
+    return [Signal(symbol, state.rsi_now, state.rsi_prev, prices.get(symbol), state.last_timestamp, received_at,
+                   strategy.feature_values(features.get(symbol)))
+            for symbol, state in rsi_states.items() if state is not None and state.ready]
+
+
+def _worker(index: int, n_workers: int, commands, results: dict, data_rate_limit: int, data_rate_burst: int):
+    """
+    Worker process: fetches bars and quotes and updates RSI for its shard on
+    every command, answering with the resulting signals.
+
+    Its RSI states are checkpointed to the shared state file, which it only
+    restores its own shard's rows from; positions are left to the coordinator.
+    """
+    # The market data budget is split between all processes; workers make no trading API calls
+    os.environ["ALPACA_DATA_RATE_LIMIT"] = str(data_rate_limit)
+    os.environ["ALPACA_DATA_RATE_BURST"] = str(data_rate_burst)
+    os.environ["ALPACA_RATE_LIMIT"] = "1"
+    os.environ["ALPACA_RATE_BURST"] = "1"
+    from snapshot import get_snapshot
+    state = get_snapshot()
+    state.restore(None, owns=lambda symbol: shard_of(symbol, n_workers) == index)
+
+    while True:
+        command = commands.get()
+        if command is None:
+            break
+        pass_id, kind, symbols = command
+        error = None
+        try:
+            signals = _compute_signals(kind, symbols)
+        except Exception as e:
+            signals, error = [], str(e)
+        results[kind].put((index, pass_id, signals, error))
+        try:
+            state.checkpoint(None)
+        except Exception as e:
+            print(f"[SHARD][ERROR] Worker {index} state checkpoint failed: {e}")
+    state.close()
+
+
+class ShardedRunner:
+    """
+    Runs the strategy's data fetching and RSI updates in worker processes,
+    with this process as the single coordinator for orders.
+
+    Symbols are sharded across workers by ``shard_of``. Each pass, every
+    worker fetches bars and quotes for its shard, updates its RSI states and
+    sends back one batch of ``Signal``. The coordinator applies
+    ``evaluate_stock``/``evaluate_crypto`` to each batch as it arrives.
+    Position caps, buying-power checks and order submission therefore all
+    happen in one process, under ``positions_lock``, and the caps stay exact.
+
+    Stock and crypto passes may run concurrently from their own runner
+    threads; each kind has its own result queue and pass counter. A worker
+    still answers its commands in order, so a crypto pass can wait behind a
+    stock shard, but only that worker's.
+
+    Rate limits are per API host. Only the coordinator trades, so it keeps
+    the whole trading API budget (``config.get_rate_limit``). The market
+    data budget (``config.get_data_rate_limit``) is split evenly between the
+    workers and the coordinator, whose screener refreshes also use it, so
+    neither host's total budget changes.
+    A worker that dies is restarted on the next pass and reseeds its shard.
+
+    Args:
+        workers (int): Number of worker processes.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.n_workers = max(1, workers)
+        self.data_rate_limit = max(1, get_data_rate_limit() // (self.n_workers + 1))
+        self.data_rate_burst = max(1, get_data_rate_burst() // (self.n_workers + 1))
+        self._context = multiprocessing.get_context("spawn")
+        self._results = {"stock": self._context.Queue(), "crypto": self._context.Queue()}
+        self._processes = [None] * self.n_workers
+        self._commands = [None] * self.n_workers
+        self._pass_ids = {"stock": 0, "crypto": 0}
+        # Both runners may find a dead worker at once
+        self._spawn_lock = threading.Lock()
+
+    def start(self):
+        """Starts the workers and limits this process to its share of the market data budget."""
+        os.environ["ALPACA_DATA_RATE_LIMIT"] = str(self.data_rate_limit)
+        os.environ["ALPACA_DATA_RATE_BURST"] = str(self.data_rate_burst)
+        from scheduler import reset_scheduler
+        reset_scheduler()
+        for index in range(self.n_workers):
+            self._spawn(index)
+        print(f"[SHARD] Started {self.n_workers} workers, {self.data_rate_limit} data requests/min each")
+        return self
+
+    def _spawn(self, index: int):
+        self._commands[index] = self._context.Queue()
+        process = self._context.Process(target=_worker, name=f"shard-{index}", daemon=True,
+                                        args=(index, self.n_workers, self._commands[index], self._results,
+                                              self.data_rate_limit, self.data_rate_burst))
+        process.start()
+        self._processes[index] = process
+
+    def stop(self, timeout: float = 10.0):
+        """Asks every worker to exit and waits for them."""
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._commands[index].put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+
+    def signals(self, kind: str, symbols: list):
+        """
+        Sends one pass over symbols to the workers.
+
+        Args:
+            kind (str): "stock" or "crypto".
+            symbols (list): Symbols to evaluate.
+        Yields:
+            list: Each worker's signals, as it answers.
+        """
+        self._pass_ids[kind] += 1
+        pass_id = self._pass_ids[kind]
+        shards = [[] for _ in range(self.n_workers)]
+        for symbol in symbols:
+            shards[shard_of(symbol, self.n_workers)].append(symbol)
+
+        waiting = set()
+        for index, shard in enumerate(shards):
+            if not shard:
+                continue
+            with self._spawn_lock:
+                if not self._processes[index].is_alive():
+                    print(f"[SHARD][WARN] Worker {index} exited with {self._processes[index].exitcode}, restarting")
+                    self._spawn(index)
+                self._commands[index].put((pass_id, kind, shard))
+            waiting.add(index)
+
+        deadline = time.monotonic() + PASS_TIMEOUT
+        while waiting:
+            try:
+                index, answered, signals, error = self._results[kind].get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                print(f"[SHARD][WARN] No {kind} signals from workers {sorted(waiting)} this pass")
+                return
+            # A late answer to an earlier pass
+            if answered != pass_id:
+                continue
+            waiting.discard(index)
+            if error:
+                print(f"[SHARD][ERROR] Worker {index} failed on {kind}: {error}")
+            yield signals
+
+    def _evaluate_all(self, kind: str, symbols: list, evaluate):
+        def run(signal):
+            try:
+                evaluate(signal)
+            except Exception as e:
+                prefix = "[CRYPTO][ERROR]" if kind == "crypto" else "[ERROR]"
+                print(f"{prefix} Failed for {signal.symbol}: {e}")
+
+        # Order round trips overlap across symbols and with the workers still fetching
+        executor = strategy.crypto_executor if kind == "crypto" else strategy.executor
+        futures = [executor.submit(run, signal)
+                   for signals in self.signals(kind, symbols) for signal in signals]
+        for future in futures:
+            future.result()
+
+    @timed("stock_pass")
+    def stock_pass(self, now_eastern):
+        """Sharded ``run_stock_pass``."""
+        strategy.sync_positions()
+        self._evaluate_all("stock", strategy.stock_symbols(), lambda s: strategy.evaluate_stock(
+            s.symbol, s.rsi_now, s.rsi_prev, s.price, now_eastern, s.bar_time, s.received_at, s.features))
+        print(f"Open positions: {strategy.count_open_positions()}/{strategy.MAX_POSITIONS}")
+        print("-" * 50)
+
+    @timed("crypto_pass")
+    def crypto_pass(self, now_eastern):
+        """Sharded ``run_crypto_pass``."""
+        entries, stop_loss_pct, take_profit_pct = strategy.get_crypto_rules(now_eastern)
+        symbols = strategy.CRYPTO_TICKERS if entries else strategy.held_crypto()
+        if not symbols:
+            return
+        self._evaluate_all("crypto", symbols, lambda s: strategy.evaluate_crypto(
+            s.symbol, s.rsi_now, s.rsi_prev, s.price, now_eastern, stop_loss_pct, take_profit_pct,
+            s.bar_time, s.received_at, entries, s.features))
+        print(f"[CRYPTO] Open positions: {strategy.count_open_crypto_positions()}/{strategy.CRYPTO_MAX_POSITIONS}")
+        print("-" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSI strategy with data and signals sharded across processes")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Worker processes")
+    args = parser.parse_args()
+
+    runner = ShardedRunner(args.workers).start()
+    try:
+        # Workers own the RSI states; only positions are restored here
+        strategy.main(runner.stock_pass, runner.crypto_pass, strategy.restore_state(rsi=False))
+    finally:
+        runner.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,224 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from alpaca.data import StockTradesRequest
+from clients import get_stock_data_client
+from metrics import timed
+from datetime import datetime, timedelta
+
+# One trade print. Timestamps are UTC nanoseconds since the epoch; conditions
+# are the condition codes concatenated, e.g. b"@TI".
+TRADE_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("price", "<f8"),
+    ("size", "<f8"),
+    ("id", "<i8"),
+    ("exchange", "S1"),
+    ("tape", "S1"),
+    ("conditions", "S8"),
+])
+# Time slice fetched as one paged request sequence
+CHUNK = timedelta(minutes=30)
+# Chunks fetched at once; also bounds how many are held in memory
+MAX_CONCURRENT_CHUNKS = 4
+# Trades per page, Alpaca's maximum
+PAGE_SIZE = 10_000
+
+
+def _parse_time(value) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M") if isinstance(value, str) else value
 
-from alpaca.trading.client import TradingClient
-from alpaca.data import StockHistoricalDataClient, StockTradesRequest
-from config import get_alpaca_api_key, get_alpaca_secret_key
-from datetime import datetime
 
 def show_trades(stock_symbol:str,start_time: str, end_time:str):
     """"
     args:
     stock_symbol: str - The stock symbol to fetch trades for
     start_time: str - Start time in the format "YYYY-MM-DD HH:MM"
-    end_time: str - End time in the format "YYYY-MM-DD HH:MM"   
+    end_time: str - End time in the format "YYYY-MM-DD HH:MM"
 
     Returns:
     trades: list - List of trades within the specified time range
+
+    Holds the whole range in memory; use iter_trades or write_trades for long ranges.
     """
     request_params = StockTradesRequest(
         symbol_or_symbols=stock_symbol,
-        start=datetime.strptime(start_time, "%Y-%m-%d %H:%M"),
-        end=datetime.strptime(end_time, "%Y-%m-%d %H:%M"),
+        start=_parse_time(start_time),
+        end=_parse_time(end_time),
     )
-    data_client = StockHistoricalDataClient(get_alpaca_api_key(), get_alpaca_secret_key())
+    data_client = get_stock_data_client()
 
     trades = data_client.get_stock_trades(request_params)
 
-    return trades
\ No newline at end of file
+    return trades
+
+
+def trade_batch(trades: list) -> np.ndarray:
+    """
+    Converts raw trades, as in a trades response, to a record batch.
+
+    Args:
+        trades (list): Trade dicts with the keys t, p, s, i, x, z and c.
+    Returns:
+        numpy.ndarray: A ``TRADE_DTYPE`` structured array, in input order.
+    """
+    batch = np.empty(len(trades), TRADE_DTYPE)
+    if not trades:
+        return batch
+    batch["timestamp"] = pd.to_datetime([t["t"] for t in trades], utc=True, format="ISO8601").as_unit("ns").asi8
+    batch["price"] = [t["p"] for t in trades]
+    batch["size"] = [t["s"] for t in trades]
+    batch["id"] = [t.get("i", 0) for t in trades]
+    batch["exchange"] = [t.get("x", "") for t in trades]
+    batch["tape"] = [t.get("z", "") for t in trades]
+    batch["conditions"] = ["".join(t.get("c") or ()) for t in trades]
+    return batch
+
+
+def _ns(ts: datetime) -> int:
+    ts = pd.Timestamp(ts)
+    return (ts.tz_localize("UTC") if ts.tzinfo is None else ts).value
+
+
+def _fetch_chunk(symbol: str, start: datetime, end: datetime, last: bool, feed: str = None) -> list:
+    """
+    Pages through one slice's trades, converting each page to a batch as it arrives.
+
+    Alpaca's end is inclusive, so every slice but the last drops trades at
+    exactly its end; the next slice starts there.
+    """
+    client = get_stock_data_client()
+    params = StockTradesRequest(symbol_or_symbols=symbol, start=start, end=end, feed=feed).to_request_fields()
+    params["limit"] = PAGE_SIZE
+    end_ns = _ns(end)
+    batches = []
+    page_token = None
+    while True:
+        params["page_token"] = page_token
+        with timed("trade_page"):
+            response = client.get(path="/stocks/trades", data=params)
+        trades = (response.get("trades") or {}).get(symbol) or []
+        if trades:
+            batch = trade_batch(trades)
+            if not last:
+                batch = batch[batch["timestamp"] < end_ns]
+            if len(batch):
+                batches.append(batch)
+        page_token = response.get("next_page_token")
+        if page_token is None:
+            return batches
+
+
+def iter_trades(symbol: str, start_time, end_time, chunk: timedelta = CHUNK,
+                max_concurrent: int = MAX_CONCURRENT_CHUNKS, feed: str = None):
+    """
+    Streams a symbol's trades as record batches, in timestamp order.
+
+    The range is split into ``chunk``-long slices fetched in parallel, at most
+    ``max_concurrent`` at a time. A slice is only fetched once the one
+    ``max_concurrent`` places before it has been consumed, so memory stays
+    bounded however long the range is. Requests go through the shared rate
+    limiter at history priority.
+
+    Args:
+        symbol (str): The stock symbol.
+        start_time (str | datetime): Range start, "YYYY-MM-DD HH:MM" or a datetime; naive values are UTC.
+        end_time (str | datetime): Range end, likewise.
+        chunk (timedelta): Slice length.
+        max_concurrent (int): Slices in flight.
+        feed (str): Data feed, e.g. "iex" or "sip". Defaults to the account's.
+    Yields:
+        numpy.ndarray: ``TRADE_DTYPE`` batches of up to ``PAGE_SIZE`` trades.
+    """
+    start, end = _parse_time(start_time), _parse_time(end_time)
+    bounds = []
+    while start < end:
+        bounds.append((start, min(start + chunk, end)))
+        start += chunk
+
+    max_concurrent = max(1, max_concurrent)
+    executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="trade-fetch")
+
+    def submit(index):
+        lo, hi = bounds[index]
+        return executor.submit(_fetch_chunk, symbol, lo, hi, index == len(bounds) - 1, feed)
+
+    try:
+        pending = [submit(index) for index in range(min(max_concurrent, len(bounds)))]
+        submitted = len(pending)
+        while pending:
+            batches = pending.pop(0).result()
+            if submitted < len(bounds):
+                pending.append(submit(submitted))
+                submitted += 1
+            yield from batches
+    finally:
+        # An abandoned generator stops fetching
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def write_trades(symbol: str, start_time, end_time, path: str, **kwargs) -> int:
+    """
+    Streams a symbol's trades into a columnar directory, one batch at a time.
+
+    Each ``TRADE_DTYPE`` field is appended to its own raw little-endian file
+    under path, the layout ``barstore`` uses for bars, so ``read_trades`` can
+    memory-map the result.
+
+    Args:
+        symbol (str): The stock symbol.
+        start_time (str | datetime): Range start.
+        end_time (str | datetime): Range end.
+        path (str): Output directory; existing column files are replaced.
+        **kwargs: Passed to ``iter_trades``.
+    Returns:
+        int: Number of trades written.
+    """
+    os.makedirs(path, exist_ok=True)
+    files = {name: open(os.path.join(path, name), "wb") for name in TRADE_DTYPE.names}
+    written = 0
+    try:
+        for batch in iter_trades(symbol, start_time, end_time, **kwargs):
+            for name, f in files.items():
+                f.write(np.ascontiguousarray(batch[name]).tobytes())
+            written += len(batch)
+    finally:
+        for f in files.values():
+            f.close()
+    return written
+
+
+def read_trades(path: str) -> dict:
+    """
+    Reads a ``write_trades`` directory as read-only memory-mapped columns.
+
+    Returns:
+        dict: Field name to NumPy array; empty arrays when nothing was written.
+    """
+    n = min(os.path.getsize(os.path.join(path, name)) // TRADE_DTYPE[name].itemsize for name in TRADE_DTYPE.names)
+    if n == 0:
+        return {name: np.empty(0, TRADE_DTYPE[name]) for name in TRADE_DTYPE.names}
+    return {name: np.memmap(os.path.join(path, name), dtype=TRADE_DTYPE[name], mode="r", shape=(n,))
+            for name in TRADE_DTYPE.names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download a symbol's trade tape to column files")
+    parser.add_argument("symbol")
+    parser.add_argument("start", help='Start, "YYYY-MM-DD HH:MM" UTC')
+    parser.add_argument("end", help='End, "YYYY-MM-DD HH:MM" UTC')
+    parser.add_argument("path", help="Output directory")
+    parser.add_argument("--chunk-minutes", type=int, default=int(CHUNK.total_seconds() // 60))
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_CHUNKS)
+    parser.add_argument("--feed", default=None)
+    args = parser.parse_args()
+
+    written = write_trades(args.symbol, args.start, args.end, args.path,
+                           chunk=timedelta(minutes=args.chunk_minutes), max_concurrent=args.concurrency, feed=args.feed)
+    print(f"Wrote {written} {args.symbol} trades to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
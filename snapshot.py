@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from alpaca.trading.enums import OrderSide
+from config import get_state_file
+from ledger import Position
+from rsi import WilderRSI, SEED_DAYS, dump_rsi_states, set_rsi_state
+
+# How often checkpoint() writes by default; a crash loses at most this much
+CHECKPOINT_INTERVAL = 5.0  # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    symbol TEXT PRIMARY KEY,
+    qty REAL NOT NULL,
+    avg_entry_price REAL,
+    entry_time INTEGER,
+    pending TEXT,
+    pending_order TEXT,
+    exit_orders TEXT
+);
+CREATE TABLE IF NOT EXISTS rsi_state (
+    symbol TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    avg_gain REAL,
+    avg_loss REAL,
+    count INTEGER NOT NULL,
+    last_close REAL,
+    last_timestamp INTEGER,
+    rsi_now REAL,
+    rsi_prev REAL,
+    undo TEXT,
+    PRIMARY KEY (symbol, period)
+);
+"""
+
+_RSI_COLUMNS = ("avg_gain", "avg_loss", "count", "last_close", "last_timestamp", "rsi_now", "rsi_prev", "undo")
+
+
+def _ns(ts):
+    return None if ts is None else pd.Timestamp(ts).value
+
+
+def _position_row(position: Position) -> tuple:
+    return (
+        position.symbol, position.qty, position.avg_entry_price, _ns(position.entry_time),
+        position.pending.value if position.pending else None, position.pending_order,
+        None if position.exit_orders is None else json.dumps(list(position.exit_orders)),
+    )
+
+
+def _rsi_row(symbol: str, period: int, state: dict) -> tuple:
+    undo = None if state["undo"] is None else json.dumps(state["undo"])
+    return (symbol, period, *(state[column] for column in _RSI_COLUMNS[:-1]), undo)
+
+
+class StateSnapshot:
+    """
+    Warm-restart state kept in a SQLite file in WAL mode.
+
+    Holds the ledger's positions with their entry times, pending orders and
+    exit orders, and every incremental RSI state up to its last processed
+    bar. ``checkpoint`` only writes rows that changed since the previous
+    call, as one small transaction appended to the write-ahead log, so it
+    is cheap enough to run from the trading loop.
+
+    ``restore`` puts both back: a restarted process then only fetches the
+    bars since its last checkpoint and keeps the real entry times instead
+    of reseeding ``SEED_DAYS`` of history.
+
+    Args:
+        path (str): SQLite file. Defaults to ``config.get_state_file()``.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or get_state_file()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._rsi = {}
+        self._checkpointed_at = 0.0
+
+    def checkpoint(self, ledger, interval: float = CHECKPOINT_INTERVAL) -> bool:
+        """
+        Writes positions and RSI states changed since the last checkpoint.
+
+        Call it from one thread at a time. RSI states may be advanced by
+        ``update_rsi_multi`` meanwhile; those updated directly (e.g. by the
+        stream) must be quiet.
+
+        Args:
+            ledger (PositionLedger): The ledger to persist, None to leave positions to another process.
+            interval (float): Skip when the last checkpoint is more recent than this. 0 forces one.
+        Returns:
+            bool: Whether a checkpoint ran.
+        """
+        now = time.monotonic()
+        if now - self._checkpointed_at < interval:
+            return False
+        positions = {} if ledger is None else {row[0]: row for row in map(_position_row, ledger.positions())}
+        states = {key: _rsi_row(*key, state) for key, state in dump_rsi_states().items()}
+        with self._lock:
+            changed_positions = [row for symbol, row in positions.items() if self._positions.get(symbol) != row]
+            closed = [] if ledger is None else [(symbol,) for symbol in self._positions if symbol not in positions]
+            changed_states = [row for key, row in states.items() if self._rsi.get(key) != row]
+            if changed_positions or closed or changed_states:
+                self._db.execute("BEGIN")
+                try:
+                    self._db.executemany("DELETE FROM positions WHERE symbol = ?", closed)
+                    self._db.executemany("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)", changed_positions)
+                    self._db.executemany("INSERT OR REPLACE INTO rsi_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", changed_states)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            if ledger is not None:
+                self._positions = positions
+            self._rsi = states
+            self._checkpointed_at = now
+        return True
+
+    def restore(self, ledger, max_age: pd.Timedelta = pd.Timedelta(days=SEED_DAYS), rsi: bool = True,
+                owns=None) -> tuple:
+        """
+        Loads the persisted positions into the ledger and the RSI states into ``rsi``.
+
+        RSI states whose last bar is older than max_age are skipped; seeding
+        them afresh costs no more than catching them up. Restored states
+        count as already checkpointed, so only later changes are written back.
+
+        Args:
+            ledger (PositionLedger): The ledger to seed, None to skip positions.
+            max_age (pandas.Timedelta): Oldest last bar worth restoring.
+            rsi (bool): Whether to restore RSI states, e.g. False where worker processes own them.
+            owns (callable): Given a symbol, whether this process owns its RSI
+                states, so that processes sharing the file never overwrite
+                each other's rows. Defaults to all symbols.
+        Returns:
+            tuple: (positions restored, RSI states restored)
+        """
+        with self._lock:
+            position_rows = self._db.execute("SELECT * FROM positions").fetchall() if ledger is not None else []
+            rsi_rows = self._db.execute("SELECT * FROM rsi_state").fetchall() if rsi else []
+
+        positions = []
+        for symbol, qty, avg_entry_price, entry_time, pending, pending_order, exit_orders in position_rows:
+            position = Position(symbol, qty, avg_entry_price,
+                                None if entry_time is None else pd.Timestamp(entry_time, tz="UTC").to_pydatetime(),
+                                OrderSide(pending) if pending else None)
+            position.pending_order = pending_order
+            position.exit_orders = None if exit_orders is None else tuple(json.loads(exit_orders))
+            positions.append(position)
+        if ledger is not None:
+            ledger.restore(positions)
+
+        cutoff = pd.Timestamp.now(tz="UTC") - max_age
+        restored = 0
+        checkpointed = {}
+        for symbol, period, *values in rsi_rows:
+            if owns is not None and not owns(symbol):
+                continue
+            state = dict(zip(_RSI_COLUMNS, values))
+            if state["last_timestamp"] is None or pd.Timestamp(state["last_timestamp"], tz="UTC") < cutoff:
+                continue
+            state["undo"] = None if state["undo"] is None else json.loads(state["undo"])
+            rsi_state = WilderRSI.load(period, state)
+            set_rsi_state(symbol, period, rsi_state)
+            checkpointed[(symbol, period)] = _rsi_row(symbol, period, rsi_state.dump())
+            restored += 1
+        with self._lock:
+            self._rsi.update(checkpointed)
+        return len(positions), restored
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_snapshot = None
+_default_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> StateSnapshot:
+    """Returns the process-wide state snapshot, opening ``config.get_state_file()`` on first use."""
+    global _default_snapshot
+    if _default_snapshot is None:
+        with _default_snapshot_lock:
+            if _default_snapshot is None:
+                _default_snapshot = StateSnapshot()
+    return _default_snapshot
@@ -0,0 +1,233 @@
+import asyncio
+import time
+import pandas as pd
+import pytz
+from datetime import datetime
+from alpaca.data.live import StockDataStream, CryptoDataStream
+from config import get_alpaca_api_key, get_alpaca_secret_key, get_stock_stream_url, get_crypto_stream_url
+from barstore import get_store
+from marketdata import get_latest_prices
+from rsi import update_rsi_multi, get_rsi_state
+from features import get_pipeline, update_features_multi
+from market_calendar import EndOfDayTimer, get_market_calendar
+import metrics
+import rsi_strategy as strategy
+from snapshot import CHECKPOINT_INTERVAL
+
+# How often open positions are re-synced with Alpaca while streaming
+SYNC_INTERVAL = 60.0  # seconds
+
+EASTERN = pytz.timezone("US/Eastern")
+
+
+class _ReconnectHook:
+    """
+    Mixin for the SDK data streams that calls ``on_connect`` after every
+    (re)connect, before the subscription is re-sent.
+    """
+
+    on_connect = None
+
+    async def _start_ws(self) -> None:
+        await super()._start_ws()
+        if self.on_connect is not None:
+            self.on_connect()
+
+
+class _StockStream(_ReconnectHook, StockDataStream):
+    pass
+
+
+class _CryptoStream(_ReconnectHook, CryptoDataStream):
+    pass
+
+
+class StreamingStrategy:
+    """
+    Event-driven runner for the RSI strategy on Alpaca's websocket feeds.
+
+    Minute bars update each symbol's incremental RSI and feature pipeline
+    and trigger a full evaluation of the rules in ``rsi_strategy``; quotes
+    only update the price and trigger an evaluation when they cross an open
+    position's take-profit or stop-loss. Every (re)connect backfills the bars missed while disconnected
+    over REST; bars streamed during the backfill are held and replayed after it.
+
+    Args:
+        stock_symbols (list): Stocks to trade, defaults to ``rsi_strategy.TICKERS``.
+        crypto_symbols (list): Crypto to trade, defaults to ``rsi_strategy.CRYPTO_TICKERS``.
+        stock_url (str): Stock stream URL override, e.g. a ``FakeMarketDataServer``.
+        crypto_url (str): Crypto stream URL override.
+    """
+
+    def __init__(self, stock_symbols=None, crypto_symbols=None, stock_url: str = None, crypto_url: str = None):
+        self.symbols = {
+            "stock": list(strategy.TICKERS if stock_symbols is None else stock_symbols),
+            "crypto": list(strategy.CRYPTO_TICKERS if crypto_symbols is None else crypto_symbols),
+        }
+        self.periods = {"stock": strategy.RSI_LENGTH, "crypto": strategy.CRYPTO_RSI_LENGTH}
+        self.prices = {}
+        self._pending = {"stock": None, "crypto": None}
+        self._lock = asyncio.Lock()
+        self._eod_timer = None
+
+        key, secret = get_alpaca_api_key(), get_alpaca_secret_key()
+        self.streams = {
+            "stock": _StockStream(key, secret, url_override=stock_url or get_stock_stream_url()),
+            "crypto": _CryptoStream(key, secret, url_override=crypto_url or get_crypto_stream_url()),
+        }
+        for kind, stream in self.streams.items():
+            stream.on_connect = lambda kind=kind: self._start_backfill(kind)
+
+    def _subscribe(self):
+        for kind, stream in self.streams.items():
+            symbols = self.symbols[kind]
+            if not symbols:
+                continue
+
+            async def on_bar(bar, kind=kind):
+                await self._on_bar(kind, bar)
+
+            async def on_quote(quote, kind=kind):
+                await self._on_quote(kind, quote)
+
+            stream.subscribe_bars(on_bar, *symbols)
+            stream.subscribe_updated_bars(on_bar, *symbols)
+            stream.subscribe_quotes(on_quote, *symbols)
+
+    def _start_backfill(self, kind: str):
+        # Hold bars from here on so they are applied after the backfilled ones
+        if self._pending[kind] is None:
+            self._pending[kind] = []
+            asyncio.get_running_loop().create_task(self._backfill(kind))
+
+    async def _backfill(self, kind: str):
+        symbols = self.symbols[kind]
+        try:
+            await asyncio.to_thread(update_rsi_multi, symbols, self.periods[kind])
+            await asyncio.to_thread(update_features_multi, symbols)
+            self.prices.update(await asyncio.to_thread(get_latest_prices, symbols))
+        except Exception as e:
+            print(f"[STREAM][ERROR] Backfill failed for {kind}: {e}")
+        finally:
+            pending, self._pending[kind] = self._pending[kind], None
+            for bar, received_at in pending:
+                await self._apply_bar(kind, bar, received_at)
+
+    async def _on_bar(self, kind: str, bar):
+        received_at = time.time_ns()
+        if self._pending[kind] is not None:
+            self._pending[kind].append((bar, received_at))
+            return
+        await self._apply_bar(kind, bar, received_at)
+
+    async def _apply_bar(self, kind: str, bar, received_at: int):
+        timestamp = pd.Timestamp(bar.timestamp)
+        get_store().write(bar.symbol, pd.DataFrame(
+            {"open": [bar.open], "high": [bar.high], "low": [bar.low], "close": [bar.close],
+             "volume": [bar.volume], "trade_count": [bar.trade_count], "vwap": [bar.vwap]},
+            index=pd.DatetimeIndex([timestamp]),
+        ))
+        get_pipeline().update(bar.symbol, timestamp, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        state = get_rsi_state(bar.symbol, self.periods[kind])
+        if state is None:
+            return
+        state.update(bar.close, timestamp)
+        self.prices.setdefault(bar.symbol, bar.close)
+        await self._evaluate(kind, bar.symbol, timestamp, received_at)
+
+    async def _on_quote(self, kind: str, quote):
+        received_at = time.time_ns()
+        self.prices[quote.symbol] = quote.bid_price
+        if self._exit_triggered(kind, quote.symbol, quote.bid_price):
+            # Quote-driven exits have no triggering bar, so their traces start at receipt
+            await self._evaluate(kind, quote.symbol, None, received_at)
+
+    def _exit_triggered(self, kind: str, symbol: str, price: float) -> bool:
+        position = strategy.ledger.get(symbol)
+        if position is None or position.pending is not None or not position.avg_entry_price or not price:
+            return False
+        # Take profit and stop loss are already working at the broker
+        if position.exit_orders:
+            return False
+        change_pct = (price - position.avg_entry_price) / position.avg_entry_price * 100
+        if kind == "stock":
+            take_profit_pct, stop_loss_pct = strategy.TAKE_PROFIT_PCT, strategy.STOP_LOSS_PCT
+        else:
+            _, stop_loss_pct, take_profit_pct = strategy.get_crypto_rules(datetime.now(EASTERN))
+        return change_pct >= take_profit_pct or change_pct <= -stop_loss_pct
+
+    async def _evaluate(self, kind: str, symbol: str, bar_time=None, received_at: int = None):
+        state = get_rsi_state(symbol, self.periods[kind])
+        if state is None or not state.ready:
+            return
+        now_eastern = datetime.now(EASTERN)
+        features = strategy.feature_values(get_pipeline().get(symbol))
+        # Order calls block, so they run off the event loop, one evaluation at a time
+        async with self._lock:
+            try:
+                if kind == "stock":
+                    if strategy.is_market_open():
+                        await asyncio.to_thread(strategy.evaluate_stock, symbol, state.rsi_now, state.rsi_prev,
+                                                self.prices.get(symbol), now_eastern, bar_time, received_at, features)
+                else:
+                    entries, stop_loss_pct, take_profit_pct = strategy.get_crypto_rules(now_eastern)
+                    if entries or strategy.ledger.get(symbol) is not None:
+                        await asyncio.to_thread(strategy.evaluate_crypto, symbol, state.rsi_now, state.rsi_prev,
+                                                self.prices.get(symbol), now_eastern, stop_loss_pct, take_profit_pct,
+                                                bar_time, received_at, entries, features)
+            except Exception as e:
+                print(f"[STREAM][ERROR] Failed for {symbol}: {e}")
+
+    async def _sync_positions_forever(self):
+        while True:
+            async with self._lock:
+                try:
+                    await asyncio.to_thread(strategy.sync_positions)
+                except Exception as e:
+                    print(f"[STREAM][ERROR] Position sync failed: {e}")
+            await asyncio.sleep(SYNC_INTERVAL)
+
+    async def _checkpoint_forever(self, state):
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            # Backfills update RSI states off the loop; wait for a quiet moment
+            if any(pending is not None for pending in self._pending.values()):
+                continue
+            try:
+                state.checkpoint(strategy.ledger, 0)
+            except Exception as e:
+                print(f"[STREAM][ERROR] State checkpoint failed: {e}")
+
+    async def run_async(self):
+        """
+        Runs both streams, the periodic position sync and state checkpoints until stopped.
+
+        Stock positions are flattened before each close by an ``EndOfDayTimer``,
+        as in ``rsi_strategy.main``.
+        """
+        state = strategy.restore_state()
+        if self.symbols["stock"]:
+            self._eod_timer = self._eod_timer or EndOfDayTimer(get_market_calendar(), strategy.close_all_positions).start()
+        self._subscribe()
+        tasks = [asyncio.create_task(self._sync_positions_forever()),
+                 asyncio.create_task(self._checkpoint_forever(state))]
+        try:
+            await asyncio.gather(*(stream._run_forever() for kind, stream in self.streams.items() if self.symbols[kind]))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stop(self):
+        """Stops both streams."""
+        for stream in self.streams.values():
+            await stream.stop_ws()
+
+    def run(self):
+        """Blocking entry point."""
+        asyncio.run(self.run_async())
+
+
+if __name__ == "__main__":
+    print("Starting RSI Trading Bot (streaming)...")
+    metrics.start_from_config()
+    StreamingStrategy().run()
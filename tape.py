@@ -0,0 +1,370 @@
+import argparse
+import numpy as np
+import pandas as pd
+from features import session_days
+from show_trades import read_trades
+
+# Bars built from trades, in the column order of the bar store
+BAR_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("trade_count", "<i8"),
+    ("vwap", "<f8"),
+])
+# Per-bar running sums while a bar is open
+_ACC_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("notional", "<f8"),
+    ("trade_count", "<i8"),
+])
+
+# Rows processed at a time when aggregating a write_trades directory
+READ_BATCH = 100_000
+
+
+class BarAggregator:
+    """
+    Builds bars from trade batches, vectorized per batch.
+
+    Every trade is assigned a bar id by ``_bar_ids``; ids never decrease.
+    Each batch is reduced per id with ``numpy.ufunc.reduceat``, and only the
+    last, still open bar is carried to the next batch, so memory is O(1)
+    however long the tape. Every print counts, whatever its conditions.
+
+    Batches are ``show_trades.TRADE_DTYPE`` arrays as ``iter_trades`` yields
+    them, or slices of ``read_trades`` columns, in timestamp order.
+    """
+
+    def __init__(self):
+        self._open = None
+
+    def _bar_ids(self, timestamps: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _bar_timestamps(self, bar_ids: np.ndarray, first_timestamps: np.ndarray) -> np.ndarray:
+        """Bar timestamps: their first trade's, unless a subclass aligns them."""
+        return first_timestamps
+
+    def _complete(self, bar) -> bool:
+        """Whether the last bar of a batch is already complete, before a later trade arrives."""
+        return False
+
+    def update(self, batch) -> np.ndarray:
+        """
+        Adds a batch of trades.
+
+        Returns:
+            numpy.ndarray: ``BAR_DTYPE`` bars completed by the batch, oldest first.
+        """
+        timestamps = np.asarray(batch["timestamp"])
+        if not len(timestamps):
+            return np.empty(0, BAR_DTYPE)
+        prices = np.asarray(batch["price"], dtype=np.float64)
+        sizes = np.asarray(batch["size"], dtype=np.float64)
+        ids = self._bar_ids(timestamps, sizes)
+
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)] - 1
+        acc = np.empty(len(starts), _ACC_DTYPE)
+        acc["id"] = ids[starts]
+        acc["timestamp"] = self._bar_timestamps(ids[starts], timestamps[starts])
+        acc["open"] = prices[starts]
+        acc["high"] = np.maximum.reduceat(prices, starts)
+        acc["low"] = np.minimum.reduceat(prices, starts)
+        acc["close"] = prices[ends]
+        acc["volume"] = np.add.reduceat(sizes, starts)
+        acc["notional"] = np.add.reduceat(prices * sizes, starts)
+        acc["trade_count"] = ends - starts + 1
+
+        if self._open is not None:
+            carried = self._open
+            if carried["id"] == acc["id"][0]:
+                first = acc[0]
+                first["timestamp"], first["open"] = carried["timestamp"], carried["open"]
+                first["high"] = max(first["high"], carried["high"])
+                first["low"] = min(first["low"], carried["low"])
+                first["volume"] += carried["volume"]
+                first["notional"] += carried["notional"]
+                first["trade_count"] += carried["trade_count"]
+            else:
+                acc = np.concatenate([carried.reshape(1), acc])
+
+        if self._complete(acc[-1]):
+            self._open = None
+            return _finish(acc)
+        self._open = acc[-1].copy()
+        return _finish(acc[:-1])
+
+    def flush(self) -> np.ndarray:
+        """Closes the open bar, e.g. at the end of a tape. Returns it as a one-bar array, or an empty one."""
+        if self._open is None:
+            return np.empty(0, BAR_DTYPE)
+        bar, self._open = self._open.reshape(1), None
+        return _finish(bar)
+
+    def open_bar(self):
+        """
+        Returns:
+            numpy.void | None: The bar still being built, as a ``BAR_DTYPE`` record, or None.
+        """
+        return None if self._open is None else _finish(self._open.reshape(1))[0]
+
+
+def _finish(acc: np.ndarray) -> np.ndarray:
+    bars = np.empty(len(acc), BAR_DTYPE)
+    for name in ("timestamp", "open", "high", "low", "close", "volume", "trade_count"):
+        bars[name] = acc[name]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bars["vwap"] = np.where(acc["volume"] > 0, acc["notional"] / acc["volume"], acc["close"])
+    return bars
+
+
+class TimeBars(BarAggregator):
+    """
+    Time bars of any interval, e.g. "1min" like Alpaca's minute bars or "5s".
+
+    Buckets are aligned to the epoch in UTC and stamped with their start, as
+    Alpaca stamps its bars. A bar closes when a trade of a later bucket
+    arrives, or through ``advance`` once the clock has passed its end.
+
+    Args:
+        interval (str | timedelta): Bar length, anything ``pandas.Timedelta`` accepts.
+    """
+
+    def __init__(self, interval="1min"):
+        super().__init__()
+        self.interval = pd.Timedelta(interval).value
+        if self.interval <= 0:
+            raise ValueError(f"Bar interval must be positive, got {interval}")
+
+    def _bar_ids(self, timestamps, sizes):
+        return timestamps // self.interval
+
+    def _bar_timestamps(self, bar_ids, first_timestamps):
+        return bar_ids * self.interval
+
+    def advance(self, now_ns: int) -> np.ndarray:
+        """Closes the open bar if its interval ended before now_ns, for quiet symbols. Returns it, or an empty array."""
+        if self._open is not None and now_ns >= (self._open["id"] + 1) * self.interval:
+            return self.flush()
+        return np.empty(0, BAR_DTYPE)
+
+
+class VolumeBars(BarAggregator):
+    """
+    Bars of roughly equal traded volume.
+
+    A trade joins the bar in which the cumulative volume before it falls, so
+    trades are never split and a bar closes as soon as the trade that
+    reaches its volume arrives. Bars are stamped with their first trade.
+
+    Args:
+        volume (float): Shares per bar.
+    """
+
+    def __init__(self, volume: float):
+        super().__init__()
+        if volume <= 0:
+            raise ValueError(f"Bar volume must be positive, got {volume}")
+        self.volume = float(volume)
+        self._total = 0.0
+
+    def _bar_ids(self, timestamps, sizes):
+        after = self._total + np.cumsum(sizes)
+        self._total = float(after[-1])
+        return ((after - sizes) // self.volume).astype(np.int64)
+
+    def _complete(self, bar):
+        return self._total >= (bar["id"] + 1) * self.volume
+
+
+class RunningVWAP:
+    """
+    Volume-weighted average trade price over the day so far, with days and
+    counted trades as ``features.VWAP`` has them (see ``session_days``).
+
+    Args:
+        session (bool): Whether to use the regular stock session; False for crypto.
+    Attributes:
+        value (float | None): VWAP as of the last trade added, None before the day's first counted trade.
+    """
+
+    def __init__(self, session: bool = True):
+        self.session = session
+        self.value = None
+        self._day = None
+        self._pv = 0.0
+        self._volume = 0.0
+
+    def update(self, batch) -> np.ndarray:
+        """
+        Adds a batch of trades.
+
+        Returns:
+            numpy.ndarray: The running VWAP after each trade, NaN before the day's first counted trade.
+        """
+        timestamps = np.asarray(batch["timestamp"])
+        if not len(timestamps):
+            return np.empty(0)
+        days, counts = session_days(timestamps, self.session)
+        prices = np.asarray(batch["price"], dtype=np.float64)
+        sizes = np.where(counts, np.asarray(batch["size"], dtype=np.float64), 0.0)
+        resets = np.r_[days[0] != self._day, days[1:] != days[:-1]]
+
+        # Cumulative sums restarted at every reset, the first segment continuing the carried day
+        positions = np.arange(len(days))
+        last_reset = np.maximum.accumulate(np.where(resets, positions, 0))
+        continuing = (last_reset == 0) & ~resets[0]
+        pv = np.cumsum(prices * sizes)
+        volume = np.cumsum(sizes)
+        pv = pv - np.r_[0.0, pv][last_reset] + np.where(continuing, self._pv, 0.0)
+        volume = volume - np.r_[0.0, volume][last_reset] + np.where(continuing, self._volume, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vwap = np.where(volume > 0, pv / volume, np.nan)
+
+        self._day, self._pv, self._volume = int(days[-1]), float(pv[-1]), float(volume[-1])
+        self.value = None if np.isnan(vwap[-1]) else float(vwap[-1])
+        return vwap
+
+
+class VolumeProfile:
+    """
+    Traded volume at each price level, prices rounded to ``tick``.
+
+    Memory grows with the number of distinct levels traded, not with trades.
+
+    Args:
+        tick (float): Price level width.
+    """
+
+    def __init__(self, tick: float = 0.01):
+        if tick <= 0:
+            raise ValueError(f"Tick must be positive, got {tick}")
+        self.tick = tick
+        self._volume = {}
+
+    def update(self, batch):
+        """Adds a batch of trades."""
+        prices = np.asarray(batch["price"], dtype=np.float64)
+        if not len(prices):
+            return
+        levels, inverse = np.unique(np.rint(prices / self.tick).astype(np.int64), return_inverse=True)
+        volumes = np.bincount(inverse, weights=np.asarray(batch["size"], dtype=np.float64))
+        for level, volume in zip(levels.tolist(), volumes.tolist()):
+            self._volume[level] = self._volume.get(level, 0.0) + volume
+
+    def levels(self) -> tuple:
+        """
+        Returns:
+            tuple: (prices, volumes) arrays, lowest price first.
+        """
+        levels = np.array(sorted(self._volume), dtype=np.int64)
+        return levels * self.tick, np.array([self._volume[level] for level in levels.tolist()])
+
+    def point_of_control(self):
+        """
+        Returns:
+            float | None: The price with the most volume.
+        """
+        if not self._volume:
+            return None
+        return max(self._volume, key=self._volume.get) * self.tick
+
+    def value_area(self, fraction: float = 0.7) -> tuple:
+        """
+        The price range around the point of control holding fraction of the volume.
+
+        Grows from the point of control one level at a time towards the
+        neighbour with more volume, the usual market-profile rule.
+
+        Returns:
+            tuple: (low, high) prices, or (None, None) when empty.
+        """
+        prices, volumes = self.levels()
+        if not len(prices):
+            return None, None
+        lo = hi = int(np.argmax(volumes))
+        covered, target = volumes[lo], fraction * volumes.sum()
+        while covered < target:
+            below = volumes[lo - 1] if lo > 0 else -1.0
+            above = volumes[hi + 1] if hi < len(volumes) - 1 else -1.0
+            if above >= below:
+                hi += 1
+                covered += above
+            else:
+                lo -= 1
+                covered += below
+        return float(prices[lo]), float(prices[hi])
+
+
+def aggregate(batches, aggregator: BarAggregator):
+    """
+    Streams bars out of trade batches, e.g. ``aggregate(iter_trades(...), TimeBars("10s"))``.
+
+    Yields:
+        numpy.ndarray: ``BAR_DTYPE`` bars as they complete, the open one last.
+    """
+    for batch in batches:
+        bars = aggregator.update(batch)
+        if len(bars):
+            yield bars
+    bars = aggregator.flush()
+    if len(bars):
+        yield bars
+
+
+def column_batches(columns: dict, size: int = READ_BATCH):
+    """Slices ``read_trades`` columns into batches, so a stored tape is aggregated in bounded memory."""
+    n = len(columns["timestamp"])
+    for start in range(0, n, size):
+        yield {name: column[start:start + size] for name, column in columns.items()}
+
+
+def bars_frame(bars: np.ndarray) -> pd.DataFrame:
+    """
+    Bars as a DataFrame indexed by UTC timestamp, shaped like ``BarStore.read``,
+    for ``FeaturePipeline.update_bars`` or ``WilderRSI.seed``.
+    """
+    index = pd.to_datetime(bars["timestamp"], unit="ns", utc=True)
+    return pd.DataFrame({name: bars[name] for name in BAR_DTYPE.names[1:]},
+                        index=pd.DatetimeIndex(index, name="timestamp"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bars, VWAP and volume profile from a write_trades directory")
+    parser.add_argument("path", help="Directory written by show_trades.write_trades")
+    parser.add_argument("--interval", default="1min", help="Time bar interval, e.g. 1min or 5s")
+    parser.add_argument("--volume", type=float, default=None, help="Build volume bars of this many shares instead")
+    parser.add_argument("--tick", type=float, default=0.01, help="Volume profile price level width")
+    args = parser.parse_args()
+
+    aggregator = VolumeBars(args.volume) if args.volume else TimeBars(args.interval)
+    vwap, profile = RunningVWAP(), VolumeProfile(args.tick)
+    frames = []
+    for batch in column_batches(read_trades(args.path)):
+        vwap.update(batch)
+        profile.update(batch)
+        bars = aggregator.update(batch)
+        if len(bars):
+            frames.append(bars)
+    frames.append(aggregator.flush())
+    bars = bars_frame(np.concatenate(frames))
+
+    print(bars.tail(20).to_string())
+    low, high = profile.value_area()
+    print(f"{len(bars)} bars, VWAP {vwap.value}, point of control {profile.point_of_control()}, "
+          f"value area {low}-{high}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from alpaca.trading.enums import TradeEvent
+from config import get_trace_file
+
+# Points recorded for each signal, in the order they happen
+POINTS = ("bar_close", "data_receipt", "decision", "sizing_done", "submit_sent", "ack_received", "fill_received")
+
+# Traces kept waiting for their fill; the oldest are dropped past this
+MAX_OPEN_TRACES = 1000
+
+_file = None
+_file_lock = threading.Lock()
+_open_traces = OrderedDict()
+
+
+def _write(record: dict):
+    global _file
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with _file_lock:
+        if _file is None:
+            path = get_trace_file()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _file = open(path, "a", buffering=1)
+        _file.write(line)
+
+
+def _ns(ts) -> int:
+    """Epoch nanoseconds from a datetime/Timestamp, or None."""
+    return None if ts is None else int(pd.Timestamp(ts).value)
+
+
+class Trace:
+    """
+    One signal's path from the bar that triggered it to the order's fill.
+
+    Its ``trace_id`` is sent as the order's ``client_order_id``, so the fill
+    arriving on the trade-updates stream can be matched back to it.
+    """
+
+    __slots__ = ("trace_id", "symbol", "side")
+
+    def __init__(self, trace_id: str, symbol: str, side: str):
+        self.trace_id = trace_id
+        self.symbol = symbol
+        self.side = side
+
+    def mark(self, point: str, ts_ns: int = None):
+        """Appends one timestamped point (epoch ns, now by default) to the trace file."""
+        _write({"trace_id": self.trace_id, "symbol": self.symbol, "side": self.side,
+                "point": point, "ts": ts_ns if ts_ns is not None else time.time_ns()})
+
+
+def start_trace(symbol: str, side: str, bar_time=None, received_at=None) -> Trace:
+    """
+    Opens a trace for a decision that is about to send an order.
+
+    Records ``bar_close``, ``data_receipt`` and ``decision`` (now).
+
+    Args:
+        symbol (str): The symbol traded.
+        side (str): "buy" or "sell".
+        bar_time (datetime): Start time of the minute bar that triggered the signal.
+        received_at (int): Epoch ns when that bar was received.
+    Returns:
+        Trace: Pass it to the order function as ``trace``.
+    """
+    trace = Trace(uuid.uuid4().hex, symbol, side)
+    if bar_time is not None:
+        trace.mark("bar_close", _ns(bar_time) + 60_000_000_000)
+    if received_at is not None:
+        trace.mark("data_receipt", received_at)
+    trace.mark("decision")
+    with _file_lock:
+        _open_traces[trace.trace_id] = trace
+        while len(_open_traces) > MAX_OPEN_TRACES:
+            _open_traces.popitem(last=False)
+    return trace
+
+
+def record_fill(update):
+    """
+    Closes the trace of a filled order, if it has one. Call with every trade update.
+
+    Args:
+        update (TradeUpdate): The trade update.
+    """
+    if update.event != TradeEvent.FILL or update.order.client_order_id is None:
+        return
+    with _file_lock:
+        trace = _open_traces.pop(str(update.order.client_order_id), None)
+    if trace is not None:
+        trace.mark("fill_received")
+
+
+def load(path: str = None) -> pd.DataFrame:
+    """
+    Reads a trace file into one row per trace and one column per point (epoch ns).
+    """
+    records = []
+    with open(path or get_trace_file()) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    if not records:
+        return pd.DataFrame(columns=["trace_id", "symbol", "side", *POINTS])
+    frame = pd.DataFrame.from_records(records)
+    traces = frame.pivot_table(index=["trace_id", "symbol", "side"], columns="point", values="ts", aggfunc="first")
+    return traces.reindex(columns=list(POINTS)).reset_index()
+
+
+def report(path: str = None) -> pd.DataFrame:
+    """
+    Latency between consecutive points and end to end, in milliseconds.
+
+    Returns:
+        pandas.DataFrame: count, p50, p90, p99 and max per stage.
+    """
+    traces = load(path)
+    stages = {f"{a} -> {b}": (a, b) for a, b in zip(POINTS, POINTS[1:])}
+    stages["bar_close -> ack_received"] = ("bar_close", "ack_received")
+    stages["bar_close -> fill_received"] = ("bar_close", "fill_received")
+    rows = {}
+    for name, (a, b) in stages.items():
+        delta = ((traces[b] - traces[a]) / 1e6).dropna().to_numpy(dtype=np.float64)
+        if len(delta) == 0:
+            rows[name] = {"count": 0, "p50_ms": np.nan, "p90_ms": np.nan, "p99_ms": np.nan, "max_ms": np.nan}
+            continue
+        rows[name] = {
+            "count": len(delta),
+            "p50_ms": np.percentile(delta, 50),
+            "p90_ms": np.percentile(delta, 90),
+            "p99_ms": np.percentile(delta, 99),
+            "max_ms": delta.max(),
+        }
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tick-to-trade trace tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="Print the latency breakdown of recorded traces")
+    report_parser.add_argument("--file", default=None, help="Trace file (default: config.get_trace_file())")
+    args = parser.parse_args()
+
+    print(report(args.file).to_string(float_format=lambda v: f"{v:.1f}"))
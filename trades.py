@@ -1,12 +1,36 @@
-from alpaca.trading.client import TradingClient
-from config import get_alpaca_api_key, get_alpaca_secret_key
+from clients import get_trading_client
 from alpaca.trading.requests import MarketOrderRequest
-from alpaca.trading.requests import LimitOrderRequest
-from alpaca.trading.enums import OrderSide, OrderType, TimeInForce
-from percentage import getPortfolio_value, getEstimate_value, getCash_value
+from alpaca.trading.requests import LimitOrderRequest, TakeProfitRequest, StopLossRequest
+from alpaca.trading.enums import OrderClass, OrderSide, OrderType, TimeInForce
+from alpaca.common.exceptions import APIError
+from percentage import getEstimate_value, getCash_value, get_account, invalidate_account
 from datetime import datetime
 from show_trades import show_trades
 from marketdata import get_latest_price
+from metrics import timed
+from order_manager import get_order_manager, TERMINAL_STATUSES
+import time
+
+
+def _submit_order(order_data, trace=None):
+    """
+    Submits an order, starts tracking it in the order manager and drops the
+    cached account snapshot, since the order changes buying power and, once
+    filled, cash.
+
+    With a trace, the order is sent with the trace id as its client order id
+    and the trace records when it was sent and acknowledged.
+    """
+    if trace is not None:
+        order_data.client_order_id = trace.trace_id
+        trace.mark("submit_sent")
+    with timed("order_submit"):
+        order = get_trading_client().submit_order(order_data)
+    if trace is not None:
+        trace.mark("ack_received")
+    get_order_manager().track(order)
+    invalidate_account()
+    return order
 
 
 def market_buy(symbol:str, qty:int=100):
@@ -17,7 +41,6 @@ def market_buy(symbol:str, qty:int=100):
     Returns:
     None
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
     market_order_data = MarketOrderRequest(
         symbol=symbol,
         qty=qty,
@@ -25,7 +48,7 @@ def market_buy(symbol:str, qty:int=100):
         time_in_force=TimeInForce.DAY
     )
 
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data)
     
     return market_order
 
@@ -40,7 +63,6 @@ def limit_buy(symbol:str, limit_price:float, qty:int=100):
     Returns:
     None
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
     limit_order_data = LimitOrderRequest(
         symbol=symbol,
         qty=qty,
@@ -51,54 +73,74 @@ def limit_buy(symbol:str, limit_price:float, qty:int=100):
     )
 
 
-    limit_order = trading_client.submit_order(limit_order_data)
+    limit_order = _submit_order(limit_order_data)
     print(f"Market order submitted: {limit_order}")
 
 
-def percent_market_buy(symbol:str, percentage:float):
+def percent_market_buy(symbol:str, percentage:float, price:float=None, account=None, trace=None,
+                       take_profit_pct:float=None, stop_loss_pct:float=None):
     """
     Submits a market order to buy a percentage of the portfolio value in a stock.
     Args:
     stock_symbol: str - The stock symbol to trade.
     percentage: float - The percentage of the portfolio value to use for the trade.
+    price: float - Price to size with; fetched when not given.
+    account: TradeAccount - Account snapshot to size with; the cached one when not given.
+    trace: tracing.Trace - Tick-to-trade trace of the signal behind this order.
+    take_profit_pct: float - With stop_loss_pct, makes this a GTC bracket order whose
+        take-profit and stop-loss legs sit at these percentages around price.
+    stop_loss_pct: float - See take_profit_pct.
     Returns:
     None
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    portfolio_value = getPortfolio_value()
-    estimate_value = getEstimate_value(percentage)
-    if(estimate_value > getCash_value()):
+    account = account or get_account()
+    estimate_value = getEstimate_value(percentage, account)
+    if(estimate_value > getCash_value(account)):
         print("Not enough cash to perform this trade.")
         return
-    lastPrice = get_latest_price(symbol)
+    lastPrice = price or get_latest_price(symbol)
     qty = int(estimate_value / lastPrice)
+    if trace is not None:
+        trace.mark("sizing_done")
     
-    market_order_data = MarketOrderRequest(
-        symbol=symbol,
-        qty=qty,
-        side=OrderSide.BUY,
-        time_in_force=TimeInForce.DAY
-    )
+    if take_profit_pct is not None and stop_loss_pct is not None:
+        take_profit_price, stop_price = exit_prices(lastPrice, take_profit_pct, stop_loss_pct)
+        market_order_data = MarketOrderRequest(
+            symbol=symbol,
+            qty=qty,
+            side=OrderSide.BUY,
+            time_in_force=TimeInForce.GTC,  # the exit legs outlive the session
+            order_class=OrderClass.BRACKET,
+            take_profit=TakeProfitRequest(limit_price=take_profit_price),
+            stop_loss=StopLossRequest(stop_price=stop_price)
+        )
+    else:
+        market_order_data = MarketOrderRequest(
+            symbol=symbol,
+            qty=qty,
+            side=OrderSide.BUY,
+            time_in_force=TimeInForce.DAY
+        )
 
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data, trace)
     
     return market_order
 
 
-def percent_limit_buy(symbol:str, limit_price:float, percentage:float):
+def percent_limit_buy(symbol:str, limit_price:float, percentage:float, account=None):
     """
     Submits a limit order to buy a percentage of the portfolio value in a stock at a specified limit price.
     Args:       
     stock_symbol: str - The stock symbol to trade.
     limit_price: float - The price at which to buy the stock.
     percentage: float - The percentage of the portfolio value to use for the trade.
+    account: TradeAccount - Account snapshot to size with; the cached one when not given.
     Returns:
     None
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    portfolio_value = getPortfolio_value()
-    estimate_value = getEstimate_value(percentage)
-    if(estimate_value > getCash_value()):
+    account = account or get_account()
+    estimate_value = getEstimate_value(percentage, account)
+    if(estimate_value > getCash_value(account)):
         print("Not enough cash to perform this trade.")
         return
     qty = int(estimate_value / limit_price)
@@ -112,18 +154,18 @@ def percent_limit_buy(symbol:str, limit_price:float, percentage:float):
         limit_price=limit_price
     )
 
-    limit_order = trading_client.submit_order(limit_order_data)
+    limit_order = _submit_order(limit_order_data)
     
     return(f"Limit order submitted: {limit_order}")
 
-def market_sell(symbol: str, qty: int = None):
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-
+def market_sell(symbol: str, qty: int = None, trace=None):
     if qty is None:
         qty = get_position_qty(symbol)
         if qty == 0:
             print(f"[INFO] No shares to sell for {symbol}")
             return None
+    if trace is not None:
+        trace.mark("sizing_done")
 
     market_order_data = MarketOrderRequest(
         symbol=symbol,
@@ -132,7 +174,7 @@ def market_sell(symbol: str, qty: int = None):
         time_in_force=TimeInForce.DAY
     )
 
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data, trace)
     print(f"Market order submitted: {market_order}")
     return market_order
 
@@ -146,7 +188,6 @@ def limit_sell(symbol:str, limit_price:float, qty:int=100):
     Returns:
     None
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
     limit_order_data = LimitOrderRequest(
         symbol=symbol,
         qty=qty,
@@ -156,24 +197,24 @@ def limit_sell(symbol:str, limit_price:float, qty:int=100):
         limit_price=limit_price  # Example limit price, adjust as needed
     )
 
-    limit_order = trading_client.submit_order(limit_order_data)
+    limit_order = _submit_order(limit_order_data)
     
     print(f"Limit order submitted: {limit_order}")
 
-def percent_market_sell(symbol:str, percentage:float):
+def percent_market_sell(symbol:str, percentage:float, price:float=None, account=None):
     """
     Submits a market order to sell a percentage of the portfolio value in a stock.
     Args:
     stock_symbol: str - The stock symbol to trade.
     percentage: float - The percentage of the portfolio value to use for the trade.
+    price: float - Price to size with; fetched when not given.
+    account: TradeAccount - Account snapshot to size with; the cached one when not given.
     Returns:
     None
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    portfolio_value = getPortfolio_value()
-    estimate_value = getEstimate_value(percentage)
+    estimate_value = getEstimate_value(percentage, account)
     
-    lastPrice = get_latest_price(symbol)
+    lastPrice = price or get_latest_price(symbol)
     qty = int(estimate_value / lastPrice)
     
     market_order_data = MarketOrderRequest(
@@ -183,24 +224,23 @@ def percent_market_sell(symbol:str, percentage:float):
         time_in_force=TimeInForce.DAY
     )
 
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data)
     
     return market_order
 
 
-def percent_limit_sell(symbol:str, limit_price:float, percentage:float):
+def percent_limit_sell(symbol:str, limit_price:float, percentage:float, account=None):
     """
     Submits a limit order to sell a percentage of the portfolio value in a stock at a specified limit price.
     Args:  
     stock_symbol: str - The stock symbol to trade.
     limit_price: float - The price at which to sell the stock.
     percentage: float - The percentage of the portfolio value to use for the trade.
+    account: TradeAccount - Account snapshot to size with; the cached one when not given.
     Returns:
     None       
     """                             
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    portfolio_value = getPortfolio_value()
-    estimate_value = getEstimate_value(percentage)
+    estimate_value = getEstimate_value(percentage, account)
     
     qty = int(estimate_value / limit_price)
     
@@ -213,15 +253,120 @@ def percent_limit_sell(symbol:str, limit_price:float, percentage:float):
         limit_price=limit_price
     )
 
-    limit_order = trading_client.submit_order(limit_order_data)
+    limit_order = _submit_order(limit_order_data)
     
     return(f"Limit order submitted: {limit_order}")
 
+def _round_price(price: float) -> float:
+    """Alpaca takes two decimals from $1 up and four below."""
+    return round(price, 2) if price >= 1 else round(price, 4)
+
+
+def exit_prices(price: float, take_profit_pct: float, stop_loss_pct: float):
+    """
+    Take-profit limit and stop-loss stop prices around an entry price.
+    Args:
+        price: float - The entry price.
+        take_profit_pct: float - Gain in percent at which to take profit.
+        stop_loss_pct: float - Loss in percent at which to stop out.
+    Returns:
+        tuple: (take_profit_price, stop_price)
+    """
+    return _round_price(price * (1 + take_profit_pct / 100)), _round_price(price * (1 - stop_loss_pct / 100))
+
+
+def exit_order_ids(order) -> tuple:
+    """
+    Ids of the take-profit and stop-loss orders working for a bracket entry or an OCO exit.
+    """
+    legs = tuple(str(leg.id) for leg in order.legs or ())
+    if order.order_class == OrderClass.OCO:
+        return (str(order.id),) + legs
+    return legs
+
+
+def oco_sell(symbol: str, qty: int, entry_price: float, take_profit_pct: float, stop_loss_pct: float):
+    """
+    Attaches a GTC take-profit/stop-loss OCO pair to a held stock position.
+    Args:
+        symbol: str - The stock symbol.
+        qty: int - Shares to cover.
+        entry_price: float - Price the percentages are measured from.
+        take_profit_pct: float - Gain in percent at which to take profit.
+        stop_loss_pct: float - Loss in percent at which to stop out.
+    Returns:
+        The order object; its exit_order_ids are the two working exits.
+    """
+    take_profit_price, stop_price = exit_prices(entry_price, take_profit_pct, stop_loss_pct)
+    oco_order_data = LimitOrderRequest(
+        symbol=symbol,
+        qty=qty,
+        side=OrderSide.SELL,
+        type=OrderType.LIMIT,
+        time_in_force=TimeInForce.GTC,
+        order_class=OrderClass.OCO,
+        limit_price=take_profit_price,
+        take_profit=TakeProfitRequest(limit_price=take_profit_price),
+        stop_loss=StopLossRequest(stop_price=stop_price)
+    )
+    return _submit_order(oco_order_data)
+
+
+# How long cancel_exit_orders waits for the broker to confirm its cancels
+CANCEL_TIMEOUT = 5.0  # seconds
+CANCEL_POLL_INTERVAL = 0.1  # seconds
+
+
+def cancel_exit_orders(order_ids, timeout: float = CANCEL_TIMEOUT):
+    """
+    Cancels working exit orders and waits until the broker confirms they are done.
+
+    Alpaca cancels asynchronously. Until an order leaves pending_cancel it
+    still holds its shares, and it can still fill. A 422 on the cancel
+    means the order is no longer cancelable, e.g. it filled or went with
+    the other half of its OCO pair, so every order's final status is read
+    back.
+
+    Args:
+        order_ids (tuple): The exit orders.
+        timeout (float): Seconds to wait for the cancels to go through.
+    Returns:
+        float | None: Shares the exit orders filled once all are done, or
+            None when that was not confirmed within timeout. Only 0 means
+            the position's shares are all free to sell.
+    """
+    trading_client = get_trading_client()
+    for order_id in order_ids:
+        try:
+            trading_client.cancel_order_by_id(order_id)
+        except APIError as e:
+            if e.status_code != 422:
+                print(f"[WARN] Could not cancel order {order_id}: {e}")
+
+    deadline = time.monotonic() + timeout
+    working, filled = list(order_ids), 0.0
+    while working:
+        still_working = []
+        for order_id in working:
+            order = trading_client.get_order_by_id(order_id)
+            if order.status in TERMINAL_STATUSES:
+                filled += float(order.filled_qty or 0)
+            else:
+                still_working.append(order_id)
+        working = still_working
+        if working:
+            if time.monotonic() >= deadline:
+                print(f"[WARN] Cancel of exit orders {working} not confirmed after {timeout:g}s")
+                return None
+            time.sleep(CANCEL_POLL_INTERVAL)
+    return filled
+
+
 def get_position_qty(symbol: str) -> int:
     """
     Returns the quantity of shares held for the given symbol.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
+    trading_client = get_trading_client()
     try:
         position = trading_client.get_open_position(symbol)
         return int(float(position.qty))
@@ -238,79 +383,84 @@ def market_buy_crypto(symbol: str, qty: float = 0.01):
     Returns:
         The order object.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
     market_order_data = MarketOrderRequest(
         symbol=symbol,
         qty=qty,
         side=OrderSide.BUY,
         time_in_force=TimeInForce.GTC  # Crypto trades are GTC
     )
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data)
     return market_order
 
-def market_sell_crypto(symbol: str, qty: float = None):
+def market_sell_crypto(symbol: str, qty: float = None, trace=None):
     """
     Submits a market order to sell a quantity of a crypto asset.
     Args:
         symbol: str - The crypto symbol to trade (e.g., 'BTC/USD').
         qty: float - The quantity to sell. If None, sells entire position.
+        trace: tracing.Trace - Tick-to-trade trace of the signal behind this order.
     Returns:
         The order object.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
     if qty is None:
         qty = get_crypto_position_qty(symbol)
         if qty == 0:
             print(f"[INFO] No crypto to sell for {symbol}")
             return None
+    if trace is not None:
+        trace.mark("sizing_done")
     market_order_data = MarketOrderRequest(
         symbol=symbol,
         qty=qty,
         side=OrderSide.SELL,
         time_in_force=TimeInForce.GTC
     )
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data, trace)
     return market_order
 
-def percent_market_buy_crypto(symbol: str, percentage: float):
+def percent_market_buy_crypto(symbol: str, percentage: float, price: float = None, account=None, trace=None):
     """
     Submits a market order to buy a percentage of the portfolio value in a crypto asset.
     Args:
         symbol: str - The crypto symbol to trade (e.g., 'BTC/USD').
         percentage: float - The percentage of the portfolio value to use for the trade.
+        price: float - Price to size with; fetched when not given.
+        account: TradeAccount - Account snapshot to size with; the cached one when not given.
+        trace: tracing.Trace - Tick-to-trade trace of the signal behind this order.
     Returns:
         The order object.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    portfolio_value = getPortfolio_value()
-    estimate_value = getEstimate_value(percentage)
-    if estimate_value > getCash_value():
+    account = account or get_account()
+    estimate_value = getEstimate_value(percentage, account)
+    if estimate_value > getCash_value(account):
         print("Not enough cash to perform this crypto trade.")
         return
-    lastPrice = get_latest_price(symbol)
+    lastPrice = price or get_latest_price(symbol)
     qty = estimate_value / lastPrice
+    if trace is not None:
+        trace.mark("sizing_done")
     market_order_data = MarketOrderRequest(
         symbol=symbol,
         qty=qty,
         side=OrderSide.BUY,
         time_in_force=TimeInForce.GTC
     )
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data, trace)
     return market_order
 
-def percent_market_sell_crypto(symbol: str, percentage: float):
+def percent_market_sell_crypto(symbol: str, percentage: float, price: float = None, account=None):
     """
     Submits a market order to sell a percentage of the portfolio value in a crypto asset.
     Args:
         symbol: str - The crypto symbol to trade (e.g., 'BTC/USD').
         percentage: float - The percentage of the portfolio value to use for the trade.
+        price: float - Price to size with; fetched when not given.
+        account: TradeAccount - Account snapshot to size with; the cached one when not given.
     Returns:
         The order object.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
-    portfolio_value = getPortfolio_value()
-    estimate_value = getEstimate_value(percentage)
-    lastPrice = get_latest_price(symbol)
+    estimate_value = getEstimate_value(percentage, account)
+    lastPrice = price or get_latest_price(symbol)
     qty = estimate_value / lastPrice
     market_order_data = MarketOrderRequest(
         symbol=symbol,
@@ -318,14 +468,14 @@ def percent_market_sell_crypto(symbol: str, percentage: float):
         side=OrderSide.SELL,
         time_in_force=TimeInForce.GTC
     )
-    market_order = trading_client.submit_order(market_order_data)
+    market_order = _submit_order(market_order_data)
     return market_order
 
 def get_crypto_position_qty(symbol: str) -> float:
     """
     Returns the quantity of crypto held for the given symbol.
     """
-    trading_client = TradingClient(get_alpaca_api_key(), get_alpaca_secret_key())
+    trading_client = get_trading_client()
     try:
         position = trading_client.get_open_position(symbol)
         return float(position.qty)